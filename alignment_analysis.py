@@ -15,8 +15,10 @@ import re
 from pathlib import Path
 from datetime import datetime
 
+from text_store import TEXTS_JSONL_NAME, TextStore
+
 DATA_DIR = Path("20401_digital_omnibus")
-EXTRACTED_TEXTS = DATA_DIR / "extracted_texts.json"
+EXTRACTED_TEXTS = DATA_DIR / TEXTS_JSONL_NAME  # extracted_texts.json is read if this is missing
 LLM_ANALYSIS_DIR = DATA_DIR / "llm_analysis"
 OUTPUT_DIR = DATA_DIR / "alignment_analysis"
 OUTPUT_DIR.mkdir(exist_ok=True)
@@ -282,19 +284,15 @@ def main():
     log("=" * 70)
     
     # Load extracted texts
-    log("\nLoading extracted texts...")
-    with open(EXTRACTED_TEXTS, 'r', encoding='utf-8') as f:
-        all_texts = json.load(f)
-    
-    # Create lookup
-    texts_by_id = {str(item['id']): item for item in all_texts}
+    log("\nLoading extracted texts index...")
+    store = TextStore(DATA_DIR)
     
     # Find OpenMined's response
-    if OPENMINED_ID not in texts_by_id:
+    if OPENMINED_ID not in store:
         log(f"ERROR: OpenMined response (ID {OPENMINED_ID}) not found")
         return
     
-    openmined_data = texts_by_id[OPENMINED_ID]
+    openmined_data = store.get(OPENMINED_ID)
     openmined_text = openmined_data.get('text', '')
     log(f"  Found OpenMined response: {len(openmined_text)} chars")
     
@@ -332,10 +330,9 @@ def main():
     
     # Filter responses to analyse (exclude OpenMined, require substantial text)
     to_analyse = [
-        item for item in all_texts 
-        if str(item['id']) != OPENMINED_ID 
-        and len(item.get('text', '')) > 200
-        and str(item['id']) not in analysed_ids
+        fid for fid in store.ids(min_text_length=200)
+        if fid != OPENMINED_ID
+        and fid not in analysed_ids
     ]
     
     log(f"\nResponses to analyse: {len(to_analyse)}")
@@ -348,7 +345,8 @@ def main():
         log("(Progress saved every 5 responses - safe to interrupt)")
         log("")
     
-    for i, item in enumerate(to_analyse, 1):
+    for i, fid in enumerate(to_analyse, 1):
+        item = store.get(fid)
         display_name = get_display_name(item)
         log(f"[{i}/{len(to_analyse)}] {display_name[:50]}...")
         
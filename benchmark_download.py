@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark the downloader against the local mock EC API.
+
+Starts mock_ec_api.py in-process (or uses --base-url for one that is already
+running), runs the same metadata and attachment phases as
+download_omnibus_final.py into a temporary folder, and reports pages/s,
+files/s and MB/s. Use it to check that a change to concurrency, pooling or
+retry logic actually helps before running against the real service.
+
+Usage:
+    python benchmark_download.py --synthetic 2000 --latency 80 --jitter 40
+    python benchmark_download.py --workers 8 --page-workers 8 --rate 0 --repeat 3
+    python benchmark_download.py --burst-every 100 --burst-length 5 --json bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import download_omnibus_final as downloader
+import mock_ec_api
+
+PUBLICATION_ID = "20401"
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the downloader against a mock EC API.")
+    parser.add_argument("--base-url", metavar="URL",
+                        help="Use an already running API instead of starting the mock in-process")
+    mock_ec_api.add_data_arguments(parser)
+    mock_ec_api.add_fault_arguments(parser)
+    parser.add_argument("--workers", type=int, default=downloader.MAX_WORKERS,
+                        help=f"Concurrent attachment downloads (default: {downloader.MAX_WORKERS})")
+    parser.add_argument("--page-workers", type=int, default=downloader.PAGE_WORKERS,
+                        help=f"Concurrent feedback page fetches (default: {downloader.PAGE_WORKERS})")
+    parser.add_argument("--rate", type=float, default=downloader.REQUESTS_PER_SECOND,
+                        help=f"Starting request rate, 0 for unlimited (default: {downloader.REQUESTS_PER_SECOND})")
+    parser.add_argument("--max-rate", type=float, default=downloader.MAX_REQUESTS_PER_SECOND,
+                        help=f"Ceiling for the adaptive rate (default: {downloader.MAX_REQUESTS_PER_SECOND})")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs (default: 1)")
+    parser.add_argument("--verbose", action="store_true", help="Show the downloader's own log output")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to a JSON file")
+    return parser.parse_args()
+
+def run_once(args, api=None):
+    """Run the metadata and attachment phases once into a fresh folder and time them."""
+    downloader.MAX_WORKERS = max(1, args.workers)
+    downloader.PAGE_WORKERS = max(1, args.page_workers)
+    downloader.rate_limiter = downloader.AdaptiveRateLimiter(args.rate, args.max_rate)
+    downloader._session = None
+    before = dict(api.stats) if api else None
+
+    with tempfile.TemporaryDirectory(prefix="omnibus_bench_") as output_root:
+        consultation = downloader.Consultation(PUBLICATION_ID, output_root)
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output, \
+             ThreadPoolExecutor(max_workers=downloader.PAGE_WORKERS) as page_executor, \
+             ThreadPoolExecutor(max_workers=downloader.MAX_WORKERS) as download_executor:
+            start = time.perf_counter()
+            count, _ = downloader.fetch_consultation(consultation, page_executor)
+            metadata_done = time.perf_counter()
+            futures = downloader.submit_attachment_downloads(
+                consultation, downloader.iter_feedbacks(consultation), download_executor
+            )
+            stats, _ = downloader.collect_attachment_downloads(consultation, futures)
+            end = time.perf_counter()
+            consultation.manifest.close()
+
+        file_bytes = sum(f.stat().st_size for f in consultation.attachments_dir.iterdir() if f.is_file())
+
+    if api:
+        pages = api.stats["pages"] - before["pages"]
+        wire_bytes = api.stats["bytes"] - before["bytes"]
+    else:
+        pages = math.ceil(count / downloader.PAGE_SIZE)
+        wire_bytes = file_bytes
+
+    metadata_time = max(metadata_done - start, 1e-9)
+    download_time = max(end - metadata_done, 1e-9)
+    return {
+        "feedbacks": count,
+        "pages": pages,
+        "files": stats["downloaded"],
+        "failed": stats["failed"],
+        "bytes": wire_bytes,
+        "metadata_seconds": round(metadata_time, 3),
+        "download_seconds": round(download_time, 3),
+        "pages_per_second": round(pages / metadata_time, 2),
+        "files_per_second": round(stats["downloaded"] / download_time, 2),
+        "mb_per_second": round(wire_bytes / download_time / 1e6, 2),
+        "final_rate": round(downloader.rate_limiter.rate, 2),
+        "throttled": downloader.rate_limiter.throttled,
+    }
+
+def main():
+    args = parse_args()
+
+    api = server = None
+    if args.base_url:
+        downloader.BASE_URL = args.base_url if args.base_url.endswith("/") else args.base_url + "/"
+    else:
+        api = mock_ec_api.build_api(args)
+        server = mock_ec_api.make_server(api, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        downloader.BASE_URL = mock_ec_api.base_url(server)
+
+    log("=" * 60)
+    log("DOWNLOADER BENCHMARK")
+    log("=" * 60)
+    log(f"  API: {downloader.BASE_URL}")
+    log(f"  Workers: {args.workers} downloads, {args.page_workers} pages; "
+        f"rate {args.rate} req/s (max {args.max_rate})")
+
+    results = []
+    try:
+        for run in range(1, args.repeat + 1):
+            result = run_once(args, api)
+            results.append(result)
+            log(f"Run {run}: {result['pages']} pages in {result['metadata_seconds']}s "
+                f"({result['pages_per_second']} pages/s), "
+                f"{result['files']} files in {result['download_seconds']}s "
+                f"({result['files_per_second']} files/s, {result['mb_per_second']} MB/s), "
+                f"{result['failed']} failed, {result['throttled']} throttled, "
+                f"rate settled at {result['final_rate']} req/s")
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    if len(results) > 1:
+        log("-" * 60)
+        for key in ("pages_per_second", "files_per_second", "mb_per_second"):
+            values = sorted(r[key] for r in results)
+            log(f"  {key}: median {values[len(values) // 2]}, best {values[-1]}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": vars(args), "runs": results}, f, indent=2)
+        log(f"Results saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark the PDF text backends registered in text_extraction.py.
+
+Runs every installed backend (pypdfium2, PyMuPDF, pdfminer, pdfplumber) over
+the PDFs in the attachments folder and reports pages/s, characters extracted
+and how often each backend returned empty or garbled text. The extraction
+cache is bypassed, so the numbers are raw parsing speed.
+
+Usage:
+    python benchmark_pdf_backends.py
+    python benchmark_pdf_backends.py --limit 50 --backends pypdfium2 pdfplumber
+    python benchmark_pdf_backends.py --dir some/other/folder --json pdf_bench.json
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+from file_types import PDF, sniff_file
+from text_extraction import PDF_BACKENDS, extract_pdf_pages, extract_pdf_with, looks_garbled
+
+ATTACHMENTS_DIR = Path("20401_digital_omnibus") / "attachments"
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark PDF text extraction backends.")
+    parser.add_argument("--dir", default=str(ATTACHMENTS_DIR), help=f"Folder of PDFs (default: {ATTACHMENTS_DIR})")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N PDFs (default: all)")
+    parser.add_argument("--backends", nargs="+", choices=list(PDF_BACKENDS), default=list(PDF_BACKENDS),
+                        help="Backends to compare (default: all installed)")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to a JSON file")
+    return parser.parse_args()
+
+def find_pdfs(folder, limit=0):
+    """PDFs in a folder, detected by magic bytes rather than extension."""
+    pdfs = []
+    for path in sorted(Path(folder).iterdir()):
+        if not path.is_file():
+            continue
+        if sniff_file(path)[0] == PDF:
+            pdfs.append(path)
+        if limit and len(pdfs) >= limit:
+            break
+    return pdfs
+
+def run_backend(name, pdfs, extract=None):
+    """Extract every PDF with one backend and time it."""
+    pages = chars = empty = garbled = 0
+    start = time.perf_counter()
+    for path in pdfs:
+        page_texts, _ = extract(path) if extract else extract_pdf_with(name, path)
+        pages += len(page_texts)
+        chars += sum(len(t) for t in page_texts)
+        if not "".join(page_texts).strip():
+            empty += 1
+        elif looks_garbled(page_texts):
+            garbled += 1
+    seconds = max(time.perf_counter() - start, 1e-9)
+    return {
+        "backend": name,
+        "files": len(pdfs),
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 1),
+        "chars": chars,
+        "empty": empty,
+        "garbled": garbled,
+    }
+
+def main():
+    args = parse_args()
+    pdfs = find_pdfs(args.dir, args.limit)
+    if not pdfs:
+        log(f"❌ No PDFs found in {args.dir}")
+        return
+
+    log("=" * 60)
+    log("PDF BACKEND BENCHMARK")
+    log("=" * 60)
+    log(f"  {len(pdfs)} PDFs from {args.dir}")
+
+    results = []
+    for name in args.backends:
+        log(f"Running {name}...")
+        results.append(run_backend(name, pdfs))
+    log("Running auto (fast backend with pdfplumber fallback)...")
+    results.append(run_backend("auto", pdfs, extract_pdf_pages))
+
+    log("-" * 60)
+    log(f"  {'backend':<12} {'pages/s':>9} {'seconds':>9} {'pages':>7} {'chars':>10} {'empty':>6} {'garbled':>8}")
+    for r in results:
+        log(f"  {r['backend']:<12} {r['pages_per_second']:>9} {r['seconds']:>9} {r['pages']:>7} "
+            f"{r['chars']:>10} {r['empty']:>6} {r['garbled']:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"dir": args.dir, "results": results}, f, indent=2)
+        log(f"Results saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
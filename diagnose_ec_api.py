@@ -4,6 +4,7 @@ Diagnostic script to test the EC Have Your Say API and discover its current stru
 Run this first to see what the API returns.
 """
 
+import argparse
 import json
 import requests
 from pprint import pprint
@@ -110,9 +111,17 @@ def test_endpoint(endpoint, params):
         return False, None
 
 def main():
+    global BASE_URL
+    parser = argparse.ArgumentParser(description="Probe the EC Have Your Say API endpoints.")
+    parser.add_argument("--base-url", default=BASE_URL, metavar="URL",
+                        help="API root to probe, e.g. a local mock_ec_api.py (default: %(default)s)")
+    args = parser.parse_args()
+    BASE_URL = args.base_url if args.base_url.endswith("/") else args.base_url + "/"
+    
     print("=" * 70)
     print("EC Have Your Say API Diagnostic Tool")
     print(f"Publication ID: {PUBLICATION_ID}")
+    print(f"API: {BASE_URL}")
     print("=" * 70)
     
     working_endpoints = []
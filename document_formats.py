@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Text extraction for the document formats python-docx cannot read.
+
+- Word 97-2003 .doc: the text is rebuilt from the piece table in the
+  WordDocument/table streams. The OLE container is opened with olefile when
+  it is installed, otherwise with the small compound-file reader below.
+  antiword, if it is on the PATH, is tried when the piece table cannot be
+  parsed (Word 6/95 files, encrypted or damaged documents).
+- RTF: a control-word tokenizer that skips non-text destinations (font and
+  colour tables, pictures, metadata) and decodes \\'hh and \\uN escapes.
+- OpenDocument text (.odt): paragraphs and headings from content.xml.
+
+Everything here is standard library apart from the optional olefile, so the
+functions can run inside the extraction worker processes.
+"""
+
+import codecs
+import re
+import shutil
+import struct
+import subprocess
+import zipfile
+from xml.etree import ElementTree
+
+try:
+    import olefile
+except ImportError:
+    olefile = None
+
+ANTIWORD = shutil.which("antiword")
+ANTIWORD_TIMEOUT = 60  # Seconds; the extraction supervisor still enforces its own limit
+
+# --- OLE compound files ------------------------------------------------------
+
+MAX_REGULAR_SECTOR = 0xFFFFFFFA  # Higher sector numbers mark free space and chain ends
+
+class CompoundFile:
+    """Minimal read-only OLE compound file (CFB) reader: enough to read named streams."""
+
+    def __init__(self, data):
+        if data[:8] != b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1':
+            raise ValueError("not an OLE compound file")
+        self.data = data
+        self.sector_size = 1 << struct.unpack_from('<H', data, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from('<H', data, 0x20)[0]
+        (first_dir, _, self.mini_cutoff, first_minifat, minifat_count,
+         first_difat, difat_count) = struct.unpack_from('<7I', data, 0x30)
+
+        # The FAT sectors are listed in the header's DIFAT plus any DIFAT sector chain
+        fat_sectors = [s for s in struct.unpack_from('<109I', data, 0x4C) if s <= MAX_REGULAR_SECTOR]
+        per_sector = self.sector_size // 4
+        sector = first_difat
+        for _ in range(difat_count):
+            if sector > MAX_REGULAR_SECTOR:
+                break
+            entries = struct.unpack_from(f'<{per_sector}I', self.sector(sector))
+            fat_sectors.extend(s for s in entries[:-1] if s <= MAX_REGULAR_SECTOR)
+            sector = entries[-1]
+        self.fat = []
+        for sector in fat_sectors:
+            self.fat.extend(struct.unpack_from(f'<{per_sector}I', self.sector(sector)))
+
+        directory = self.chain(first_dir)
+        self.entries = {}
+        root = None
+        for offset in range(0, len(directory) - 127, 128):
+            name_length, entry_type = struct.unpack_from('<HB', directory, offset + 64)
+            start, size = struct.unpack_from('<II', directory, offset + 116)
+            name = directory[offset:offset + max(0, name_length - 2)].decode('utf-16-le', errors='ignore')
+            if entry_type == 5:
+                root = (start, size)
+            elif entry_type == 2:
+                self.entries.setdefault(name, (start, size))
+
+        self.minifat = []
+        if minifat_count and first_minifat <= MAX_REGULAR_SECTOR:
+            minifat = self.chain(first_minifat)
+            self.minifat = list(struct.unpack_from(f'<{len(minifat) // 4}I', minifat))
+        self.mini_stream = self.chain(root[0])[:root[1]] if root else b''
+
+    def sector(self, sector):
+        start = (sector + 1) * self.sector_size
+        return self.data[start:start + self.sector_size]
+
+    def chain(self, sector, table=None, read=None):
+        """Concatenate a sector chain; the FAT and regular sectors unless told otherwise."""
+        table = self.fat if table is None else table
+        read = read or self.sector
+        parts = []
+        seen = set()
+        while sector <= MAX_REGULAR_SECTOR and sector < len(table) and sector not in seen:
+            seen.add(sector)
+            parts.append(read(sector))
+            sector = table[sector]
+        return b''.join(parts)
+
+    def exists(self, name):
+        return name in self.entries
+
+    def read(self, name):
+        start, size = self.entries[name]
+        if size < self.mini_cutoff:
+            mini = lambda s: self.mini_stream[s * self.mini_sector_size:(s + 1) * self.mini_sector_size]
+            return self.chain(start, self.minifat, mini)[:size]
+        return self.chain(start)[:size]
+
+def read_ole_streams(filepath, names):
+    """Read named streams from an OLE file, with olefile when installed; missing streams are None."""
+    if olefile:
+        with olefile.OleFileIO(str(filepath)) as ole:
+            return {name: ole.openstream(name).read() if ole.exists(name) else None for name in names}
+    with open(filepath, 'rb') as f:
+        cfb = CompoundFile(f.read())
+    return {name: cfb.read(name) if cfb.exists(name) else None for name in names}
+
+# --- Word 97-2003 ------------------------------------------------------------
+
+FIELD_BEGIN, FIELD_SEPARATOR, FIELD_END = "\x13", "\x14", "\x15"
+# Word's in-text control characters and what they mean as plain text
+WORD_CONTROL_CHARS = str.maketrans({
+    "\r": "\n", "\x0b": "\n", "\x0c": "\n", "\x0e": "\n",  # paragraph, line, page and column breaks
+    "\x07": "\t",  # table cell / row end
+    "\x1e": "-", "\x1f": None,  # non-breaking and optional hyphens
+    "\x01": None, "\x08": None,  # pictures and drawn objects
+    "\xa0": " ",
+})
+
+def word_piece_table_text(word_stream, table_streams):
+    """Rebuild a Word 97+ document's main text from its FIB and piece table."""
+    ident, = struct.unpack_from('<H', word_stream, 0)
+    if ident != 0xA5EC:
+        raise ValueError("not a Word 97+ document")
+    flags, = struct.unpack_from('<H', word_stream, 0x0A)
+    if flags & 0x0100:
+        raise ValueError("encrypted document")
+    table = table_streams.get("1Table" if flags & 0x0200 else "0Table")
+    if table is None:
+        raise ValueError("table stream missing")
+
+    text_chars, = struct.unpack_from('<I', word_stream, 0x4C)  # FibRgLw97.ccpText
+    clx_offset, clx_size = struct.unpack_from('<II', word_stream, 0x1A2)  # FibRgFcLcb97.fcClx/lcbClx
+    clx = table[clx_offset:clx_offset + clx_size]
+
+    # Skip the Prc (formatting) records to reach the Pcdt piece table
+    pos = 0
+    while pos < len(clx) and clx[pos] == 0x01:
+        pos += 3 + struct.unpack_from('<h', clx, pos + 1)[0]
+    if pos >= len(clx) or clx[pos] != 0x02:
+        raise ValueError("piece table not found")
+    size, = struct.unpack_from('<I', clx, pos + 1)
+    plc = clx[pos + 5:pos + 5 + size]
+    pieces = (size - 4) // 12
+    cps = struct.unpack_from(f'<{pieces + 1}I', plc, 0)
+
+    parts = []
+    for i in range(pieces):
+        fc, = struct.unpack_from('<I', plc, 4 * (pieces + 1) + 8 * i + 2)
+        length = cps[i + 1] - cps[i]
+        if fc & 0x40000000:
+            start = (fc & 0x3FFFFFFF) // 2
+            parts.append(word_stream[start:start + length].decode('cp1252', errors='replace'))
+        else:
+            parts.append(word_stream[fc:fc + 2 * length].decode('utf-16-le', errors='replace'))
+    return "".join(parts)[:text_chars]
+
+def strip_word_fields(text):
+    """Keep field results but drop field instructions (between the begin and separator marks)."""
+    out = []
+    depth = []  # per open field: True while still inside its instructions
+    for char in text:
+        if char == FIELD_BEGIN:
+            depth.append(True)
+        elif char == FIELD_SEPARATOR and depth:
+            depth[-1] = False
+        elif char == FIELD_END and depth:
+            depth.pop()
+        elif not any(depth):
+            out.append(char)
+    return "".join(out)
+
+def clean_word_text(text):
+    text = strip_word_fields(text).translate(WORD_CONTROL_CHARS)
+    text = re.sub(r'[\x00-\x08\x0e-\x1f]', '', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+def doc_text(filepath):
+    """Text of a Word 97-2003 document; returns (text, backend)."""
+    backend = "olefile" if olefile else "builtin-ole"
+    try:
+        streams = read_ole_streams(filepath, ["WordDocument", "0Table", "1Table"])
+        if streams["WordDocument"] is None:
+            raise ValueError("no WordDocument stream")
+        return clean_word_text(word_piece_table_text(streams["WordDocument"], streams)), backend
+    except (ValueError, struct.error, IndexError, OSError):
+        if not ANTIWORD:
+            raise
+    result = subprocess.run([ANTIWORD, "-w", "0", str(filepath)], capture_output=True, timeout=ANTIWORD_TIMEOUT)
+    if result.returncode != 0:
+        raise ValueError(f"antiword failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout.decode('utf-8', errors='replace').strip(), "antiword"
+
+# --- RTF ---------------------------------------------------------------------
+
+RTF_TOKEN = re.compile(
+    r"\\([a-zA-Z]+)(-?\d+)? ?"  # control word with optional numeric parameter
+    r"|\\'([0-9a-fA-F]{2})"  # hex-escaped byte in the document code page
+    r"|\\([^a-zA-Z])"  # control symbol
+    r"|([{}])"
+    r"|[\r\n]+"
+    r"|([^\\{}\r\n]+)"
+)
+# Destinations whose content is not document text
+RTF_SKIP_DESTINATIONS = {
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "header", "footer", "headerl",
+    "headerr", "footerl", "footerr", "footnote", "listtable", "listoverridetable", "revtbl",
+    "rsidtbl", "generator", "xmlnstbl", "themedata", "colorschememapping", "latentstyles",
+    "datastore", "fldinst", "bkmkstart", "bkmkend", "filetbl", "pgdsctbl", "nonshppict",
+}
+RTF_SPECIAL = {
+    "par": "\n", "line": "\n", "sect": "\n", "page": "\n", "row": "\n", "cell": "\t", "tab": "\t",
+    "emdash": "\u2014", "endash": "\u2013", "bullet": "\u2022", "lquote": "\u2018", "rquote": "\u2019",
+    "ldblquote": "\u201c", "rdblquote": "\u201d", "emspace": " ", "enspace": " ", "qmspace": " ",
+}
+
+def rtf_to_text(rtf):
+    """Plain text of an RTF document (given as str decoded as Latin-1)."""
+    out = []
+    pending = bytearray()  # \'hh bytes waiting to be decoded together (multi-byte code pages)
+    encoding = "cp1252"
+    stack = []
+    skip = False
+    unicode_skip = 1
+    to_skip = 0  # fallback characters still to drop after a \uN
+    destination_next = False  # just saw \*
+
+    def flush():
+        if pending:
+            out.append(pending.decode(encoding, errors='replace'))
+            pending.clear()
+
+    for match in RTF_TOKEN.finditer(rtf):
+        word, param, hex_byte, symbol, brace, text = match.groups()
+        if hex_byte is not None:
+            if to_skip:
+                to_skip -= 1
+            elif not skip:
+                pending.append(int(hex_byte, 16))
+            continue
+        flush()
+        if brace == "{":
+            stack.append((skip, unicode_skip))
+        elif brace == "}":
+            if stack:
+                skip, unicode_skip = stack.pop()
+            destination_next = False
+        elif word is not None:
+            if destination_next or word in RTF_SKIP_DESTINATIONS:
+                skip = True
+                destination_next = False
+            elif word == "ansicpg" and param:
+                try:
+                    encoding = codecs.lookup(f"cp{param}").name
+                except LookupError:
+                    pass
+            elif word == "uc":
+                unicode_skip = int(param or 1)
+            elif word == "u" and param:
+                if not skip:
+                    out.append(chr(int(param) % 65536))
+                to_skip = unicode_skip
+            elif not skip and word in RTF_SPECIAL:
+                out.append(RTF_SPECIAL[word])
+        elif symbol is not None:
+            if symbol == "*":
+                destination_next = True
+            elif not skip and symbol in "\\{}":
+                out.append(symbol)
+            elif not skip and symbol == "~":
+                out.append(" ")
+            elif not skip and symbol == "_":
+                out.append("-")
+        elif text is not None and not skip:
+            if to_skip:
+                dropped = min(to_skip, len(text))
+                text = text[dropped:]
+                to_skip -= dropped
+            out.append(text.encode('latin-1').decode(encoding, errors='replace'))  # Raw 8-bit text
+    flush()
+    text = "".join(out)
+    return re.sub(r'\n{3,}', '\n\n', re.sub(r'[ \t]+\n', '\n', text)).strip()
+
+def rtf_text(filepath):
+    with open(filepath, 'rb') as f:
+        return rtf_to_text(f.read().decode('latin-1'))
+
+# --- OpenDocument ------------------------------------------------------------
+
+ODF_TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+ODF_BLOCKS = {f"{{{ODF_TEXT_NS}}}p", f"{{{ODF_TEXT_NS}}}h"}
+ODF_SKIP = {f"{{{ODF_TEXT_NS}}}{name}" for name in ("note-citation", "tracked-changes", "bookmark-ref")}
+
+def odf_inline_text(element):
+    """Text of one paragraph element, expanding spaces, tabs and line breaks."""
+    parts = [element.text or ""]
+    for child in element:
+        tag = child.tag
+        if tag == f"{{{ODF_TEXT_NS}}}s":
+            parts.append(" " * int(child.get(f"{{{ODF_TEXT_NS}}}c", "1")))
+        elif tag == f"{{{ODF_TEXT_NS}}}tab":
+            parts.append("\t")
+        elif tag == f"{{{ODF_TEXT_NS}}}line-break":
+            parts.append("\n")
+        elif tag not in ODF_SKIP and tag not in ODF_BLOCKS:
+            parts.append(odf_inline_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+def odt_text(filepath):
+    """Paragraphs and headings of an OpenDocument text file, in document order."""
+    with zipfile.ZipFile(filepath) as archive:
+        with archive.open("content.xml") as f:
+            root = ElementTree.parse(f).getroot()
+    paragraphs = []
+
+    def walk(element):
+        for child in element:
+            if child.tag in ODF_BLOCKS:
+                paragraphs.append(odf_inline_text(child))
+                walk(child)  # Paragraphs nested in frames or notes
+            elif child.tag not in ODF_SKIP:
+                walk(child)
+    walk(root)
+    return "\n".join(paragraphs).strip()
@@ -2,46 +2,230 @@
 """
 Download all responses from the European Commission's Digital Omnibus consultation.
 FIXED VERSION - Handles PDF, DOCX, and other file formats correctly.
+
+Several consultations can be downloaded in one run by passing their publication
+IDs (or a file of IDs); they share one connection pool and worker pools.
 """
 
+import argparse
+import hashlib
+import itertools
 import json
 import os
+import random
+import shutil
+import sqlite3
+import threading
 import time
+from email.utils import parsedate_to_datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 import csv
 
+import file_types
+
 try:
     import requests
+    from requests.adapters import HTTPAdapter
     USE_REQUESTS = True
 except ImportError:
     print("Error: requests library not found. Install with: pip install requests")
     exit(1)
 
 # Configuration
-PUBLICATION_ID = "20401"
-OUTPUT_DIR = Path(f"{PUBLICATION_ID}_digital_omnibus")
-ATTACHMENTS_DIR = OUTPUT_DIR / "attachments"
+DEFAULT_PUBLICATION_IDS = ["20401"]
+# Output folders for consultations we already know; others get "<id>_consultation"
+OUTPUT_DIR_NAMES = {
+    "20401": "20401_digital_omnibus",
+}
+COMBINED_MANIFEST_FILE = "consultations_manifest.json"  # Written for multi-consultation runs
 
 # API configuration
 BASE_URL = "https://ec.europa.eu/info/law/better-regulation/"
 FEEDBACK_ENDPOINT = "api/allFeedback"
 DOWNLOAD_ENDPOINT = "api/download/"
+PAGE_SIZE = 100
+MAX_PAGES = None  # Optional cap on feedback pages (--max-pages); None fetches every page
+NEWEST_FIRST = "dateFeedback,DESC"  # Spring Data sort used for incremental sync
 
-# File type magic bytes for verification
-FILE_SIGNATURES = {
-    'pdf': b'%PDF',
-    'docx': b'PK\x03\x04',  # DOCX is a ZIP file
-    'doc': b'\xD0\xCF\x11\xE0',  # Old Word format
-    'xlsx': b'PK\x03\x04',  # XLSX is also a ZIP file
-    'zip': b'PK\x03\x04',
-}
+# Concurrency configuration (overridable from the command line)
+MAX_WORKERS = 4  # Parallel attachment downloads sharing one session
+PAGE_WORKERS = 4  # Parallel feedback page fetches once totalPages is known
+REQUESTS_PER_SECOND = 2.0  # Starting request rate shared by all workers
+MAX_REQUESTS_PER_SECOND = 8.0  # Ceiling the adaptive limiter may ramp up to
+MIN_REQUESTS_PER_SECOND = 0.2  # Floor after repeated 429/5xx responses
+
+# Retry configuration for 429/5xx responses and network errors
+MAX_RETRIES = 5
+INTERRUPTED = "Interrupted"  # download_file() result prefix for resumable failures
+# Errors while streaming a response body: the partial is kept and resumed with a Range request
+STREAM_ERRORS = (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                 requests.exceptions.Timeout)
+BACKOFF_BASE = 1.0  # Seconds; doubled on each retry, with jitter
+BACKOFF_MAX = 60.0
 
 def log_message(message):
     """Print timestamped log message."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}")
 
+class Consultation:
+    """One Have Your Say consultation and its output tree."""
+
+    def __init__(self, publication_id, output_root=Path(".")):
+        self.publication_id = str(publication_id)
+        name = OUTPUT_DIR_NAMES.get(self.publication_id, f"{self.publication_id}_consultation")
+        self.output_dir = Path(output_root) / name
+        self.attachments_dir = self.output_dir / "attachments"
+        # Content-addressed attachment store: blobs/<sha[:2]>/<sha256>, with
+        # attachments/{att_id}_{name} hard-linked to the blob for readability
+        self.blobs_dir = self.output_dir / "blobs"
+        self.partial_dir = self.output_dir / "partial"  # Interrupted downloads kept for HTTP Range resume
+        # SQLite record of feedbacks, attachments and download attempts; opened by
+        # fetch_consultation(), committed after every file, attachments.csv is exported from it
+        self.manifest_file = self.output_dir / "download_manifest.db"
+        self.legacy_manifest_file = self.output_dir / "sync_manifest.json"  # Imported once, if present
+        self.manifest = None
+        self.store_manifest_file = self.output_dir / "attachment_store.json"
+        # Attachment ID -> {"sha256", "size", "type", "filename"}; shared by worker threads
+        self.store = {}
+        self.store_lock = threading.Lock()
+        self.log_prefix = ""  # Set to "[<id>] " when several consultations share the logs
+
+    def log(self, message):
+        """Log a message tagged with this consultation in multi-consultation runs."""
+        indent = message[:len(message) - len(message.lstrip())]
+        log_message(f"{indent}{self.log_prefix}{message.lstrip()}")
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by every EC API call, tuned by the server's responses.
+    
+    The rate halves on 429 responses (down to min_rate). A Retry-After
+    header on a 429 or 5xx pauses every thread until it has passed. After a run of healthy
+    responses the rate creeps back up towards max_rate (additive increase,
+    multiplicative decrease). A rate of 0 disables limiting entirely.
+    """
+
+    def __init__(self, rate, max_rate=None, min_rate=MIN_REQUESTS_PER_SECOND, burst=2, healthy_streak=10):
+        self.rate = rate
+        self.max_rate = max(rate, max_rate or rate)
+        self.min_rate = min(rate, min_rate) if rate > 0 else 0.0
+        self.burst = burst
+        self.healthy_streak = healthy_streak
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+
+    def acquire(self):
+        """Block until the caller is allowed to start a request.
+        
+        A Retry-After pause is honoured even when rate limiting is disabled.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def on_success(self):
+        """Record a healthy response; ramp the rate up after a streak of them."""
+        with self.lock:
+            self.successes += 1
+            if self.rate > 0 and self.successes >= self.healthy_streak:
+                self.successes = 0
+                self.rate = min(self.max_rate, self.rate + 0.25)
+
+    def on_throttle(self, retry_after=None, slow_down=True):
+        """Record a 429/5xx response: slow down, and pause everyone if asked to."""
+        with self.lock:
+            self.throttled += 1
+            self.successes = 0
+            if slow_down and self.rate > 0:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds to wait."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(tz=timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter for retry number `attempt` (0-based)."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+_session = None
+_session_lock = threading.Lock()
+rate_limiter = AdaptiveRateLimiter(REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND)
+
+def get_session():
+    """Return the shared keep-alive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            pool_size = MAX_WORKERS + PAGE_WORKERS
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def api_get(url, params=None, headers=None, timeout=30, stream=False):
+    """GET through the shared session and rate limiter, retrying transient failures.
+    
+    429 and 5xx responses and network errors are retried up to MAX_RETRIES
+    times, honouring Retry-After or else backing off exponentially with
+    jitter. The last response is returned even if it is still an error;
+    network errors on the final attempt are raised.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            response = get_session().get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+        except requests.RequestException:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            # Only 429 says we are going too fast; 5xx just gets backed off
+            rate_limiter.on_throttle(retry_after, slow_down=response.status_code == 429)
+            if attempt == MAX_RETRIES:
+                return response
+            response.close()
+            if retry_after is None:
+                time.sleep(backoff_delay(attempt))
+            continue
+        
+        rate_limiter.on_success()
+        return response
+
 def fetch_json(url, params=None):
     """Fetch JSON from a URL."""
     headers = {
@@ -51,136 +235,769 @@ def fetch_json(url, params=None):
     }
     
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=30)
+        response = api_get(url, params=params, headers=headers, timeout=30)
         if response.status_code == 200:
             return response.json()
+        log_message(f"  HTTP {response.status_code} fetching {url} {params or ''}")
         return None
     except Exception as e:
         log_message(f"  Error fetching {url}: {e}")
         return None
 
-def detect_file_type(first_bytes):
-    """Detect file type from magic bytes."""
-    for file_type, signature in FILE_SIGNATURES.items():
-        if first_bytes.startswith(signature):
-            return file_type
-    return None
+def detect_file_type(first_bytes, name=None, path=None):
+    """Detect a document's type from its first bytes (see file_types.py).
+    
+    Returns None for markup and plain text, which are not documents the
+    consultation accepts (typically an error page served instead of the file).
+    """
+    file_type = file_types.sniff_bytes(first_bytes, name, path)
+    if file_type in (None, file_types.HTML, file_types.XML, file_types.TEXT):
+        return None
+    return file_type
 
-def download_file(url, filepath, expected_extension=None):
-    """Download a file from URL to filepath and verify it's valid."""
+def partial_paths(filepath, partial_dir):
+    """Paths of the partial download and its saved validators for a target file."""
+    partial = partial_dir / (filepath.name + ".part")
+    return partial, partial.with_name(partial.name + ".json")
+
+def discard_partial(filepath, partial_dir):
+    """Remove a partial download and its validators."""
+    for path in partial_paths(filepath, partial_dir):
+        if path.exists():
+            path.unlink()
+
+def resume_headers(url, filepath, partial_dir):
+    """Build Range/If-Range headers to resume a partial download, if possible.
+    
+    Returns (headers, offset). Partials without a saved ETag or Last-Modified
+    cannot be checked for staleness, so they are discarded instead.
+    """
+    partial, meta_path = partial_paths(filepath, partial_dir)
+    if not partial.exists() or not meta_path.exists():
+        discard_partial(filepath, partial_dir)
+        return {}, 0
+    
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    validator = meta.get("etag") or meta.get("last_modified")
+    offset = partial.stat().st_size
+    if meta.get("url") != url or not validator or offset == 0:
+        discard_partial(filepath, partial_dir)
+        return {}, 0
+    
+    return {"Range": f"bytes={offset}-", "If-Range": validator}, offset
+
+def download_file(url, filepath, partial_dir):
+    """Download a file from URL to filepath and verify it's valid.
+    
+    Data is streamed into partial/<name>.part. If the transfer is interrupted
+    the partial is kept along with the server's ETag/Last-Modified, and the
+    next attempt resumes it with a Range request. If-Range makes the server
+    send the whole file again when the partial is stale.
+    
+    Only a transfer cut off mid-body (STREAM_ERRORS) is reported as
+    INTERRUPTED, i.e. worth resuming straight away. Requests that still fail
+    after api_get()'s retries, and any other error, fail the file once.
+    
+    Returns (success, detected type or failure reason, bytes written by this call).
+    """
     headers = {
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
         "Accept": "*/*",
     }
     
+    partial_dir.mkdir(exist_ok=True)
+    temp_path, meta_path = partial_paths(filepath, partial_dir)
+    range_headers, offset = resume_headers(url, filepath, partial_dir)
+    headers.update(range_headers)
+    written = 0
+    
     try:
-        response = requests.get(url, headers=headers, timeout=60, stream=True)
-        if response.status_code != 200:
-            return False, "HTTP error"
-        
-        # Download to temporary file first
-        temp_path = filepath.with_suffix('.tmp')
-        first_chunk = None
-        
-        with open(temp_path, 'wb') as f:
-            for i, chunk in enumerate(response.iter_content(chunk_size=8192)):
-                if i == 0:
-                    first_chunk = chunk
-                f.write(chunk)
+        with api_get(url, headers=headers, timeout=60, stream=True) as response:
+            if response.status_code == 416 and offset:
+                # Nothing left to send: the partial may already be complete
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if total != str(offset):
+                    discard_partial(filepath, partial_dir)
+                    return False, "Stale partial", written
+            elif response.status_code == 206 and offset:
+                if not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    discard_partial(filepath, partial_dir)
+                    return False, "Bad Content-Range", written
+            elif response.status_code == 200:
+                # Fresh download, or the server decided the partial is stale
+                offset = 0
+            else:
+                return False, f"HTTP {response.status_code}", written
+            
+            if response.status_code != 416:
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        "url": url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    }, f)
+                
+                with open(temp_path, 'ab' if offset else 'wb') as f:
+                    try:
+                        for chunk in response.iter_content(chunk_size=8192):
+                            f.write(chunk)
+                            written += len(chunk)
+                    except STREAM_ERRORS as e:
+                        # Keep the partial so a retry (or the next run) can resume it
+                        return False, f"{INTERRUPTED}: {e}", written
         
         # Verify file is valid
-        if not first_chunk or len(first_chunk) < 4:
-            os.remove(temp_path)
-            return False, "Empty file"
+        with open(temp_path, 'rb') as f:
+            first_chunk = f.read(8192)
+        
+        if len(first_chunk) < 4:
+            discard_partial(filepath, partial_dir)
+            return False, "Empty file", written
         
-        # Check file signature
-        detected_type = detect_file_type(first_chunk)
+        # Check file signature; the name only breaks ties between ZIP-based formats
+        detected_type = detect_file_type(first_chunk, filepath.name, temp_path)
         
         if detected_type:
-            # Valid file detected
-            # Check if extension matches
-            if expected_extension:
-                expected_lower = expected_extension.lower().lstrip('.')
-                # Handle DOCX/XLSX (both are ZIP files)
-                if detected_type == 'docx' and expected_lower in ['docx', 'xlsx', 'pptx']:
-                    detected_type = expected_lower
-            
-            # Move temp file to final location
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            os.rename(temp_path, filepath)
-            return True, detected_type
+            # Valid file detected, move temp file to final location
+            os.replace(temp_path, filepath)
+            discard_partial(filepath, partial_dir)
+            return True, detected_type, written
         else:
             # Unknown file type - might be HTML error page
             if b'<html' in first_chunk.lower() or b'<!doctype' in first_chunk.lower():
-                os.remove(temp_path)
-                return False, "HTML page"
+                discard_partial(filepath, partial_dir)
+                return False, "HTML page", written
             else:
                 # Unknown but not HTML - keep it anyway
-                os.rename(temp_path, filepath)
-                return True, "unknown"
+                os.replace(temp_path, filepath)
+                discard_partial(filepath, partial_dir)
+                return True, "unknown", written
         
+    except requests.RequestException as e:
+        # api_get() has already retried the request itself
+        return False, f"Network error: {e}", written
     except Exception as e:
-        if temp_path.exists():
-            os.remove(temp_path)
-        return False, str(e)
+        return False, f"{type(e).__name__}: {e}", written
 
-def fetch_all_feedbacks():
-    """Fetch all feedback submissions from the API."""
-    all_feedbacks = []
-    page = 0
-    page_size = 100
+def fetch_feedback_page(publication_id, page, page_size=PAGE_SIZE, sort=None):
+    """Fetch a single page of feedback submissions."""
+    url = f"{BASE_URL}{FEEDBACK_ENDPOINT}"
+    params = {
+        "publicationId": publication_id,
+        "page": page,
+        "size": page_size
+    }
+    if sort:
+        params["sort"] = sort
+    return fetch_json(url, params)
+
+class PageFetchError(Exception):
+    """A feedback page still failed after every retry; the consultation's fetch is abandoned."""
+
+    def __init__(self, page):
+        super().__init__(f"Feedback page {page} could not be fetched")
+        self.page = page
+
+def fetch_all_feedbacks(consultation, executor, writer):
+    """Fetch all feedback submissions from the API, streaming them to `writer`.
     
-    log_message("Fetching feedback submissions...")
+    Page 0 is fetched first to learn totalPages; the remaining pages are then
+    fetched in parallel on the shared page executor. Pages are written in
+    page order as soon as they are contiguous, and at most a small window of
+    pages is in flight or buffered, so memory does not grow with the size of
+    the consultation. If the API does not report totalPages, pages are walked
+    sequentially instead. Returns the number of feedbacks written. A page
+    that still fails after retries raises PageFetchError rather than leaving
+    a gap in the feedback list.
+    """
+    log = consultation.log
+    publication_id = consultation.publication_id
+    log("Fetching feedback submissions...")
+    log("  Fetching page 0...")
     
-    while True:
-        url = f"{BASE_URL}{FEEDBACK_ENDPOINT}"
-        params = {
-            "publicationId": PUBLICATION_ID,
-            "page": page,
-            "size": page_size
-        }
+    data = fetch_feedback_page(publication_id, 0)
+    if data is None:
+        raise PageFetchError(0)
+    if not data.get("content"):
+        return 0
+    
+    writer.write_page(data["content"])
+    log(f"    Found {len(data['content'])} feedbacks, total: {writer.count}")
+    
+    if "totalPages" in data:
+        total_pages = data["totalPages"]
+        if MAX_PAGES and total_pages > MAX_PAGES:
+            skipped = data.get("totalElements", total_pages * PAGE_SIZE) - MAX_PAGES * PAGE_SIZE
+            log(f"    ⚠️  Only fetching {MAX_PAGES} of {total_pages} pages (--max-pages); "
+                f"about {skipped} feedbacks will be skipped")
+            total_pages = MAX_PAGES
+        log(f"    Progress: page 1 of {total_pages}")
+        if total_pages <= 1:
+            return writer.count
         
-        log_message(f"  Fetching page {page}...")
+        log(f"  Fetching pages 1-{total_pages - 1} in parallel...")
+        window = 2 * PAGE_WORKERS
+        next_to_submit = 1
+        next_to_write = 1
+        in_flight = {}
+        buffered = {}
         
-        data = fetch_json(url, params)
-        if not data:
+        while next_to_write < total_pages:
+            while next_to_submit < total_pages and len(in_flight) + len(buffered) < window:
+                future = executor.submit(fetch_feedback_page, publication_id, next_to_submit)
+                in_flight[future] = next_to_submit
+                next_to_submit += 1
+            
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                page_data = future.result()
+                if page_data is None:
+                    log(f"    ❌ Page {page} failed after {MAX_RETRIES} retries")
+                    for pending_future in in_flight:
+                        pending_future.cancel()
+                    raise PageFetchError(page)
+                buffered[page] = page_data.get("content", [])
+            
+            while next_to_write in buffered:
+                content = buffered.pop(next_to_write)
+                writer.write_page(content)
+                log(f"    Page {next_to_write}: {len(content)} feedbacks, total: {writer.count}")
+                next_to_write += 1
+        
+        return writer.count
+    
+    # No totalPages: walk sequentially until the API says we're done
+    page = 0
+    while not data.get("last") and len(data.get("content", [])) >= PAGE_SIZE:
+        page += 1
+        if MAX_PAGES and page >= MAX_PAGES:
+            log(f"    ⚠️  Stopped at the {MAX_PAGES}-page cap (--max-pages); later feedbacks were not fetched")
             break
         
-        feedbacks = data.get("content", [])
-        if not feedbacks:
+        log(f"  Fetching page {page}...")
+        data = fetch_feedback_page(publication_id, page)
+        if data is None:
+            log(f"    ❌ Page {page} failed after {MAX_RETRIES} retries")
+            raise PageFetchError(page)
+        if not data.get("content"):
             break
         
-        all_feedbacks.extend(feedbacks)
-        log_message(f"    Found {len(feedbacks)} feedbacks, total: {len(all_feedbacks)}")
+        writer.write_page(data["content"])
+        log(f"    Found {len(data['content'])} feedbacks, total: {writer.count}")
+    
+    return writer.count
+
+def parse_feedback_date(value):
+    """Parse a dateFeedback string (or a --since argument) into a datetime."""
+    if not value:
+        return None
+    for fmt in ("%Y/%m/%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value[:19], fmt)
+        except ValueError:
+            continue
+    return None
+
+def attachment_document_ids(feedback):
+    """Return the sorted documentIds attached to a feedback."""
+    return sorted(str(a.get("documentId")) for a in feedback.get("attachments", []) if a.get("documentId"))
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS feedbacks (
+    id TEXT PRIMARY KEY,
+    position INTEGER,
+    date TEXT,
+    documents TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    attachment_id TEXT PRIMARY KEY,
+    feedback_id TEXT,
+    position INTEGER,
+    document_id TEXT,
+    filename TEXT,
+    original_filename TEXT,
+    pages INTEGER,
+    size_bytes INTEGER,
+    status TEXT,
+    detected_type TEXT,
+    sha256 TEXT,
+    bytes INTEGER,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS download_attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    attachment_id TEXT,
+    document_id TEXT,
+    status TEXT,
+    bytes INTEGER,
+    sha256 TEXT,
+    detected_type TEXT,
+    latency_ms REAL,
+    error TEXT,
+    attempted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS attachments_by_feedback ON attachments (feedback_id, position);
+"""
+
+ATTACHMENT_CSV_FIELDS = ["attachment_id", "detected_type", "document_id", "feedback_id", "filename",
+                         "original_filename", "pages", "sha256", "size_bytes", "status"]
+
+class DownloadManifest:
+    """SQLite record of a consultation's feedbacks, attachments and download attempts.
+    
+    Every transfer attempt and download outcome is committed in its own
+    transaction as soon as it ends, so a crash loses at most the transfers
+    still in flight. One
+    connection is shared by the worker threads behind a lock.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(MANIFEST_SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM feedbacks").fetchone()[0] == 0
+
+    def replace_feedbacks(self, feedbacks):
+        """Make `feedbacks` (in order) the consultation's feedback list.
+        
+        Attachment metadata is refreshed, but download status, hashes and
+        attempts from earlier runs are kept.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM feedbacks")
+            for position, fb in enumerate(feedbacks):
+                feedback_id = str(fb.get("id"))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO feedbacks (id, position, date, documents, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (feedback_id, position, fb.get("dateFeedback", ""), json.dumps(attachment_document_ids(fb)), now),
+                )
+                for index, attachment in enumerate(fb.get("attachments", [])):
+                    self.conn.execute(
+                        """INSERT INTO attachments (attachment_id, feedback_id, position, document_id,
+                                                    original_filename, pages, size_bytes, updated_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (attachment_id) DO UPDATE SET
+                               feedback_id = excluded.feedback_id, position = excluded.position,
+                               document_id = excluded.document_id, original_filename = excluded.original_filename,
+                               pages = excluded.pages, size_bytes = excluded.size_bytes""",
+                        (str(attachment.get("id")), feedback_id, index, attachment.get("documentId"),
+                         attachment.get("fileName"), attachment.get("pages"), attachment.get("size"), now),
+                    )
+
+    def record_attempt(self, attachment, status, size=None, sha256=None, file_type=None,
+                       latency_ms=None, error=None):
+        """Commit one download attempt: a single transfer, or a check that found the file already stored.
         
-        if "totalPages" in data:
-            total_pages = data["totalPages"]
-            log_message(f"    Progress: page {page + 1} of {total_pages}")
-            if page >= total_pages - 1:
-                break
-        elif "last" in data and data["last"]:
+        `size` is the number of bytes this attempt wrote; `error` says why it
+        failed or was interrupted.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO download_attempts (attachment_id, document_id, status, bytes, sha256,
+                                                  detected_type, latency_ms, error, attempted_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (str(attachment.get("id")), attachment.get("documentId"), status, size, sha256,
+                 file_type, latency_ms, error, now),
+            )
+
+    def record_download(self, feedback_id, attachment, status, filename, file_type, sha256=None, size=None):
+        """Commit an attachment's state after its download attempts are over."""
+        now = datetime.now().isoformat(timespec="seconds")
+        att_id = str(attachment.get("id"))
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO attachments (attachment_id, feedback_id, document_id, filename, original_filename,
+                                            pages, size_bytes, status, detected_type, sha256, bytes, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (attachment_id) DO UPDATE SET
+                       filename = excluded.filename, status = excluded.status,
+                       detected_type = excluded.detected_type, sha256 = excluded.sha256,
+                       bytes = excluded.bytes, updated_at = excluded.updated_at""",
+                (att_id, str(feedback_id), attachment.get("documentId"), filename, attachment.get("fileName"),
+                 attachment.get("pages"), attachment.get("size"), status, file_type, sha256, size, now),
+            )
+
+    def known_feedbacks(self):
+        """Feedback ID -> {"date", "documents"} as of the last sync."""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, date, documents FROM feedbacks ORDER BY position").fetchall()
+        return {row["id"]: {"date": row["date"], "documents": json.loads(row["documents"] or "[]")} for row in rows}
+
+    def downloaded_documents(self):
+        """Document IDs whose attachment is safely on disk."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT document_id FROM attachments WHERE status IN ('downloaded', 'exists') AND document_id IS NOT NULL"
+            ).fetchall()
+        return {str(row["document_id"]) for row in rows}
+
+    def store_entries(self):
+        """Attachment ID -> blob store entry for every attachment with a known hash."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT attachment_id, sha256, bytes, detected_type, filename FROM attachments "
+                "WHERE status IN ('downloaded', 'exists') AND sha256 IS NOT NULL"
+            ).fetchall()
+        return {
+            row["attachment_id"]: {"sha256": row["sha256"], "size": row["bytes"],
+                                   "type": row["detected_type"], "filename": row["filename"]}
+            for row in rows
+        }
+
+    def attachment_rows(self):
+        """Attachments of the current feedbacks, in feedback order, as attachments.csv rows."""
+        with self.lock:
+            rows = self.conn.execute(
+                f"""SELECT {", ".join("a." + field for field in ATTACHMENT_CSV_FIELDS)}
+                    FROM attachments a JOIN feedbacks f ON f.id = a.feedback_id
+                    ORDER BY f.position, a.position"""
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_legacy(self, sync_manifest, attachment_rows):
+        """Seed an empty database from sync_manifest.json and attachments.csv of older runs."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            for position, (feedback_id, entry) in enumerate(sync_manifest.get("feedbacks", {}).items()):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO feedbacks (id, position, date, documents, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (feedback_id, position, entry.get("date", ""), json.dumps(entry.get("documents", [])), now),
+                )
+            for position, row in enumerate(attachment_rows):
+                self.conn.execute(
+                    """INSERT OR REPLACE INTO attachments (attachment_id, feedback_id, position, document_id,
+                                                           filename, original_filename, pages, size_bytes,
+                                                           status, detected_type, sha256, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (str(row.get("attachment_id")), str(row.get("feedback_id")), position,
+                     row.get("document_id") or None, row.get("filename"), row.get("original_filename"),
+                     row.get("pages") or None, row.get("size_bytes") or None, row.get("status"),
+                     row.get("detected_type") or None, row.get("sha256") or None, now),
+                )
+            if sync_manifest.get("last_sync"):
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sync', ?)",
+                                  (sync_manifest["last_sync"],))
+
+def open_manifest(consultation):
+    """Open the consultation's download manifest, importing older JSON/CSV state on first use."""
+    manifest = DownloadManifest(consultation.manifest_file)
+    if manifest.is_empty():
+        legacy = {}
+        if consultation.legacy_manifest_file.exists():
+            with open(consultation.legacy_manifest_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        rows = list(load_existing_attachment_records(consultation).values())
+        if legacy or rows:
+            manifest.import_legacy(legacy, rows)
+            consultation.log(f"  Imported previous run state into {consultation.manifest_file.name}")
+    consultation.manifest = manifest
+    return manifest
+
+def load_manifest(consultation):
+    """Summarise what the last sync saw: its time, feedbacks and downloaded documents."""
+    return {
+        "last_sync": consultation.manifest.get_meta("last_sync"),
+        "feedbacks": consultation.manifest.known_feedbacks(),
+        "downloaded_documents": consultation.manifest.downloaded_documents(),
+    }
+
+def save_manifest(consultation):
+    """Stamp the manifest with the time of this sync and return it."""
+    last_sync = datetime.now().isoformat(timespec="seconds")
+    consultation.manifest.set_meta("last_sync", last_sync)
+    return last_sync
+
+def export_attachments_csv(consultation):
+    """Write attachments.csv from the download manifest; returns the exported rows."""
+    rows = consultation.manifest.attachment_rows()
+    path = consultation.output_dir / "attachments.csv"
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ATTACHMENT_CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, path)
+    return rows
+
+def is_known_feedback(feedback, manifest):
+    """True if the manifest already has this feedback with the same date and attachments."""
+    entry = manifest["feedbacks"].get(str(feedback.get("id")))
+    if not entry:
+        return False
+    return (entry.get("date") == feedback.get("dateFeedback", "")
+            and entry.get("documents") == attachment_document_ids(feedback))
+
+def fetch_new_feedbacks(consultation, manifest, since=None):
+    """Fetch only feedbacks that are new or changed since the last sync.
+    
+    Pages are requested newest first and paging stops at the first page where
+    every submission is already in the manifest unchanged, or older than
+    `since`, or at the API's last page.
+    """
+    log = consultation.log
+    log("Fetching new or changed feedback submissions...")
+    changed = []
+    
+    for page in itertools.count():
+        if MAX_PAGES and page >= MAX_PAGES:
+            log(f"    ⚠️  Stopped at the {MAX_PAGES}-page cap (--max-pages); older new or changed submissions were not fetched")
             break
-        elif len(feedbacks) < page_size:
+        log(f"  Fetching page {page}...")
+        data = fetch_feedback_page(consultation.publication_id, page, sort=NEWEST_FIRST)
+        if data is None:
+            # Stopping here would stamp the sync and skip these submissions for good
+            log(f"    ❌ Page {page} failed after {MAX_RETRIES} retries")
+            raise PageFetchError(page)
+        if not data.get("content"):
             break
         
-        page += 1
-        time.sleep(1)
+        page_changed = []
+        for fb in data["content"]:
+            if since:
+                fb_date = parse_feedback_date(fb.get("dateFeedback", ""))
+                if fb_date and fb_date < since:
+                    continue
+            if not is_known_feedback(fb, manifest):
+                page_changed.append(fb)
+        
+        changed.extend(page_changed)
+        log(f"    {len(page_changed)} new/changed on this page, total: {len(changed)}")
         
-        if page > 100:
+        if not page_changed:
+            log("    Reached already-known submissions, stopping")
             break
+        if data.get("last") or ("totalPages" in data and page >= data["totalPages"] - 1):
+            break
+    
+    return changed
+
+def flatten_feedback(fb):
+    """Project a raw feedback onto the feedbacks.csv columns."""
+    return {
+        "id": fb.get("id"),
+        "date": fb.get("dateFeedback", ""),
+        "firstName": fb.get("firstName", ""),
+        "surname": fb.get("surname", ""),
+        "organization": fb.get("organization", ""),
+        "country": fb.get("country", ""),
+        "userType": fb.get("userType", ""),
+        "language": fb.get("language", ""),
+        "companySize": fb.get("companySize", ""),
+        "trNumber": fb.get("trNumber", ""),
+        "status": fb.get("status", ""),
+        "feedback_text": fb.get("feedback", "")[:1000],
+        "attachmentCount": len(fb.get("attachments", [])),
+        "reference": fb.get("referenceInitiative", "")
+    }
+
+FEEDBACK_CSV_FIELDS = sorted(flatten_feedback({}).keys())
+
+class FeedbackStreamWriter:
+    """Append feedbacks to feedbacks_raw.jsonl and feedbacks.csv as pages arrive.
+    
+    Both files are written under a .partial name and flushed after every page,
+    so a crash mid-fetch leaves every completed page on disk. close() moves
+    them into place.
+    """
+
+    def __init__(self, consultation):
+        self.jsonl_path = consultation.output_dir / "feedbacks_raw.jsonl"
+        self.csv_path = consultation.output_dir / "feedbacks.csv"
+        self.jsonl_partial = self.jsonl_path.with_name(self.jsonl_path.name + ".partial")
+        self.csv_partial = self.csv_path.with_name(self.csv_path.name + ".partial")
+        self.jsonl_file = open(self.jsonl_partial, 'w', encoding='utf-8')
+        self.csv_file = open(self.csv_partial, 'w', newline='', encoding='utf-8')
+        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=FEEDBACK_CSV_FIELDS, extrasaction='ignore')
+        self.csv_writer.writeheader()
+        self.count = 0
+
+    def write_page(self, feedbacks):
+        """Append one page (or any list) of raw feedbacks to both files."""
+        for fb in feedbacks:
+            self.jsonl_file.write(json.dumps(fb, ensure_ascii=False) + "\n")
+            self.csv_writer.writerow(flatten_feedback(fb))
+            self.count += 1
+        self.jsonl_file.flush()
+        self.csv_file.flush()
+
+    def close(self):
+        """Finish both files and move them over the previous versions."""
+        self.jsonl_file.close()
+        self.csv_file.close()
+        os.replace(self.jsonl_partial, self.jsonl_path)
+        os.replace(self.csv_partial, self.csv_path)
+
+    def abort(self):
+        """Close without replacing the previous files; partial pages stay on disk."""
+        self.jsonl_file.close()
+        self.csv_file.close()
+
+def iter_feedbacks(consultation):
+    """Stream raw feedbacks from feedbacks_raw.jsonl (or a legacy feedbacks_raw.json)."""
+    jsonl_path = consultation.output_dir / "feedbacks_raw.jsonl"
+    if jsonl_path.exists():
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    
+    legacy_path = consultation.output_dir / "feedbacks_raw.json"
+    if legacy_path.exists():
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+def merge_feedbacks(consultation, changed, writer):
+    """Stream existing feedbacks into `writer` with changed ones merged in.
+    
+    Feedbacks not seen before go first (newest additions first); existing
+    ones keep their order, replaced by their new version if they changed.
+    """
+    changed_by_id = {str(fb.get("id")): fb for fb in changed}
+    existing_ids = {str(fb.get("id")) for fb in iter_feedbacks(consultation)}
+    
+    writer.write_page([fb for fb in changed if str(fb.get("id")) not in existing_ids])
+    page = []
+    for fb in iter_feedbacks(consultation):
+        page.append(changed_by_id.get(str(fb.get("id")), fb))
+        if len(page) >= PAGE_SIZE:
+            writer.write_page(page)
+            page = []
+    writer.write_page(page)
+    return writer.count
+
+def export_feedbacks_json(consultation):
+    """Write feedbacks_raw.json as a JSON array, streamed from the JSONL store."""
+    path = consultation.output_dir / "feedbacks_raw.json"
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for i, fb in enumerate(iter_feedbacks(consultation)):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(fb, indent=2, ensure_ascii=False))
+        f.write("\n]\n")
+    os.replace(temp_path, path)
+
+def load_existing_attachment_records(consultation):
+    """Load attachments.csv rows from a previous run, keyed by attachment ID."""
+    csv_path = consultation.output_dir / "attachments.csv"
+    records = {}
+    if csv_path.exists():
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                records[str(row.get("attachment_id"))] = row
+    return records
+
+def load_attachment_store(consultation):
+    """Load the attachment store manifest into memory.
+    
+    Entries committed to the download manifest after the store was last
+    saved (e.g. by a run that crashed) are filled in from there.
+    """
+    if consultation.store_manifest_file.exists():
+        with open(consultation.store_manifest_file, 'r', encoding='utf-8') as f:
+            consultation.store = json.load(f)
+    else:
+        consultation.store = {}
+    if consultation.manifest:
+        for att_id, entry in consultation.manifest.store_entries().items():
+            consultation.store.setdefault(att_id, entry)
+    return consultation.store
+
+def save_attachment_store(consultation):
+    """Write the attachment store manifest atomically."""
+    with consultation.store_lock:
+        snapshot = dict(consultation.store)
+    temp_path = consultation.store_manifest_file.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, consultation.store_manifest_file)
+
+def hash_file(filepath):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def blob_path(consultation, sha256):
+    """Location of a blob in the content-addressed store."""
+    return consultation.blobs_dir / sha256[:2] / sha256
+
+def link_blob(blob, filepath):
+    """Expose a blob under its readable attachment name (hard link, else copy)."""
+    if filepath.exists():
+        filepath.unlink()
+    try:
+        os.link(blob, filepath)
+    except OSError:
+        shutil.copy2(blob, filepath)
+
+def store_attachment(consultation, filepath, att_id, file_type):
+    """Move a verified file into the blob store and record it in the manifest.
     
-    return all_feedbacks
+    Returns True if an identical blob was already stored (a duplicate upload).
+    """
+    sha256 = hash_file(filepath)
+    blob = blob_path(consultation, sha256)
+    size = os.path.getsize(filepath)
+    
+    with consultation.store_lock:
+        duplicate = blob.exists()
+        if duplicate:
+            filepath.unlink()
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(filepath, blob)
+        consultation.store[str(att_id)] = {
+            "sha256": sha256,
+            "size": size,
+            "type": file_type,
+            "filename": filepath.name,
+        }
+    
+    link_blob(blob, filepath)
+    return duplicate
 
-def download_attachment_file(attachment, feedback_id, index, total):
+def download_attachment_file(consultation, attachment, feedback_id, index, total):
     """Download a single attachment file with correct extension."""
     att_id = attachment.get("id")
     doc_id = attachment.get("documentId")
     original_filename = attachment.get("fileName", f"{att_id}.pdf")
     
     if not doc_id:
-        log_message(f"  [{index}/{total}] ✗ No documentId for attachment {att_id}")
-        return "failed", original_filename, None
+        consultation.log(f"  [{index}/{total}] ✗ No documentId for attachment {att_id}")
+        consultation.manifest.record_attempt(attachment, "failed", error="No documentId")
+        return "failed", original_filename, "No documentId"
     
     # Preserve original extension
     original_path = Path(original_filename)
@@ -196,89 +1013,137 @@ def download_attachment_file(attachment, feedback_id, index, total):
     else:
         filename = f"{base_name}{extension}"
     
-    filepath = ATTACHMENTS_DIR / filename
+    filepath = consultation.attachments_dir / filename
+    
+    # Already in the blob store: a manifest lookup, no need to open the file
+    entry = consultation.store.get(str(att_id))
+    if entry and blob_path(consultation, entry["sha256"]).exists():
+        if not filepath.exists():
+            link_blob(blob_path(consultation, entry["sha256"]), filepath)
+        consultation.log(f"  [{index}/{total}] ⏭️  Skipping (exists, {entry['type']}): {filename}")
+        consultation.manifest.record_attempt(attachment, "exists", 0, entry["sha256"], entry["type"])
+        return "exists", filename, entry["type"]
     
-    # Check if already exists and is valid
+    # Check if a file from before the blob store exists and is valid
     if filepath.exists():
         file_size = os.path.getsize(filepath)
         if file_size > 1000:  # At least 1KB
             # Verify it's a valid file
             with open(filepath, 'rb') as f:
-                first_bytes = f.read(20)
+                first_bytes = f.read(file_types.HEADER_SIZE)
             
-            detected = detect_file_type(first_bytes)
+            detected = detect_file_type(first_bytes, filepath.name, filepath)
             if detected:
-                log_message(f"  [{index}/{total}] ⏭️  Skipping (exists, {detected}): {filename}")
+                store_attachment(consultation, filepath, att_id, detected)
+                consultation.log(f"  [{index}/{total}] ⏭️  Skipping (exists, {detected}): {filename}")
+                consultation.manifest.record_attempt(
+                    attachment, "exists", 0, consultation.store[str(att_id)]["sha256"], detected
+                )
                 return "exists", filename, detected
             else:
-                log_message(f"  [{index}/{total}] 🔄 Re-downloading (corrupted): {filename}")
+                consultation.log(f"  [{index}/{total}] 🔄 Re-downloading (corrupted): {filename}")
                 os.remove(filepath)
         else:
-            log_message(f"  [{index}/{total}] 🔄 Re-downloading (too small): {filename}")
+            consultation.log(f"  [{index}/{total}] 🔄 Re-downloading (too small): {filename}")
             os.remove(filepath)
     
     # Download using documentId
     download_url = f"{BASE_URL}{DOWNLOAD_ENDPOINT}{doc_id}"
     
-    success, result = download_file(download_url, filepath, extension)
+    # Transfers that break mid-stream are retried, resuming from the partial file;
+    # every transfer gets its own row in the manifest's download_attempts
+    for attempt in range(MAX_RETRIES + 1):
+        started = time.monotonic()
+        success, result, written = download_file(download_url, filepath, consultation.partial_dir)
+        latency_ms = round((time.monotonic() - started) * 1000, 1)
+        if success or not result.startswith(INTERRUPTED) or attempt == MAX_RETRIES:
+            break
+        consultation.manifest.record_attempt(attachment, "interrupted", written, latency_ms=latency_ms, error=result)
+        consultation.log(f"  [{index}/{total}] ↻ Resuming {filename} after: {result}")
+        time.sleep(backoff_delay(attempt))
     
     if success:
         file_size = os.path.getsize(filepath)
         if file_size > 1000:
-            log_message(f"  [{index}/{total}] ✓ Downloaded: {filename} ({result}, {file_size:,} bytes)")
+            duplicate = store_attachment(consultation, filepath, att_id, result)
+            consultation.manifest.record_attempt(
+                attachment, "downloaded", written, consultation.store[str(att_id)]["sha256"], result, latency_ms
+            )
+            note = ", duplicate content" if duplicate else ""
+            consultation.log(f"  [{index}/{total}] ✓ Downloaded: {filename} ({result}, {file_size:,} bytes{note})")
             return "downloaded", filename, result
         else:
-            log_message(f"  [{index}/{total}] ✗ File too small: {filename} ({file_size} bytes)")
+            consultation.log(f"  [{index}/{total}] ✗ File too small: {filename} ({file_size} bytes)")
             if os.path.exists(filepath):
                 os.remove(filepath)
+            consultation.manifest.record_attempt(
+                attachment, "failed", written, latency_ms=latency_ms, error=f"File too small ({file_size} bytes)"
+            )
             return "failed", filename, "too_small"
     
-    log_message(f"  [{index}/{total}] ✗ Failed: {filename} ({result})")
+    status = "interrupted" if result.startswith(INTERRUPTED) else "failed"
+    consultation.manifest.record_attempt(attachment, status, written, latency_ms=latency_ms, error=result)
+    consultation.log(f"  [{index}/{total}] ✗ Failed: {filename} ({result})")
     return "failed", filename, result
 
-def download_attachments(feedbacks):
-    """Download all attachments from feedbacks."""
-    log_message("\nDownloading attachments...")
+def download_and_record(consultation, attachment, feedback_id, index, total):
+    """Download one attachment and commit its final state to the manifest straight away.
     
-    attachment_records = []
-    stats = {"downloaded": 0, "exists": 0, "failed": 0}
-    file_type_counts = {}
+    The individual attempts are recorded by download_attachment_file() as they happen.
+    """
+    status, filename, file_type = download_attachment_file(consultation, attachment, feedback_id, index, total)
+    entry = consultation.store.get(str(attachment.get("id")), {}) if status != "failed" else {}
+    consultation.manifest.record_download(
+        feedback_id, attachment, status, filename, file_type, entry.get("sha256"), entry.get("size"),
+    )
+    return status, filename, file_type
+
+def submit_attachment_downloads(consultation, feedbacks, executor, skip_documents=None):
+    """Queue every attachment of a consultation on the shared download executor.
     
-    total_attachments = sum(len(fb.get("attachments", [])) for fb in feedbacks)
-    log_message(f"  Total attachments to download: {total_attachments}")
+    Attachments whose documentId is in `skip_documents` (already fetched in a
+    previous sync) are left out entirely. Returns the futures, in feedback
+    order, for collect_attachment_downloads().
+    """
+    skip_documents = skip_documents or set()
     
-    current = 0
+    # Flatten into (feedback_id, attachment) jobs so results keep feedback order
+    jobs = []
     for feedback in feedbacks:
         feedback_id = feedback.get("id")
-        attachments = feedback.get("attachments", [])
+        for attachment in feedback.get("attachments", []):
+            if str(attachment.get("documentId")) in skip_documents:
+                continue
+            jobs.append((feedback_id, attachment))
+    
+    total_attachments = len(jobs)
+    consultation.log(f"  Attachments to download: {total_attachments}")
+    
+    futures = [
+        executor.submit(download_and_record, consultation, attachment, feedback_id, index, total_attachments)
+        for index, (feedback_id, attachment) in enumerate(jobs, 1)
+    ]
+    return futures
+
+def collect_attachment_downloads(consultation, futures):
+    """Wait for a consultation's queued downloads and tally the outcomes.
+    
+    Each outcome is already committed to the download manifest by its worker.
+    Returns (stats, file_type_counts).
+    """
+    stats = {"downloaded": 0, "exists": 0, "failed": 0}
+    file_type_counts = {}
+    
+    outcomes = [future.result() for future in futures]
+    save_attachment_store(consultation)
+    
+    for status, filename, file_type in outcomes:
+        stats[status] += 1
         
-        for attachment in attachments:
-            current += 1
-            status, filename, file_type = download_attachment_file(
-                attachment, feedback_id, current, total_attachments
-            )
-            
-            stats[status] += 1
-            
-            if file_type and file_type != "too_small":
-                file_type_counts[file_type] = file_type_counts.get(file_type, 0) + 1
-            
-            attachment_records.append({
-                "feedback_id": feedback_id,
-                "attachment_id": attachment.get("id"),
-                "document_id": attachment.get("documentId"),
-                "filename": filename,
-                "original_filename": attachment.get("fileName"),
-                "detected_type": file_type,
-                "pages": attachment.get("pages"),
-                "size_bytes": attachment.get("size"),
-                "status": status
-            })
-            
-            if status == "downloaded":
-                time.sleep(0.5)
+        if status != "failed" and file_type:
+            file_type_counts[file_type] = file_type_counts.get(file_type, 0) + 1
     
-    return attachment_records, stats, file_type_counts
+    return stats, file_type_counts
 
 def save_to_csv(data, filepath):
     """Save data to CSV file."""
@@ -305,108 +1170,261 @@ def save_to_csv(data, filepath):
                         clean_row[k] = v
                 writer.writerow(clean_row)
 
-def main():
-    """Main execution function."""
-    log_message("=" * 70)
-    log_message("Digital Omnibus Downloader - FIXED VERSION")
-    log_message("Handles PDF, DOCX, and other file formats")
-    log_message(f"Publication ID: {PUBLICATION_ID}")
-    log_message(f"Output directory: {OUTPUT_DIR}")
-    log_message("=" * 70)
+def read_publication_ids(args):
+    """Collect publication IDs from the command line and any --ids-file."""
+    ids = list(args.publication_ids)
+    if args.ids_file:
+        with open(args.ids_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    ids.append(line)
     
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    ATTACHMENTS_DIR.mkdir(exist_ok=True)
+    # Drop duplicates but keep the order given
+    ids = list(dict.fromkeys(ids))
+    return ids or DEFAULT_PUBLICATION_IDS
+
+def parse_args():
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="Download Have Your Say consultation responses.")
+    parser.add_argument("publication_ids", nargs="*", metavar="PUBLICATION_ID",
+                        help=f"Consultation publication IDs (default: {' '.join(DEFAULT_PUBLICATION_IDS)})")
+    parser.add_argument("--ids-file", metavar="FILE",
+                        help="File with one publication ID per line (# starts a comment)")
+    parser.add_argument("--output-root", default=".", metavar="DIR",
+                        help="Directory that holds the per-consultation output folders (default: .)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help=f"Parallel attachment downloads (default: {MAX_WORKERS})")
+    parser.add_argument("--page-workers", type=int, default=PAGE_WORKERS,
+                        help=f"Parallel feedback page fetches (default: {PAGE_WORKERS})")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND,
+                        help=f"Starting requests per second across all workers; 0 disables limiting (default: {REQUESTS_PER_SECOND})")
+    parser.add_argument("--max-rate", type=float, default=MAX_REQUESTS_PER_SECOND,
+                        help=f"Ceiling the rate may ramp up to while responses are healthy (default: {MAX_REQUESTS_PER_SECOND})")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES, metavar="N",
+                        help=f"Fetch at most N feedback pages of {PAGE_SIZE}, with a warning if more exist (default: all)")
+    parser.add_argument("--base-url", default=BASE_URL, metavar="URL",
+                        help="API root to talk to, e.g. a local mock_ec_api.py (default: %(default)s)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch feedbacks and attachments not already in the sync manifest")
+    parser.add_argument("--since", metavar="DATE",
+                        help="Ignore feedbacks submitted before DATE (YYYY-MM-DD); implies --incremental")
+    return parser.parse_args()
+
+def fetch_consultation(consultation, page_executor, incremental=False, since=None):
+    """Fetch a consultation's feedback metadata into feedbacks_raw.jsonl and feedbacks.csv.
     
-    # Fetch all feedbacks
-    feedbacks = fetch_all_feedbacks()
-    log_message(f"\n✓ Total feedbacks fetched: {len(feedbacks)}")
+    Returns (feedback_count, skip_documents).
+    """
+    log = consultation.log
     
-    if not feedbacks:
-        log_message("\n❌ No feedbacks found.")
-        return
+    consultation.output_dir.mkdir(parents=True, exist_ok=True)
+    consultation.attachments_dir.mkdir(exist_ok=True)
+    consultation.blobs_dir.mkdir(exist_ok=True)
+    open_manifest(consultation)
+    load_attachment_store(consultation)
     
-    # Save metadata
-    log_message("\nSaving feedback metadata...")
-    
-    with open(OUTPUT_DIR / "feedbacks_raw.json", "w", encoding="utf-8") as f:
-        json.dump(feedbacks, f, indent=2, ensure_ascii=False)
-    log_message(f"  ✓ Saved raw JSON")
-    
-    flat_feedbacks = []
-    for fb in feedbacks:
-        flat = {
-            "id": fb.get("id"),
-            "date": fb.get("dateFeedback", ""),
-            "firstName": fb.get("firstName", ""),
-            "surname": fb.get("surname", ""),
-            "organization": fb.get("organization", ""),
-            "country": fb.get("country", ""),
-            "userType": fb.get("userType", ""),
-            "language": fb.get("language", ""),
-            "companySize": fb.get("companySize", ""),
-            "trNumber": fb.get("trNumber", ""),
-            "status": fb.get("status", ""),
-            "feedback_text": fb.get("feedback", "")[:1000],
-            "attachmentCount": len(fb.get("attachments", [])),
-            "reference": fb.get("referenceInitiative", "")
-        }
-        flat_feedbacks.append(flat)
+    writer = FeedbackStreamWriter(consultation)
+    try:
+        if incremental:
+            # Only fetch what changed since the last sync, then merge into the local copy
+            manifest = load_manifest(consultation)
+            log(f"Last sync: {manifest.get('last_sync') or 'never'} ({len(manifest['feedbacks'])} known feedbacks)")
+            changed = fetch_new_feedbacks(consultation, manifest, since)
+            log(f"\n✓ New or changed feedbacks: {len(changed)}")
+            count = merge_feedbacks(consultation, changed, writer)
+            skip_documents = set(manifest.get("downloaded_documents", []))
+        else:
+            count = fetch_all_feedbacks(consultation, page_executor, writer)
+            log(f"\n✓ Total feedbacks fetched: {count}")
+            skip_documents = set()
+    except BaseException:
+        writer.abort()
+        log(f"  ⚠️  Fetch interrupted; completed pages kept in {writer.jsonl_partial.name}")
+        raise
+    
+    if not count:
+        writer.abort()
+        log("\n❌ No feedbacks found.")
+        return count, skip_documents
+    
+    writer.close()
+    consultation.manifest.replace_feedbacks(iter_feedbacks(consultation))
+    log(f"  ✓ Saved feedbacks_raw.jsonl and feedbacks.csv")
+    export_feedbacks_json(consultation)
+    log(f"  ✓ Exported feedbacks_raw.json")
+    
+    return count, skip_documents
+
+def finish_consultation(consultation, feedback_count, stats, file_type_counts):
+    """Export attachments.csv, stamp the manifest, write statistics; return a summary."""
+    log = consultation.log
+    output_dir = consultation.output_dir
     
-    save_to_csv(flat_feedbacks, OUTPUT_DIR / "feedbacks.csv")
-    log_message(f"  ✓ Saved feedbacks.csv")
+    # The manifest also holds attachments skipped this run, so the export is always complete
+    attachment_records = export_attachments_csv(consultation)
+    log(f"  ✓ Exported attachments.csv")
     
-    # Download attachments
-    attachment_records, stats, file_types = download_attachments(feedbacks)
-    save_to_csv(attachment_records, OUTPUT_DIR / "attachments.csv")
-    log_message(f"  ✓ Saved attachments.csv")
+    last_sync = save_manifest(consultation)
+    consultation.manifest.close()
+    log(f"  ✓ Updated {consultation.manifest_file.name}")
     
     # Generate statistics
-    log_message("\nGenerating statistics...")
+    log("\nGenerating statistics...")
     
     country_stats = {}
-    for fb in feedbacks:
+    usertype_stats = {}
+    for fb in iter_feedbacks(consultation):
         country = fb.get("country", "Unknown")
         country_stats[country] = country_stats.get(country, 0) + 1
-    
-    country_list = [{"country": k, "count": v} for k, v in sorted(country_stats.items(), key=lambda x: x[1], reverse=True)]
-    save_to_csv(country_list, OUTPUT_DIR / "countries.csv")
-    log_message(f"  ✓ Country statistics")
-    
-    usertype_stats = {}
-    for fb in feedbacks:
         utype = fb.get("userType", "Unknown")
         usertype_stats[utype] = usertype_stats.get(utype, 0) + 1
     
+    country_list = [{"country": k, "count": v} for k, v in sorted(country_stats.items(), key=lambda x: x[1], reverse=True)]
+    save_to_csv(country_list, output_dir / "countries.csv")
+    log(f"  ✓ Country statistics")
+    
     usertype_list = [{"userType": k, "count": v} for k, v in sorted(usertype_stats.items(), key=lambda x: x[1], reverse=True)]
-    save_to_csv(usertype_list, OUTPUT_DIR / "user_types.csv")
-    log_message(f"  ✓ User type statistics")
+    save_to_csv(usertype_list, output_dir / "user_types.csv")
+    log(f"  ✓ User type statistics")
     
     # Summary
-    log_message("\n" + "=" * 70)
-    log_message("DOWNLOAD COMPLETE!")
-    log_message("=" * 70)
-    log_message(f"Total feedback submissions: {len(feedbacks)}")
-    log_message(f"Total attachments: {len(attachment_records)}")
-    log_message(f"  Downloaded: {stats['downloaded']}")
-    log_message(f"  Already existed: {stats['exists']}")
-    log_message(f"  Failed: {stats['failed']}")
-    
-    log_message(f"\nFile types:")
-    for ftype, count in sorted(file_types.items(), key=lambda x: x[1], reverse=True):
-        log_message(f"  {ftype.upper()}: {count}")
-    
-    log_message(f"\nOutput directory: {OUTPUT_DIR.absolute()}")
-    log_message("\nFiles created:")
-    log_message(f"  📊 feedbacks.csv       - {len(feedbacks)} submissions")
-    log_message(f"  📄 feedbacks_raw.json  - Complete JSON data")
-    log_message(f"  📎 attachments.csv     - {len(attachment_records)} attachments")
-    log_message(f"  🌍 countries.csv       - By country")
-    log_message(f"  👥 user_types.csv      - By stakeholder type")
-    log_message(f"  📁 attachments/        - {stats['downloaded'] + stats['exists']} files")
+    log("\n" + "=" * 70)
+    log("DOWNLOAD COMPLETE!")
+    log("=" * 70)
+    log(f"Total feedback submissions: {feedback_count}")
+    log(f"Total attachments: {len(attachment_records)}")
+    log(f"  Downloaded: {stats['downloaded']}")
+    log(f"  Already existed: {stats['exists']}")
+    log(f"  Failed: {stats['failed']}")
+    
+    log(f"\nFile types:")
+    for ftype, count in sorted(file_type_counts.items(), key=lambda x: x[1], reverse=True):
+        log(f"  {ftype.upper()}: {count}")
+    
+    unique_blobs = len({e["sha256"] for e in consultation.store.values()})
+    log(f"\nOutput directory: {output_dir.absolute()}")
+    log("\nFiles created:")
+    log(f"  📊 feedbacks.csv       - {feedback_count} submissions")
+    log(f"  📄 feedbacks_raw.jsonl - Complete JSON data, one feedback per line")
+    log(f"  📄 feedbacks_raw.json  - Same data as a JSON array")
+    log(f"  📎 attachments.csv     - {len(attachment_records)} attachments")
+    log(f"  🗃️  {consultation.manifest_file.name} - Per-file status, hashes and download attempts")
+    log(f"  🌍 countries.csv       - By country")
+    log(f"  👥 user_types.csv      - By stakeholder type")
+    log(f"  📁 attachments/        - {stats['downloaded'] + stats['exists']} files")
+    log(f"  🗄️  blobs/              - {unique_blobs} unique files (SHA-256)")
     
     if stats['failed'] > 0:
-        log_message(f"\n⚠️  {stats['failed']} attachments failed")
-        log_message("   Check attachments.csv for details")
+        log(f"\n⚠️  {stats['failed']} attachments failed")
+        log("   Check attachments.csv for details")
+    
+    return {
+        "publication_id": consultation.publication_id,
+        "output_dir": str(output_dir),
+        "last_sync": last_sync,
+        "feedbacks": feedback_count,
+        "attachments": len(attachment_records),
+        "unique_blobs": unique_blobs,
+        "downloaded": stats["downloaded"],
+        "exists": stats["exists"],
+        "failed": stats["failed"],
+    }
+
+def save_combined_manifest(output_root, summaries):
+    """Write one manifest summarising every consultation in a batch run."""
+    path = Path(output_root) / COMBINED_MANIFEST_FILE
+    combined = {}
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            combined = json.load(f)
+    for summary in summaries:
+        combined[summary["publication_id"]] = summary
+    
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(combined, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+    return path
+
+def main():
+    """Main execution function."""
+    global BASE_URL, MAX_WORKERS, PAGE_WORKERS, MAX_PAGES, REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND, rate_limiter
+    
+    args = parse_args()
+    BASE_URL = args.base_url if args.base_url.endswith("/") else args.base_url + "/"
+    MAX_WORKERS = max(1, args.workers)
+    PAGE_WORKERS = max(1, args.page_workers)
+    MAX_PAGES = args.max_pages
+    REQUESTS_PER_SECOND = args.rate
+    MAX_REQUESTS_PER_SECOND = args.max_rate
+    rate_limiter = AdaptiveRateLimiter(REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND)
+    
+    since = None
+    if args.since:
+        since = parse_feedback_date(args.since)
+        if not since:
+            log_message(f"❌ Could not parse --since date: {args.since}")
+            return
+    incremental = args.incremental or since is not None
+    
+    consultations = [Consultation(pid, args.output_root) for pid in read_publication_ids(args)]
+    batch = len(consultations) > 1
+    if batch:
+        for consultation in consultations:
+            consultation.log_prefix = f"[{consultation.publication_id}] "
+    
+    log_message("=" * 70)
+    log_message("Digital Omnibus Downloader - FIXED VERSION")
+    log_message("Handles PDF, DOCX, and other file formats")
+    log_message(f"API: {BASE_URL}")
+    for consultation in consultations:
+        log_message(f"Publication ID: {consultation.publication_id} -> {consultation.output_dir}")
+    if incremental:
+        log_message("Mode: incremental" + (f" (since {since:%Y-%m-%d})" if since else ""))
+    log_message("=" * 70)
+    
+    # One session, one rate limiter and two worker pools shared by every consultation
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as page_executor, \
+         ThreadPoolExecutor(max_workers=MAX_WORKERS) as download_executor:
+        
+        # Fetch metadata, queueing each consultation's attachments as soon as
+        # its feedback list is known so downloads overlap with later fetches
+        pending = []
+        for consultation in consultations:
+            try:
+                count, skip_documents = fetch_consultation(consultation, page_executor, incremental, since)
+            except PageFetchError as e:
+                consultation.log(f"\n❌ {e}; {consultation.publication_id} skipped, previous feedbacks "
+                                 f"and manifest left unchanged")
+                consultation.manifest.close()
+                continue
+            if not count:
+                consultation.manifest.close()
+                continue
+            consultation.log("\nQueueing attachment downloads...")
+            futures = submit_attachment_downloads(
+                consultation, iter_feedbacks(consultation), download_executor, skip_documents
+            )
+            pending.append((consultation, count, futures))
+        
+        summaries = []
+        for consultation, count, futures in pending:
+            stats, file_type_counts = collect_attachment_downloads(consultation, futures)
+            summaries.append(finish_consultation(consultation, count, stats, file_type_counts))
+    
+    log_message(f"\nRequest rate settled at {rate_limiter.rate:.2f} req/s "
+                f"({rate_limiter.throttled} throttled responses)")
+    
+    if batch and summaries:
+        path = save_combined_manifest(args.output_root, summaries)
+        log_message("\n" + "=" * 70)
+        log_message(f"ALL CONSULTATIONS COMPLETE ({len(summaries)} of {len(consultations)})")
+        log_message("=" * 70)
+        for summary in summaries:
+            log_message(f"  {summary['publication_id']}: {summary['feedbacks']} feedbacks, "
+                        f"{summary['attachments']} attachments, {summary['failed']} failed")
+        log_message(f"  📒 Combined manifest: {path}")
     
     log_message("\n✨ All files should now work correctly (PDF, DOCX, etc.)!")
 
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Persistent, memory-mapped store of text embeddings.
+
+Encoding the corpus is by far the slowest step of semantic_analysis.py, and
+most re-runs (new clustering parameters, a few new responses) change few or
+no texts. Vectors are therefore kept on disk per (model name, model
+revision, dtype), one directory each under embedding_cache/. The revision is
+the Hub commit of the model files, or a fingerprint of them for local models
+(see cached_model_revision and loaded_model_revision):
+
+- vectors.bin: the vectors as a raw row-major float32 or float16 array,
+  appended to as texts are encoded and opened with numpy.memmap, so loading
+  even 100k vectors maps the file rather than copying it.
+- index.json: normalised text hash -> row, plus feedback ID -> text hash for
+  the last run that embedded whole texts, so other scripts can fetch a
+  response's vector by ID. Chunks of long documents are stored the same
+  way, keyed by the chunk's text.
+
+Texts are keyed by the SHA-256 of their whitespace-normalised form, so the
+same text under another ID (or re-extracted with different line breaks) is
+not encoded twice. Rows are only added, never rewritten; the index is
+written after the vectors, so an interrupted run loses at most its own
+unindexed rows.
+"""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR_NAME = "embedding_cache"
+STORE_VERSION = 1
+
+def text_hash(text):
+    """SHA-256 of a text with runs of whitespace collapsed."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+COMMIT_HASH = re.compile(r'[0-9a-f]{40}')
+FINGERPRINT_CONTENT_LIMIT = 1024 * 1024  # Files up to this size are hashed whole; larger ones by size and mtime
+
+def hub_cache_dirs():
+    """Where Hugging Face hub snapshots may live, honouring the usual environment variables."""
+    home = os.environ.get("HF_HOME") or Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "huggingface"
+    dirs = [os.environ.get("HF_HUB_CACHE"), os.environ.get("HUGGINGFACE_HUB_CACHE"), Path(home) / "hub"]
+    return [Path(d) for d in dirs if d]
+
+def directory_fingerprint(path):
+    """Fingerprint of a model directory: small files by content, weights by name, size and mtime."""
+    digest = hashlib.sha256()
+    for file in sorted(p for p in Path(path).rglob("*") if p.is_file()):
+        stat = file.stat()
+        digest.update(str(file.relative_to(path)).encode("utf-8"))
+        if stat.st_size <= FINGERPRINT_CONTENT_LIMIT:
+            digest.update(file.read_bytes())
+        else:
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return "local-" + digest.hexdigest()[:16]
+
+def cached_model_revision(model_name, revision=None):
+    """A key for the exact model files that will be loaded, found without loading the model, or None.
+
+    - a local model directory: a fingerprint of its files;
+    - a pinned commit hash: the hash itself;
+    - a Hub model: the commit its ref (`revision`, default "main") points
+      to in the local hub cache;
+    - a model in the legacy sentence-transformers cache: a fingerprint.
+    """
+    if Path(model_name).is_dir():
+        return directory_fingerprint(model_name)
+    if revision and COMMIT_HASH.fullmatch(revision):
+        return revision
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    for hub in hub_cache_dirs():
+        ref = hub / f"models--{repo.replace('/', '--')}" / "refs" / (revision or "main")
+        try:
+            commit = ref.read_text().strip()
+        except OSError:
+            continue
+        if commit:
+            return commit
+    legacy_home = os.environ.get("SENTENCE_TRANSFORMERS_HOME") or Path.home() / ".cache" / "torch" / "sentence_transformers"
+    legacy = Path(legacy_home) / repo.replace("/", "_")
+    if not revision and legacy.is_dir():
+        return directory_fingerprint(legacy)
+    return None
+
+def loaded_model_revision(model):
+    """A key for a loaded SentenceTransformer: its Hub commit, else a fingerprint of its files or weights."""
+    config = getattr(getattr(model[0], "auto_model", None), "config", None)
+    commit = getattr(config, "_commit_hash", None)
+    if commit:
+        return commit
+    path = getattr(config, "name_or_path", "")
+    if path and Path(path).is_dir():
+        return directory_fingerprint(path)
+    # Last resort: parameter names, shapes and the first values of every tensor
+    digest = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        digest.update(f"{name}{tuple(tensor.shape)}".encode("utf-8"))
+        digest.update(tensor.detach().flatten()[:64].float().cpu().numpy().tobytes())
+    return "weights-" + digest.hexdigest()[:16]
+
+class EmbeddingStore:
+    """Vectors for one (model, revision, dtype), addressed by text hash."""
+
+    def __init__(self, cache_dir, model_name, revision, dtype="float32"):
+        if not revision:
+            raise ValueError(f"no revision for {model_name}; vectors from different models would be mixed")
+        slug = re.sub(r'[^A-Za-z0-9._-]+', '_', Path(model_name).name if Path(model_name).is_dir() else model_name)
+        self.dir = Path(cache_dir) / f"{slug}@{revision[:24]}.{dtype}"
+        self.vectors_path = self.dir / "vectors.bin"
+        self.index_path = self.dir / "index.json"
+        self.model_name = model_name
+        self.revision = revision
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.rows = {}  # text hash -> row
+        self.ids = {}  # feedback ID -> text hash
+        self.mapped = None  # memmap of vectors.bin, reopened after each add()
+        self.load_index()
+
+    def load_index(self):
+        if not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != STORE_VERSION or index.get("dtype") != self.dtype.name:
+            return
+        self.dim = index["dim"]
+        # Rows past the end of the vector file (an interrupted write) are dropped
+        written = self.vectors_path.stat().st_size // self.row_bytes if self.vectors_path.exists() else 0
+        self.rows = {h: row for h, row in index["rows"].items() if row < written}
+        self.ids = {fid: h for fid, h in index.get("ids", {}).items() if h in self.rows}
+
+    @property
+    def row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, hash_):
+        return hash_ in self.rows
+
+    def missing(self, hashes):
+        """The hashes (in order, without repeats) that have no vector yet."""
+        return list(dict.fromkeys(h for h in hashes if h not in self.rows))
+
+    def add(self, hashes, vectors):
+        """Append vectors for `hashes` (rows of a 2-D array) and update the index."""
+        vectors = np.asarray(vectors)
+        if not len(hashes):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"store holds {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+        self.dir.mkdir(parents=True, exist_ok=True)
+        start = self.vectors_path.stat().st_size // self.row_bytes if self.vectors_path.exists() else 0
+        with open(self.vectors_path, 'r+b' if self.vectors_path.exists() else 'wb') as f:
+            f.seek(start * self.row_bytes)
+            f.truncate()  # Drop any partial row from an interrupted write
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        for offset, hash_ in enumerate(hashes):
+            self.rows[hash_] = start + offset
+        self.mapped = None
+        self.save_index()
+
+    def vectors(self):
+        """All stored vectors as a read-only memmap (rows as in the index)."""
+        if not self.rows:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        if self.mapped is None:
+            count = self.vectors_path.stat().st_size // self.row_bytes
+            self.mapped = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(count, self.dim))
+        return self.mapped
+
+    def get(self, hashes):
+        """Vectors for `hashes` as a float32 array, in order; every hash must be stored."""
+        rows = [self.rows[h] for h in hashes]
+        return np.asarray(self.vectors()[rows], dtype=np.float32)
+
+    def set_ids(self, ids, hashes):
+        """Record which text each feedback ID had in the latest run."""
+        self.ids = dict(zip(ids, hashes))
+        self.save_index()
+
+    def get_id(self, fid):
+        """The vector of a feedback ID from the latest run, or None."""
+        hash_ = self.ids.get(str(fid))
+        return self.get([hash_])[0] if hash_ else None
+
+    def save_index(self):
+        index = {
+            "version": STORE_VERSION,
+            "model": self.model_name,
+            "revision": self.revision,
+            "dtype": self.dtype.name,
+            "dim": self.dim,
+            "rows": self.rows,
+            "ids": self.ids,
+        }
+        temp_path = self.index_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(temp_path, self.index_path)
@@ -2,8 +2,10 @@
 """
 Step 1: Extract text from all Digital Omnibus consultation responses.
 
-This script extracts text from PDFs, DOCXs, and the feedback_text column,
-saving everything to a JSON file for subsequent analysis.
+This script extracts text from PDFs, Word documents (DOCX and legacy DOC),
+RTF and ODT attachments, and the full feedback text from feedbacks_raw.jsonl,
+saving everything to extracted_texts.jsonl (plus an offset index and the
+extracted_texts.json compatibility export) for subsequent analysis.
 
 Run this first, then run semantic_analysis.py
 """
@@ -13,6 +15,8 @@ import sys
 import json
 import csv
 import re
+import argparse
+from collections import Counter
 from pathlib import Path
 from datetime import datetime
 
@@ -30,59 +34,57 @@ def check_deps():
 
 check_deps()
 
-import pdfplumber
-from docx import Document
+from text_store import (
+    TEXTS_JSONL_NAME, PageStoreWriter, TextStoreWriter, entry_pages, export_json, feedbacks_source, iter_feedbacks,
+)
+from text_normalization import clean_pages, clean_text, shared_boilerplate
+from text_extraction import (
+    CACHE_DIR_NAME, EXTRACTION_TIMEOUT, MAX_EXTRACTION_MEMORY_MB, PDF_BACKENDS, QUARANTINE_FILE_NAME,
+    ExtractionCache, ExtractionSupervisor, extractor_for, extractor_spec, load_quarantine, needs_ocr,
+    ocr_available, save_quarantine,
+)
+from file_types import PDF, hash_and_sniff, sniff_file
+from language_id import detect_language, identifier_name
 
 # Configuration
 DATA_DIR = Path("20401_digital_omnibus")
 ATTACHMENTS_DIR = DATA_DIR / "attachments"
 FEEDBACKS_CSV = DATA_DIR / "feedbacks.csv"
-OUTPUT_FILE = DATA_DIR / "extracted_texts.json"
+ATTACHMENTS_CSV = DATA_DIR / "attachments.csv"
+OUTPUT_FILE = DATA_DIR / TEXTS_JSONL_NAME
+STORE_MANIFEST_FILE = DATA_DIR / "attachment_store.json"
+CACHE_DIR = DATA_DIR / CACHE_DIR_NAME  # Extracted text keyed by content hash + extractor version
+QUARANTINE_FILE = DATA_DIR / QUARANTINE_FILE_NAME  # Files that timed out, ran out of memory or crashed
+WORKERS = os.cpu_count() or 1  # Extraction processes
+OCR_WORKERS = max(1, WORKERS // 2)  # OCR processes; OCR is CPU-bound for minutes per file, so fewer
+OCR_TIMEOUT = 1800  # Seconds one file may spend in OCR
 
 def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
 
-def extract_pdf(filepath):
-    """Extract text from PDF."""
-    try:
-        text = ""
-        with pdfplumber.open(filepath) as pdf:
-            for page in pdf.pages:
-                t = page.extract_text()
-                if t:
-                    text += t + "\n"
-        return text.strip()
-    except Exception as e:
-        return ""
-
-def extract_docx(filepath):
-    """Extract text from DOCX."""
-    try:
-        doc = Document(filepath)
-        return "\n".join([p.text for p in doc.paragraphs]).strip()
-    except:
-        return ""
+def load_content_hashes():
+    """Map attachment filenames to their SHA-256 from the download store manifest."""
+    if not STORE_MANIFEST_FILE.exists():
+        return {}
+    with open(STORE_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        store = json.load(f)
+    return {entry['filename']: entry['sha256'] for entry in store.values()}
 
-def main():
-    log("=" * 60)
-    log("TEXT EXTRACTION FOR DIGITAL OMNIBUS RESPONSES")
-    log("=" * 60)
-    
-    if not FEEDBACKS_CSV.exists():
-        log(f"❌ {FEEDBACKS_CSV} not found. Run the download script first.")
-        return
+def build_attachment_map():
+    """Map feedback IDs to their attachment filenames.
     
-    # Load feedbacks
-    log("Loading feedbacks.csv...")
-    feedbacks = []
-    with open(FEEDBACKS_CSV, 'r', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            feedbacks.append(row)
-    log(f"  Found {len(feedbacks)} entries")
-    
-    # Build attachment map
-    log("Scanning attachments...")
+    Uses attachments.csv from the downloader when present, since attachment
+    files are named after the attachment ID rather than the feedback ID.
+    Falls back to the numeric filename prefix otherwise.
+    """
     attachment_map = {}
+    if ATTACHMENTS_CSV.exists():
+        with open(ATTACHMENTS_CSV, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('status') in ('downloaded', 'exists') and row.get('filename'):
+                    attachment_map.setdefault(str(row['feedback_id']), []).append(row['filename'])
+        return attachment_map
+    
     if ATTACHMENTS_DIR.exists():
         for f in ATTACHMENTS_DIR.iterdir():
             if f.is_file():
@@ -92,46 +94,262 @@ def main():
                     if fid not in attachment_map:
                         attachment_map[fid] = []
                     attachment_map[fid].append(f.name)
+    return attachment_map
+
+def extract_all(filenames, content_hashes, workers=WORKERS, cache_dir=CACHE_DIR, pdf_extractor="pdf",
+                timeout=EXTRACTION_TIMEOUT, max_memory_mb=MAX_EXTRACTION_MEMORY_MB, retry_quarantined=False,
+                ocr_workers=OCR_WORKERS, ocr_timeout=OCR_TIMEOUT):
+    """Extract every file once, in supervised worker processes.
+    
+    Each file's type is sniffed from its content (in the same read as hashing
+    when the store has no hash for it), so misnamed uploads still reach the
+    right extractor. Files with the same content are only parsed once, and content already in
+    the extraction cache is not parsed at all. A file that exceeds `timeout`
+    seconds or `max_memory_mb` has its worker killed and is added to the
+    quarantine list, which later runs skip unless `retry_quarantined`.
+    PDFs that come back with too little text for their page count (scans)
+    then go to a separate pool of `ocr_workers` OCR processes, if Tesseract
+    is installed; `ocr_workers=0` skips OCR.
+    Returns (extracted, stats) where extracted maps filename -> cache entry
+    (text, page_offsets, page_tables, sha256) plus the sniffed file_type.
+    """
+    # One job per distinct (content, extractor); hash files the store does not know
+    jobs = {}
+    job_types = {}
+    unsupported = {}
+    for filename in filenames:
+        filepath = ATTACHMENTS_DIR / filename
+        sha256 = content_hashes.get(filename)
+        if sha256:
+            file_type, _ = sniff_file(filepath)
+        else:
+            sha256, file_type = hash_and_sniff(filepath)
+        extractor = extractor_for(filepath, pdf_extractor, file_type)
+        if extractor is None:
+            unsupported[file_type or "unknown"] = unsupported.get(file_type or "unknown", 0) + 1
+            continue
+        jobs.setdefault((sha256, extractor), []).append(filename)
+        job_types[(sha256, extractor)] = file_type
+    
+    extracted = {}
+    stats = {"unique": len(jobs), "cached": 0, "parsed": 0, "quarantined": 0, "backends": {},
+             "unsupported": unsupported, "formats": {}, "scans": 0, "ocr": {"cached": 0, "parsed": 0, "recovered": 0}}
+    quarantine = load_quarantine(QUARANTINE_FILE)
+    
+    def record(key, entry):
+        names = jobs[key]
+        entry = dict(entry, sha256=key[0], file_type=job_types[key])
+        extracted.update(dict.fromkeys(names, entry))
+        stats["cached" if entry["cached"] else "parsed"] += 1
+        done = stats["cached"] + stats["parsed"] + stats["quarantined"]
+        if done % 50 == 0:
+            log(f"  Extracted {done}/{stats['unique']} files...")
+    
+    def use_ocr(key, entry):
+        """Keep the OCR text for a scan if it found more than the PDF's text layer."""
+        names = jobs[key]
+        if len("".join(entry["text"].split())) > len("".join(extracted[names[0]]["text"].split())):
+            extracted.update(dict.fromkeys(names, dict(entry, sha256=key[0], file_type=job_types[key])))
+            stats["ocr"]["recovered"] += 1
+    
+    # Cache hits and known offenders are settled here; only the rest reach the workers
+    cache = ExtractionCache(cache_dir) if cache_dir else None
+    to_extract = []
+    for (sha256, extractor), names in jobs.items():
+        entry = cache.get(sha256, extractor) if cache else None
+        if entry is not None:
+            entry["cached"] = True
+            record((sha256, extractor), entry)
+        elif sha256 in quarantine and not retry_quarantined:
+            stats["quarantined"] += 1
+        else:
+            to_extract.append(((sha256, extractor), ATTACHMENTS_DIR / names[0], extractor, sha256))
+    
+    def quarantined(quarantine_key, names, extractor, failure):
+        reason, detail = failure
+        log(f"  ⚠️  Quarantined {names[0]} ({reason}: {detail})")
+        quarantine[quarantine_key] = {
+            "filenames": names,
+            "extractor": extractor,
+            "version": extractor_spec(extractor)[1],
+            "reason": reason,
+            "detail": detail,
+            "quarantined_at": datetime.now().isoformat(timespec="seconds"),
+        }
+    
+    supervisor = ExtractionSupervisor(workers, timeout, max_memory_mb, cache_dir)
+    for key, entry, failure in supervisor.run(to_extract):
+        sha256, extractor = key
+        if failure:
+            quarantined(sha256, jobs[key], extractor, failure)
+            stats["quarantined"] += 1
+            continue
+        quarantine.pop(sha256, None)
+        record(key, entry)
+    
+    # Scanned PDFs: OCR in a pool of its own, so a few slow scans cannot hold up
+    # (or take every core from) the text extraction above. OCR results are
+    # cached by content hash like any other extraction.
+    scans = [key for key in jobs if job_types[key] == PDF and jobs[key][0] in extracted
+             and needs_ocr(extracted[jobs[key][0]])]
+    stats["scans"] = len(scans)
+    if scans and ocr_workers > 0 and ocr_available():
+        log(f"  {len(scans)} PDF(s) look scanned; running OCR with {ocr_workers} worker(s)...")
+        ocr_jobs = []
+        for key in scans:
+            sha256 = key[0]
+            entry = cache.get(sha256, "ocr") if cache else None
+            if entry is not None:
+                entry["cached"] = True
+                stats["ocr"]["cached"] += 1
+                use_ocr(key, entry)
+            elif f"{sha256}:ocr" in quarantine and not retry_quarantined:
+                stats["quarantined"] += 1
+            else:
+                ocr_jobs.append((key, ATTACHMENTS_DIR / jobs[key][0], "ocr", sha256))
+        
+        ocr_supervisor = ExtractionSupervisor(ocr_workers, ocr_timeout, max_memory_mb, cache_dir)
+        for key, entry, failure in ocr_supervisor.run(ocr_jobs):
+            if failure:
+                quarantined(f"{key[0]}:ocr", jobs[key], "ocr", failure)
+                stats["quarantined"] += 1
+                continue
+            quarantine.pop(f"{key[0]}:ocr", None)
+            stats["ocr"]["parsed"] += 1
+            use_ocr(key, entry)
+    
+    # Backends and per-format coverage (files seen, files that yielded text,
+    # UTF-8 bytes of text recovered) of the final results
+    for key, names in jobs.items():
+        entry = extracted.get(names[0])
+        if entry is None:
+            continue
+        backend = entry.get("backend", entry["extractor"])
+        stats["backends"][backend] = stats["backends"].get(backend, 0) + 1
+        coverage = stats["formats"].setdefault(job_types[key], {"files": 0, "with_text": 0, "text_bytes": 0})
+        coverage["files"] += len(names)
+        coverage["with_text"] += len(names) if entry["text"] else 0
+        coverage["text_bytes"] += len(names) * len(entry["text"].encode("utf-8"))
+    
+    save_quarantine(QUARANTINE_FILE, quarantine)
+    return extracted, stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract text from consultation responses.")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"Extraction processes (default: {WORKERS})")
+    parser.add_argument("--timeout", type=float, default=EXTRACTION_TIMEOUT, metavar="SECONDS",
+                        help=f"Kill and quarantine a file after this long; 0 disables (default: {EXTRACTION_TIMEOUT})")
+    parser.add_argument("--max-memory", type=int, default=MAX_EXTRACTION_MEMORY_MB, metavar="MB",
+                        help=f"Kill and quarantine a file whose worker exceeds this RSS; 0 disables "
+                             f"(default: {MAX_EXTRACTION_MEMORY_MB})")
+    parser.add_argument("--retry-quarantined", action="store_true",
+                        help=f"Try files listed in {QUARANTINE_FILE} again")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Re-parse every attachment instead of using {CACHE_DIR}")
+    parser.add_argument("--ocr-workers", type=int, default=OCR_WORKERS,
+                        help=f"OCR processes for scanned PDFs (needs tesseract); 0 disables OCR "
+                             f"(default: {OCR_WORKERS})")
+    parser.add_argument("--ocr-timeout", type=float, default=OCR_TIMEOUT, metavar="SECONDS",
+                        help=f"Kill and quarantine a scan after this long in OCR; 0 disables "
+                             f"(default: {OCR_TIMEOUT})")
+    parser.add_argument("--pdf-backend", choices=["auto"] + list(PDF_BACKENDS), default="auto",
+                        help="PDF text backend; auto uses the fastest installed one and "
+                             "falls back to pdfplumber on empty or garbled text (default: auto)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    
+    log("=" * 60)
+    log("TEXT EXTRACTION FOR DIGITAL OMNIBUS RESPONSES")
+    log("=" * 60)
+    
+    # Feedback bodies come from the raw store; feedbacks.csv truncates them
+    feedbacks_path = feedbacks_source(DATA_DIR)
+    if feedbacks_path is None:
+        log(f"❌ No feedbacks in {DATA_DIR}. Run the download script first.")
+        return
+    if feedbacks_path.name == FEEDBACKS_CSV.name:
+        log(f"⚠️  Only {FEEDBACKS_CSV} found; feedback texts are truncated to 1000 characters")
+    
+    # Build attachment map
+    log("Scanning attachments...")
+    attachment_map = build_attachment_map()
     log(f"  Found attachments for {len(attachment_map)} feedbacks")
     
-    # Extract texts
-    log("Extracting text from all responses...")
-    results = []
+    # Identical uploads share a content hash, so each is only parsed once
+    content_hashes = load_content_hashes()
+    filenames = [
+        filename
+        for names in attachment_map.values()
+        for filename in names
+        if (ATTACHMENTS_DIR / filename).exists()
+    ]
     
-    for i, fb in enumerate(feedbacks, 1):
+    # Parse attachments in parallel, then assemble while streaming the feedbacks in download order
+    workers = max(1, args.workers)
+    log(f"Extracting text from {len(filenames)} attachments with {workers} worker(s)...")
+    pdf_extractor = "pdf" if args.pdf_backend == "auto" else f"pdf:{args.pdf_backend}"
+    extracted, extraction_stats = extract_all(
+        filenames, content_hashes, workers, None if args.no_cache else CACHE_DIR, pdf_extractor,
+        args.timeout, args.max_memory, args.retry_quarantined, args.ocr_workers, args.ocr_timeout,
+    )
+    
+    # Strip running headers/footers, page numbers and letterhead shared across documents
+    log("Cleaning extracted text...")
+    unique_entries = {entry["sha256"]: entry for entry in extracted.values()}
+    boilerplate = shared_boilerplate(entry_pages(entry) for entry in unique_entries.values())
+    cleaned = {sha256: clean_pages(entry_pages(entry), boilerplate) for sha256, entry in unique_entries.items()}
+    log(f"  {len(boilerplate)} boilerplate lines shared across documents")
+    
+    # Records are streamed to the JSONL store as they are assembled; pages are
+    # collected with their offsets into each record's raw (uncleaned) text
+    log(f"Assembling responses from {feedbacks_path.name} into {OUTPUT_FILE}...")
+    writer = TextStoreWriter(DATA_DIR)
+    pages = PageStoreWriter(DATA_DIR)
+    with_text = with_attachments = text_only = 0
+    raw_chars = clean_chars = 0
+    languages = Counter()
+    samples = []
+    
+    total = 0
+    for i, fb in enumerate(iter_feedbacks(DATA_DIR), 1):
+        total = i
         if i % 50 == 0:
-            log(f"  Processing {i}/{len(feedbacks)}...")
+            log(f"  Processing {i}...")
         
         fid = str(fb.get('id', ''))
         
-        # Start with feedback text from CSV
+        # Start with the full feedback text
         text_parts = []
+        clean_parts = []
         feedback_text = fb.get('feedback_text', '').strip()
         if feedback_text:
-            text_parts.append(("csv", feedback_text))
+            text_parts.append(("feedback", feedback_text))
+            clean_parts.append(clean_text(feedback_text))
         
-        # Extract from attachments
+        # Add attachment texts
         for filename in attachment_map.get(fid, []):
-            filepath = ATTACHMENTS_DIR / filename
-            if filepath.exists():
-                ext = filepath.suffix.lower()
-                if ext == '.pdf':
-                    t = extract_pdf(filepath)
-                elif ext in ['.docx', '.doc']:
-                    t = extract_docx(filepath)
-                else:
-                    try:
-                        t = filepath.read_text(errors='ignore')
-                    except:
-                        t = ""
-                
-                if t:
-                    text_parts.append((filename, t))
+            entry = extracted.get(filename)
+            if entry and entry["text"]:
+                text_parts.append((filename, entry["text"]))
+                clean_parts.append(cleaned[entry["sha256"]])
         
-        # Combine
+        # Combine; analysis uses the cleaned text, raw_text keeps what the extractors returned
         combined = "\n\n".join([t for _, t in text_parts])
+        clean_combined = "\n\n".join([t for t in clean_parts if t])
+        language, language_confidence = detect_language(clean_combined)
+        offset = 0
+        for source, t in text_parts:
+            if source == "feedback":
+                pages.add_page(fid, source, "text", None, 1, offset, t)
+            else:
+                entry = extracted[source]
+                pages.add_entry(fid, source, entry["file_type"], entry, offset)
+            offset += len(t) + 2
         
-        results.append({
+        record = {
             'id': fid,
             'organization': fb.get('organization', ''),
             'country': fb.get('country', ''),
@@ -139,33 +357,73 @@ def main():
             'firstName': fb.get('firstName', ''),
             'surname': fb.get('surname', ''),
             'language': fb.get('language', ''),
+            'detected_language': language,
+            'language_confidence': language_confidence,
             'date': fb.get('date', ''),
             'sources': [s for s, _ in text_parts],
-            'text': combined,
-            'text_length': len(combined),
-            'has_attachment': any(s != 'csv' for s, _ in text_parts)
-        })
+            'text': clean_combined,
+            'text_length': len(clean_combined),
+            'raw_text': combined,
+            'raw_text_length': len(combined),
+            'has_attachment': any(s != 'feedback' for s, _ in text_parts)
+        }
+        writer.write(record)
+        raw_chars += len(combined)
+        clean_chars += len(clean_combined)
+        if clean_combined:
+            languages[language] += 1
+        
+        with_text += bool(record['text'])
+        with_attachments += record['has_attachment']
+        text_only += bool(record['text']) and not record['has_attachment']
+        if len(samples) < 3:
+            samples.append({k: v for k, v in record.items() if k not in ('text', 'raw_text')})
     
-    # Stats
-    with_text = sum(1 for r in results if r['text'])
-    with_attachments = sum(1 for r in results if r['has_attachment'])
-    text_only = sum(1 for r in results if r['text'] and not r['has_attachment'])
+    writer.close()
+    pages_file = pages.close()
     
-    log(f"  ✓ Extracted text from {with_text} responses")
+    log(f"  ✓ Extracted text from {with_text} of {total} responses")
     log(f"    - From attachments: {with_attachments}")
     log(f"    - Text-only (no attachment): {text_only}")
+    if languages:
+        spread = ", ".join(f"{lang}: {n}" for lang, n in languages.most_common())
+        log(f"    - Detected languages ({identifier_name()}): {spread}")
+    if raw_chars:
+        log(f"    - Cleaning removed {raw_chars - clean_chars:,} of {raw_chars:,} characters "
+            f"({100 * (raw_chars - clean_chars) / raw_chars:.1f}%)")
+    if filenames:
+        log(f"    - Unique attachment contents: {extraction_stats['unique']} of {len(filenames)} files "
+            f"({extraction_stats['cached']} from cache, {extraction_stats['parsed']} parsed)")
+        for backend, count in sorted(extraction_stats["backends"].items(), key=lambda x: x[1], reverse=True):
+            log(f"      {backend}: {count}")
+        log("    - Coverage by format:")
+        for file_type, coverage in sorted(extraction_stats["formats"].items()):
+            log(f"      {file_type}: {coverage['with_text']}/{coverage['files']} files with text, "
+                f"{coverage['text_bytes']:,} bytes of text recovered")
+    if extraction_stats["scans"]:
+        ocr_stats = extraction_stats["ocr"]
+        if not ocr_available():
+            log(f"    - Scanned PDFs: {extraction_stats['scans']} not OCRed (install tesseract to read them)")
+        elif args.ocr_workers <= 0:
+            log(f"    - Scanned PDFs: {extraction_stats['scans']} not OCRed (--ocr-workers 0)")
+        else:
+            log(f"    - Scanned PDFs: {extraction_stats['scans']}, OCR recovered text for {ocr_stats['recovered']} "
+                f"({ocr_stats['cached']} from cache, {ocr_stats['parsed']} OCRed)")
+    if extraction_stats.get("unsupported"):
+        skipped = ", ".join(f"{t}: {n}" for t, n in sorted(extraction_stats["unsupported"].items()))
+        log(f"    - Skipped (no extractor for type): {skipped}")
+    if extraction_stats.get("quarantined"):
+        log(f"    - Quarantined: {extraction_stats['quarantined']}, see {QUARANTINE_FILE}")
     
-    # Save
-    log(f"Saving to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-    
+    json_file = export_json(DATA_DIR)
     log(f"✓ Done! Extracted texts saved to {OUTPUT_FILE}")
-    log(f"  File size: {OUTPUT_FILE.stat().st_size / 1024 / 1024:.1f} MB")
+    log(f"  File size: {OUTPUT_FILE.stat().st_size / 1024 / 1024:.1f} MB (index: {writer.index_path.name})")
+    log(f"  Page records: {pages_file} ({len(pages)} pages)")
+    log(f"  Compatibility export: {json_file}")
     
     # Preview
     log("\nSample entries:")
-    for r in results[:3]:
+    for r in samples:
         org = r['organization'] or f"{r['firstName']} {r['surname']}"
         log(f"  - {org}: {r['text_length']} chars from {len(r['sources'])} source(s)")
 
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+File-type sniffing shared by the downloader, the extractors and the helpers.
+
+The type comes from the file's first bytes, never from its name, so misnamed
+uploads (a PDF saved as .docx, an old .doc renamed .docx) are classified
+correctly without renaming anything on disk. ZIP containers are told apart by
+the part names in their first local headers (OOXML) or their mimetype entry
+(OpenDocument); OLE containers by their directory entry names. Only the
+standard library is used, so the downloader can import this without the
+extraction dependencies.
+"""
+
+import hashlib
+import zipfile
+from pathlib import Path
+
+HEADER_SIZE = 8192  # Bytes read once per file for sniffing
+
+# Types sniff_bytes() can return
+PDF, DOCX, XLSX, PPTX, ODT, ODS, ODP, ZIP = "pdf", "docx", "xlsx", "pptx", "odt", "ods", "odp", "zip"
+DOC, XLS, PPT, RTF, HTML, XML, TEXT = "doc", "xls", "ppt", "rtf", "html", "xml", "text"
+
+ZIP_MAGIC = b'PK\x03\x04'
+OLE_MAGIC = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+
+# OOXML part-name prefixes and OpenDocument mimetypes inside ZIP containers
+OOXML_PARTS = [(b'word/', DOCX), (b'xl/', XLSX), (b'ppt/', PPTX)]
+ODF_MIMETYPES = [
+    (b'application/vnd.oasis.opendocument.text', ODT),
+    (b'application/vnd.oasis.opendocument.spreadsheet', ODS),
+    (b'application/vnd.oasis.opendocument.presentation', ODP),
+]
+# OLE directory entries are UTF-16 names
+OLE_STREAMS = [("WordDocument", DOC), ("Workbook", XLS), ("Book", XLS), ("PowerPoint Document", PPT)]
+
+# Extension hints, only consulted when the content alone is ambiguous
+ZIP_EXTENSIONS = {".docx": DOCX, ".xlsx": XLSX, ".pptx": PPTX, ".odt": ODT, ".ods": ODS, ".odp": ODP}
+OLE_EXTENSIONS = {".doc": DOC, ".xls": XLS, ".ppt": PPT}
+
+def sniff_zip(header, name=None, path=None):
+    """Classify a ZIP container from its first local headers, the name, or (last resort) its directory."""
+    if header[30:38] == b'mimetype':
+        for mimetype, file_type in ODF_MIMETYPES:
+            if mimetype in header[38:38 + 80]:
+                return file_type
+    for prefix, file_type in OOXML_PARTS:
+        if prefix in header:
+            return file_type
+    if name and Path(name).suffix.lower() in ZIP_EXTENSIONS:
+        return ZIP_EXTENSIONS[Path(name).suffix.lower()]
+    if path is not None:
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = archive.namelist()
+        except (zipfile.BadZipFile, OSError):
+            return ZIP
+        for prefix, file_type in OOXML_PARTS:
+            if any(n.startswith(prefix.decode()) for n in names):
+                return file_type
+    return ZIP
+
+def sniff_ole(header, name=None):
+    """Classify an OLE compound file (legacy Office) from its directory entry names."""
+    for stream, file_type in OLE_STREAMS:
+        if stream.encode('utf-16-le') in header:
+            return file_type
+    if name and Path(name).suffix.lower() in OLE_EXTENSIONS:
+        return OLE_EXTENSIONS[Path(name).suffix.lower()]
+    return DOC  # By far the most common OLE upload
+
+def sniff_bytes(header, name=None, path=None):
+    """Classify a file from its first bytes; `name` is only a tie-breaker.
+
+    Returns one of the type constants above, or None for unrecognised binary data.
+    """
+    if header.startswith(b'%PDF'):
+        return PDF
+    if header.startswith(ZIP_MAGIC):
+        return sniff_zip(header, name, path)
+    if header.startswith(OLE_MAGIC):
+        return sniff_ole(header, name)
+    if header.startswith(b'{\\rtf'):
+        return RTF
+
+    start = header.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if start.startswith(b'<!doctype html') or start.startswith(b'<html') or b'<html' in start[:1024]:
+        return HTML
+    if start.startswith(b'<?xml') or start.startswith(b'<'):
+        return XML
+    if looks_like_text(header):
+        return TEXT
+    return None
+
+def looks_like_text(data):
+    """True if the bytes decode as UTF-8 (or Latin-1 without control characters)."""
+    if not data:
+        return False
+    if b'\x00' in data:
+        return False
+    try:
+        data.decode('utf-8')
+        return True
+    except UnicodeDecodeError as e:
+        if e.start >= len(data) - 4:
+            return True  # A multi-byte character cut off by the header boundary
+    controls = sum(1 for b in data if b < 32 and b not in (9, 10, 12, 13))
+    return controls / len(data) < 0.01
+
+def sniff_file(filepath):
+    """Read a file's header once and classify it; returns (file_type, header)."""
+    with open(filepath, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    return sniff_bytes(header, Path(filepath).name, filepath), header
+
+def hash_and_sniff(filepath):
+    """Hash a file and classify it in the same single pass; returns (sha256, file_type)."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        digest.update(header)
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), sniff_bytes(header, Path(filepath).name, filepath)
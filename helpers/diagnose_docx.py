@@ -5,8 +5,12 @@ Check if they're actually .doc (binary), corrupted, or HTML error pages.
 """
 
 import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import file_types
+
 DATA_DIR = Path("20401_digital_omnibus")
 ATTACHMENTS_DIR = DATA_DIR / "attachments"
 
@@ -38,27 +42,28 @@ FAILED_FILES = [
     "27563960_FiCom on digital omnibus .docx",
 ]
 
+# Sniffed type (file_types.py) -> description used in the report
+TYPE_LABELS = {
+    file_types.DOCX: "ZIP/DOCX (valid)",
+    file_types.XLSX: "ZIP/XLSX (spreadsheet)",
+    file_types.PPTX: "ZIP/PPTX (presentation)",
+    file_types.ODT: "ZIP/ODT (OpenDocument text)",
+    file_types.ZIP: "ZIP (not an Office document)",
+    file_types.DOC: "OLE/DOC (old Word format)",
+    file_types.XLS: "OLE/XLS (old Excel format)",
+    file_types.PPT: "OLE/PPT (old PowerPoint format)",
+    file_types.PDF: "PDF",
+    file_types.HTML: "HTML (error page?)",
+    file_types.RTF: "RTF",
+    file_types.XML: "XML/HTML (likely error page)",
+    file_types.TEXT: "Plain text",
+}
+
 def get_file_type(filepath):
     """Determine actual file type by examining magic bytes."""
     try:
-        with open(filepath, 'rb') as f:
-            header = f.read(20)
-        
-        # Check for various file signatures
-        if header[:4] == b'PK\x03\x04':
-            return "ZIP/DOCX (valid)"
-        elif header[:4] == b'\xD0\xCF\x11\xE0':
-            return "OLE/DOC (old Word format)"
-        elif header[:5] == b'%PDF-':
-            return "PDF"
-        elif header[:5] == b'<!DOC' or header[:5] == b'<html' or header[:5] == b'<HTML':
-            return "HTML (error page?)"
-        elif header[:4] == b'{\rtf':
-            return "RTF"
-        elif b'<' in header[:10]:
-            return "XML/HTML (likely error page)"
-        else:
-            return f"Unknown: {header[:10]}"
+        file_type, header = file_types.sniff_file(filepath)
+        return TYPE_LABELS.get(file_type) or f"Unknown: {header[:10]}"
     except Exception as e:
         return f"Error reading: {e}"
 
@@ -129,7 +134,7 @@ def main():
     
     if results["OLE/DOC (old Word format)"]:
         print(f"\n✓ {len(results['OLE/DOC (old Word format)'])} files are old .doc format")
-        print("  → Can extract with 'antiword' or 'textract' library")
+        print("  → extract_texts.py reads these natively (document_formats.py); no renaming needed")
     
     if results["HTML (error page?)"] or results["XML/HTML (likely error page)"]:
         n = len(results["HTML (error page?)"]) + len(results["XML/HTML (likely error page)"])
@@ -1,158 +1,103 @@
 #!/usr/bin/env python3
 """
-Fix files that have wrong extensions (e.g., PDFs saved as .docx)
-and re-extract text from them.
+Report files that have wrong extensions (e.g., PDFs saved as .docx)
+and re-extract text from all attachments.
+
+Extraction picks the extractor from each file's content (file_types.py), so
+misnamed files no longer need renaming; files stay under the names recorded in
+attachments.csv and the download manifest.
 """
 
-import os
-import re
-import json
-import csv
+import sys
+from collections import Counter
 from pathlib import Path
 from datetime import datetime
 
-# Install deps if needed
-try:
-    import pdfplumber
-    from docx import Document
-except ImportError:
-    import subprocess, sys
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "pdfplumber", "python-docx", "-q"])
-    import pdfplumber
-    from docx import Document
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import file_types
+from extract_texts import build_attachment_map
+from language_id import detect_language, identifier_name
+from text_extraction import CACHE_DIR_NAME, extract_with_cache, extractor_for
+from text_normalization import clean_pages, clean_text
+from text_store import TEXTS_JSONL_NAME, TextStoreWriter, entry_pages, export_json, feedbacks_source, iter_feedbacks
 
 DATA_DIR = Path("20401_digital_omnibus")
 ATTACHMENTS_DIR = DATA_DIR / "attachments"
-FEEDBACKS_CSV = DATA_DIR / "feedbacks.csv"
-OUTPUT_FILE = DATA_DIR / "extracted_texts.json"
+OUTPUT_FILE = DATA_DIR / TEXTS_JSONL_NAME
+CACHE_DIR = DATA_DIR / CACHE_DIR_NAME
 
 def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
 
-def get_actual_type(filepath):
-    """Get actual file type from magic bytes."""
-    try:
-        with open(filepath, 'rb') as f:
-            header = f.read(8)
-        
-        if header[:4] == b'PK\x03\x04':
-            return "docx"
-        elif header[:4] == b'\xD0\xCF\x11\xE0':
-            return "doc"
-        elif header[:5] == b'%PDF-':
-            return "pdf"
-        elif b'<' in header[:5]:
-            return "html"
-        return "unknown"
-    except:
-        return "unknown"
-
-def extract_pdf(filepath):
-    """Extract text from PDF."""
-    try:
-        text = ""
-        with pdfplumber.open(filepath) as pdf:
-            for page in pdf.pages:
-                t = page.extract_text()
-                if t:
-                    text += t + "\n"
-        return text.strip()
-    except Exception as e:
-        return ""
-
-def extract_docx(filepath):
-    """Extract text from DOCX."""
-    try:
-        doc = Document(filepath)
-        return "\n".join([p.text for p in doc.paragraphs]).strip()
-    except:
-        return ""
+# Sniffed type -> extensions it may legitimately carry
+TYPE_EXTENSIONS = {
+    file_types.PDF: [".pdf"],
+    file_types.DOCX: [".docx"],
+    file_types.DOC: [".doc"],
+    file_types.XLSX: [".xlsx"],
+    file_types.PPTX: [".pptx"],
+    file_types.ODT: [".odt"],
+    file_types.RTF: [".rtf"],
+}
 
 def main():
     log("=" * 60)
     log("FIX MISNAMED FILES & RE-EXTRACT")
     log("=" * 60)
     
-    # Step 1: Find and fix misnamed files
+    # Step 1: Find misnamed files (reported only; extraction sniffs the content)
     log("\nStep 1: Checking for misnamed files...")
     
-    fixed_count = 0
-    rename_map = {}  # old_name -> new_name
+    misnamed_count = 0
     
     for filepath in ATTACHMENTS_DIR.iterdir():
         if not filepath.is_file():
             continue
         
         ext = filepath.suffix.lower()
-        actual_type = get_actual_type(filepath)
-        
-        # Check for mismatch
-        needs_fix = False
-        new_ext = ext
+        actual_type, _ = file_types.sniff_file(filepath)
         
-        if actual_type == "pdf" and ext != ".pdf":
-            needs_fix = True
-            new_ext = ".pdf"
-        elif actual_type == "docx" and ext not in [".docx", ".xlsx"]:
-            needs_fix = True
-            new_ext = ".docx"
-        elif actual_type == "doc" and ext != ".doc":
-            needs_fix = True
-            new_ext = ".doc"
-        
-        if needs_fix:
-            new_name = filepath.stem + new_ext
-            new_path = filepath.parent / new_name
-            
-            # Rename
-            log(f"  Renaming: {filepath.name} -> {new_name}")
-            filepath.rename(new_path)
-            rename_map[filepath.name] = new_name
-            fixed_count += 1
+        if actual_type in TYPE_EXTENSIONS and ext not in TYPE_EXTENSIONS[actual_type]:
+            log(f"  Misnamed: {filepath.name} is {actual_type}")
+            misnamed_count += 1
     
-    log(f"\n✓ Fixed {fixed_count} misnamed files")
+    log(f"\n✓ Found {misnamed_count} misnamed files (extracted by content, not renamed)")
     
     # Step 2: Re-extract all texts
     log("\nStep 2: Re-extracting all texts...")
     
-    # Load feedbacks
-    feedbacks = []
-    with open(FEEDBACKS_CSV, 'r', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            feedbacks.append(row)
-    log(f"  Loaded {len(feedbacks)} feedbacks")
+    # Feedbacks are streamed with their full text from the raw store
+    log(f"  Reading feedbacks from {feedbacks_source(DATA_DIR)}")
     
-    # Build attachment map (with updated names)
-    attachment_map = {}
-    for f in ATTACHMENTS_DIR.iterdir():
-        if f.is_file():
-            match = re.match(r'^(\d+)_', f.name)
-            if match:
-                fid = match.group(1)
-                if fid not in attachment_map:
-                    attachment_map[fid] = []
-                attachment_map[fid].append(f.name)
+    # Same feedback -> attachment mapping as extract_texts.py (attachments.csv from the downloader)
+    attachment_map = build_attachment_map()
     
     log(f"  Found attachments for {len(attachment_map)} feedbacks")
     
     # Extract texts
     log("\nExtracting texts...")
-    results = []
-    stats = {'pdf': 0, 'docx': 0, 'csv_only': 0, 'failed': 0}
+    writer = TextStoreWriter(DATA_DIR)
+    with_text = 0
+    stats = {'pdf': 0, 'docx': 0, 'other': 0, 'text_only': 0, 'failed': 0, 'cached': 0}
+    languages = Counter()
+    total = 0
     
-    for i, fb in enumerate(feedbacks, 1):
+    for i, fb in enumerate(iter_feedbacks(DATA_DIR), 1):
+        total = i
         if i % 100 == 0:
-            log(f"  Processing {i}/{len(feedbacks)}...")
+            log(f"  Processing {i}...")
         
         fid = str(fb.get('id', ''))
         text_parts = []
         sources = []
         
-        # CSV feedback text
+        # Full feedback text
         feedback_text = fb.get('feedback_text', '').strip()
+        clean_parts = []
         if feedback_text:
             text_parts.append(feedback_text)
-            sources.append("csv")
+            clean_parts.append(clean_text(feedback_text))
+            sources.append("feedback")
         
         # Attachment texts
         for filename in attachment_map.get(fid, []):
@@ -160,30 +105,35 @@ def main():
             if not filepath.exists():
                 continue
             
-            actual_type = get_actual_type(filepath)
+            actual_type, _ = file_types.sniff_file(filepath)
+            extractor = extractor_for(filepath, file_type=actual_type)
             text = ""
             
-            if actual_type == "pdf":
-                text = extract_pdf(filepath)
+            # Unchanged files come straight from the shared extraction cache
+            if extractor:
+                entry = extract_with_cache(filepath, extractor, CACHE_DIR)
+                text = entry["text"]
                 if text:
-                    stats['pdf'] += 1
-            elif actual_type == "docx":
-                text = extract_docx(filepath)
-                if text:
-                    stats['docx'] += 1
+                    stats[actual_type if actual_type in ('pdf', 'docx') else 'other'] += 1
+                    stats['cached'] += entry["cached"]
             
             if text:
                 text_parts.append(text)
+                clean_parts.append(clean_pages(entry_pages(entry)))
                 sources.append(f"{filename} ({actual_type})")
             else:
                 stats['failed'] += 1
         
-        if sources == ["csv"]:
-            stats['csv_only'] += 1
+        if sources == ["feedback"]:
+            stats['text_only'] += 1
         
         combined = "\n\n".join(text_parts)
+        clean_combined = "\n\n".join(t for t in clean_parts if t)
+        language, language_confidence = detect_language(clean_combined)
+        if clean_combined:
+            languages[language] += 1
         
-        results.append({
+        writer.write({
             'id': fid,
             'organization': fb.get('organization', ''),
             'country': fb.get('country', ''),
@@ -191,31 +141,39 @@ def main():
             'firstName': fb.get('firstName', ''),
             'surname': fb.get('surname', ''),
             'language': fb.get('language', ''),
+            'detected_language': language,
+            'language_confidence': language_confidence,
             'date': fb.get('date', ''),
             'sources': sources,
-            'text': combined,
-            'text_length': len(combined),
-            'has_attachment': any(s != 'csv' for s in sources)
+            'text': clean_combined,
+            'text_length': len(clean_combined),
+            'raw_text': combined,
+            'raw_text_length': len(combined),
+            'has_attachment': any(s != 'feedback' for s in sources)
         })
+        with_text += bool(combined)
+    writer.close()
     
     # Stats
     log("\n" + "=" * 60)
     log("EXTRACTION COMPLETE")
     log("=" * 60)
     
-    with_text = sum(1 for r in results if r['text'])
-    log(f"✓ Extracted text from {with_text}/{len(results)} responses")
+    log(f"✓ Extracted text from {with_text}/{total} responses")
     log(f"  - PDFs: {stats['pdf']}")
     log(f"  - DOCXs: {stats['docx']}")
-    log(f"  - CSV text only: {stats['csv_only']}")
+    log(f"  - Other formats: {stats['other']}")
+    log(f"  - Feedback text only: {stats['text_only']}")
     log(f"  - Failed: {stats['failed']}")
+    log(f"  - From extraction cache: {stats['cached']}")
+    if languages:
+        spread = ", ".join(f"{lang}: {n}" for lang, n in languages.most_common())
+        log(f"  - Detected languages ({identifier_name()}): {spread}")
     
-    # Save
-    log(f"\nSaving to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-    
-    log(f"✓ Saved! File size: {OUTPUT_FILE.stat().st_size / 1024 / 1024:.1f} MB")
+    # The JSONL was streamed above; also refresh the JSON compatibility export
+    json_file = export_json(DATA_DIR)
+    log(f"\n✓ Saved {OUTPUT_FILE}! File size: {OUTPUT_FILE.stat().st_size / 1024 / 1024:.1f} MB")
+    log(f"  Compatibility export: {json_file}")
     
     log("\n" + "=" * 60)
     log("Now re-run: python semantic_analysis.py")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Local language identification for consultation texts.
+
+The API's `language` field is often missing or wrong, so extract_texts.py
+detects the language of every document and page itself. The built-in
+identifier scores a sample of the text against stop-word profiles for the
+EU languages (plus Russian and Ukrainian, to keep Cyrillic apart from
+Bulgarian) and recognises Greek by its script. It needs nothing installed
+and takes about a millisecond per text, as it only samples SAMPLE_CHARS.
+When available, fastText's lid.176 model (FASTTEXT_MODEL) or langid.py is
+used instead.
+
+detect_language() returns (ISO 639-1 code, confidence in 0..1), or
+("und", 0.0) when the text is too short to tell.
+"""
+
+import os
+import re
+from collections import Counter
+
+try:
+    import fasttext
+except ImportError:
+    fasttext = None
+
+try:
+    from langid.langid import LanguageIdentifier, model as langid_model
+except ImportError:
+    LanguageIdentifier = None
+
+UNDETERMINED = "und"
+SAMPLE_CHARS = 4000  # Characters of each text that are looked at
+MIN_HITS = 3  # Stop-word hits needed before the built-in identifier commits to a language
+FASTTEXT_MODEL = os.environ.get("FASTTEXT_LID_MODEL", "lid.176.ftz")
+
+STOPWORDS = {
+    "en": "the of and to in is that for on with as are be by this it not or from at which we have an will "
+          "should has their would these such can also its been more our they".split(),
+    "de": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an werden "
+          "aus er hat dass sie nach wird bei einer um noch wie einem über einen so zum oder".split(),
+    "fr": "le la les de des et à en un une du que est pour qui dans par sur pas au plus ne il sont ce avec "
+          "nous être cette ou ces aux leur".split(),
+    "es": "el la de que y en los del se las por un para con no una su al lo como más o pero sus le ha es "
+          "este esta entre cuando muy sin sobre ser".split(),
+    "it": "il di che e la per un in è del non una sono della le si al da con dei alla anche nel ma come "
+          "gli questo delle più nella essere".split(),
+    "nl": "de het een van en in is dat op te zijn voor met die niet aan er ook als bij door om worden "
+          "wordt deze kan naar dan of hun onze".split(),
+    "pt": "de a o que e do da em um para é com não uma os no se na por mais as dos como mas ao ele das "
+          "à seu sua ou ser quando também pelo pela".split(),
+    "pl": "i w na z że do się nie to jest o jak ale po co tak za od przez dla oraz być może który "
+          "które których jego ich także lub".split(),
+    "sv": "och i att det som en på är av för med till den har de inte om ett men var så vi kan från "
+          "eller också skulle detta dessa".split(),
+    "da": "og i at det er en til på som de med af for ikke der var den har et men om vi kan fra "
+          "eller også skal være disse".split(),
+    "fi": "ja on ei että se oli kun mutta myös tai ovat joka sen kuin niin jos voi tämä ole olla "
+          "sekä jotka mukaan kanssa vain".split(),
+    "cs": "a se na je v že to s z do o jako ale by jsou pro tak k jeho které který nebo byl "
+          "také podle této při".split(),
+    "sk": "a sa na je v že to s z do o ako ale by sú pre tak k jeho ktoré ktorý alebo bol "
+          "tiež podľa tejto pri".split(),
+    "sl": "in je v na da se za z so ki pa tudi s bi kot ali iz lahko ter po ne smo so to".split(),
+    "hr": "i je u na da se za su od s kao ali bi to iz ili koji koje što nije te smo biti".split(),
+    "hu": "a az és hogy nem is egy van meg csak de ez már mint ki el volt sem kell vagy szerint "
+          "amely ami lesz még".split(),
+    "ro": "și de la în a cu pe o din că un nu care se mai este pentru sunt sau ca prin acest această "
+          "fi au".split(),
+    "et": "ja on ei et see oli kui ka aga ning mis või selle oma nii kes mida peab tuleb".split(),
+    "lv": "un ir ar no par uz ka kā arī to tas nav vai bet lai kas tā jo šo šī".split(),
+    "lt": "ir yra kad su į iš tai bet kaip ar ne už jo šis ši taip pat dėl".split(),
+    "mt": "il u li ta fl għal minn ma huwa dan din jew biex mhux kien".split(),
+    "ga": "agus an na ar is go le ag a do ó sin níl bhí atá mar".split(),
+    "bg": "и на в за да се от с е че не по са това като или които към при".split(),
+    "ru": "и в не на что с как по это он она они к но из за от же для или при".split(),
+    "uk": "і в на що з не як до це та за від але для при або які його її".split(),
+}
+# word -> languages it marks, built once
+STOPWORD_INDEX = {}
+for _lang, _words in STOPWORDS.items():
+    for _word in _words:
+        STOPWORD_INDEX.setdefault(_word, []).append(_lang)
+
+WORD = re.compile(r"[^\W\d_]+")
+GREEK = re.compile(r"[\u0370-\u03ff\u1f00-\u1fff]")
+
+_fasttext_model = None
+
+def fasttext_model():
+    """The fastText language-ID model, loaded once, or None if fastText or the model file is missing."""
+    global _fasttext_model
+    if _fasttext_model is None and fasttext and os.path.exists(FASTTEXT_MODEL):
+        _fasttext_model = fasttext.load_model(FASTTEXT_MODEL)
+    return _fasttext_model
+
+_langid = None
+
+def langid_identifier():
+    """langid.py with normalised probabilities, or None if it is not installed."""
+    global _langid
+    if _langid is None and LanguageIdentifier:
+        _langid = LanguageIdentifier.from_modelstring(langid_model, norm_probs=True)
+    return _langid
+
+def builtin_language(sample):
+    """Stop-word profile scoring; Greek is recognised by its script."""
+    letters = sum(1 for c in sample if c.isalpha())
+    if letters and len(GREEK.findall(sample)) / letters > 0.3:
+        return "el", round(min(1.0, len(GREEK.findall(sample)) / letters), 3)
+    scores = Counter()
+    for word in WORD.findall(sample.lower()):
+        for lang in STOPWORD_INDEX.get(word, ()):
+            scores[lang] += 1
+    if not scores:
+        return UNDETERMINED, 0.0
+    (best, hits), = scores.most_common(1)
+    if hits < MIN_HITS:
+        return UNDETERMINED, 0.0
+    runner_up = scores.most_common(2)[1][1] if len(scores) > 1 else 0
+    return best, round(1 - runner_up / hits, 3)
+
+def detect_language(text):
+    """(language code, confidence) for a text; ("und", 0.0) when undetermined."""
+    sample = " ".join(text[:SAMPLE_CHARS].split())
+    if len(sample) < 20:
+        return UNDETERMINED, 0.0
+    model = fasttext_model()
+    if model:
+        labels, probabilities = model.predict(sample)
+        return labels[0].replace("__label__", ""), round(float(probabilities[0]), 3)
+    identifier = langid_identifier()
+    if identifier:
+        lang, probability = identifier.classify(sample)
+        return lang, round(float(probability), 3)
+    return builtin_language(sample)
+
+def identifier_name():
+    """Which identifier detect_language() uses, for logs and provenance."""
+    if fasttext_model():
+        return "fasttext"
+    if langid_identifier():
+        return "langid"
+    return "builtin"
+
+def stop_words(languages):
+    """Stop words for a set of language codes (for tokenisers such as TfidfVectorizer)."""
+    return sorted({word for lang in languages for word in STOPWORDS.get(lang, ())})
@@ -19,8 +19,10 @@ from pathlib import Path
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from text_store import TEXTS_JSONL_NAME, TextStore
+
 DATA_DIR = Path("20401_digital_omnibus")
-EXTRACTED_TEXTS = DATA_DIR / "extracted_texts.json"
+EXTRACTED_TEXTS = DATA_DIR / TEXTS_JSONL_NAME  # extracted_texts.json is read if this is missing
 OUTPUT_DIR = DATA_DIR / "llm_analysis"
 OUTPUT_DIR.mkdir(exist_ok=True)
 
@@ -88,6 +90,8 @@ def analyse_response(item, use_short_prompt=False):
     display_name = get_display_name(item)
     country = item.get('country', '')
     user_type = item.get('userType', '')
+    # Detected from the text; the API's language field is often missing or wrong
+    language = item.get('detected_language') or item.get('language', '')
     
     # Use shorter text for short prompt mode
     text_limit = 4000 if use_short_prompt else MAX_TEXT_LENGTH
@@ -101,6 +105,7 @@ def analyse_response(item, use_short_prompt=False):
         prompt = f"""Briefly analyse this EU Digital Omnibus consultation response.
 
 RESPONDENT: {display_name} ({country}, {user_type})
+LANGUAGE: {language}
 
 TEXT (truncated):
 {text}
@@ -122,6 +127,7 @@ Return JSON only:
 RESPONDENT: {display_name}
 COUNTRY: {country}
 TYPE: {user_type}
+LANGUAGE: {language}
 
 RESPONSE TEXT:
 {text}
@@ -178,6 +184,7 @@ Return ONLY the JSON object, no other text."""
             analysis['display_name'] = display_name
             analysis['country'] = country
             analysis['userType'] = user_type
+            analysis['language'] = language
             analysis['url'] = f"https://ec.europa.eu/info/law/better-regulation/have-your-say/initiatives/14855-Simplification-digital-package-and-omnibus/F{item['id']}_en"
             analysis['used_short_prompt'] = use_short_prompt
             return analysis
@@ -382,13 +389,12 @@ def main():
         return
     
     # Load data
-    log("\nLoading extracted texts...")
-    with open(EXTRACTED_TEXTS, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    log("\nLoading extracted texts index...")
+    store = TextStore(DATA_DIR)
     
-    # Filter to responses with substantial text
-    data = [item for item in data if len(item.get('text', '')) > 200]
-    log(f"  Found {len(data)} responses with substantial text")
+    # Filter to responses with substantial text; texts are read one at a time below
+    candidate_ids = store.ids(min_text_length=200)
+    log(f"  Found {len(candidate_ids)} responses with substantial text")
     
     # Load progress (for resuming)
     analysed_ids = load_progress()
@@ -403,7 +409,9 @@ def main():
         results = []
     
     # Filter to remaining items
-    remaining = [item for item in data if item['id'] not in analysed_ids]
+    remaining = [fid for fid in candidate_ids if fid not in analysed_ids]
+    # Same-language responses back to back, in file order within each language
+    remaining.sort(key=store.language)
     log(f"  Remaining to analyse: {len(remaining)} responses")
     
     if not remaining:
@@ -414,7 +422,8 @@ def main():
         log("")
     
     # Analyse each response
-    for i, item in enumerate(remaining, 1):
+    for i, fid in enumerate(remaining, 1):
+        item = store.get(fid)
         display_name = get_display_name(item)
         text_len = len(item.get('text', ''))
         log(f"[{i}/{len(remaining)}] Analysing: {display_name[:50]}... ({text_len} chars)")
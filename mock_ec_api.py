@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the EC Have Your Say API, for offline testing and benchmarks.
+
+Serves the two endpoints the downloader uses:
+  - api/allFeedback?publicationId=...&page=...&size=...  (Spring Data style pages)
+  - api/download/{documentId}                              (attachment bytes, with Range support)
+
+Feedbacks come either from a saved feedbacks_raw.json / feedbacks_raw.jsonl or
+from a deterministic synthetic generator. Latency, random 5xx errors, a
+server-side rate cap, periodic 429 bursts, feedback pages that always fail
+and attachment transfers cut off halfway can be switched on to see how the
+downloader copes.
+
+Usage:
+    python mock_ec_api.py --synthetic 2000 --latency 50 --error-rate 0.01
+    python mock_ec_api.py --seed-json 20401_digital_omnibus/feedbacks_raw.json
+    python download_omnibus_final.py --base-url http://127.0.0.1:8800/info/law/better-regulation/
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8800
+BASE_PATH = "/info/law/better-regulation/"
+DEFAULT_FILE_SIZE = 200 * 1024  # Bytes per synthetic attachment (median)
+
+COUNTRIES = ["BEL", "DEU", "FRA", "NLD", "ITA", "ESP", "POL", "SWE", "AUT", "IRL", "DNK", "FIN", "USA", "GBR"]
+USER_TYPES = ["BUSINESS_ASSOCIATION", "COMPANY", "NGO", "EU_CITIZEN", "PUBLIC_AUTHORITY",
+              "ACADEMIC_RESEARCH_INSTITTUTION", "TRADE_UNION", "CONSUMER_ORGANISATION", "OTHER"]
+LANGUAGES = ["EN", "DE", "FR", "NL", "IT", "ES", "PL", "SV", "FI", "DA"]
+WORDS = ("data protection privacy simplification regulation compliance innovation burden "
+         "cookies consent legitimate interest pseudonymisation cybersecurity reporting AI Act "
+         "GDPR ePrivacy Data Act interoperability small medium enterprises safeguards").split()
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+def generate_feedbacks(count, attachment_ratio=0.7, file_size=DEFAULT_FILE_SIZE, seed=42):
+    """Build `count` synthetic feedbacks shaped like the real API's content items."""
+    rng = random.Random(seed)
+    start = datetime(2025, 9, 16, 9, 0, 0)
+    feedbacks = []
+
+    for i in range(count):
+        feedback_id = 33000000 + i
+        attachments = []
+        if rng.random() < attachment_ratio:
+            for j in range(1 if rng.random() < 0.85 else rng.randint(2, 3)):
+                att_id = 27500000 + i * 4 + j
+                size = max(2048, int(rng.lognormvariate(math.log(file_size), 0.8)))
+                attachments.append({
+                    "id": att_id,
+                    "documentId": f"090166e5{feedback_id:08x}{j:02d}",
+                    "fileName": f"Response {i} part {j + 1}.pdf",
+                    "pages": max(1, size // 40000),
+                    "size": size,
+                })
+
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 400)))
+        feedbacks.append({
+            "id": feedback_id,
+            "dateFeedback": (start + timedelta(minutes=7 * i)).strftime("%Y/%m/%d %H:%M:%S"),
+            "firstName": rng.choice(["Anna", "Jan", "Marie", "Luca", "Sofia", "Piotr"]),
+            "surname": rng.choice(["Jansen", "Müller", "Dubois", "Rossi", "Nowak", "Berg"]),
+            "organization": f"Organisation {i}" if rng.random() < 0.8 else "",
+            "country": rng.choice(COUNTRIES),
+            "userType": rng.choice(USER_TYPES),
+            "language": rng.choice(LANGUAGES),
+            "companySize": rng.choice(["MICRO", "SMALL", "MEDIUM", "LARGE", ""]),
+            "trNumber": f"{rng.randint(10**11, 10**12 - 1)}-{rng.randint(10, 99)}",
+            "status": "PUBLISHED",
+            "feedback": text,
+            "attachments": attachments,
+            "referenceInitiative": "Ares(2025)0000000",
+        })
+
+    return feedbacks
+
+def load_feedbacks(path):
+    """Load feedbacks from a saved feedbacks_raw.json or feedbacks_raw.jsonl."""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == ".jsonl":
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+def load_document_files(data_dir):
+    """Map documentId -> local attachment file using a previous run's attachments.csv."""
+    data_dir = Path(data_dir)
+    documents = {}
+    csv_path = data_dir / "attachments.csv"
+    if not csv_path.exists():
+        return documents
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            filepath = data_dir / "attachments" / row.get("filename", "")
+            if row.get("document_id") and filepath.is_file():
+                documents[row["document_id"]] = filepath
+    return documents
+
+class MockECAPI:
+    """In-memory consultation data plus fault injection and request counters."""
+
+    def __init__(self, feedbacks, document_files=None, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, burst_every=0, burst_length=0, retry_after=1,
+                 max_rps=0, fail_pages=(), interrupt_downloads=0, seed=42):
+        self.feedbacks = feedbacks
+        self.document_files = document_files or {}
+        self.document_sizes = {}
+        for fb in feedbacks:
+            for att in fb.get("attachments", []):
+                if att.get("documentId"):
+                    self.document_sizes[str(att["documentId"])] = int(att.get("size") or DEFAULT_FILE_SIZE)
+
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.fail_pages = set(fail_pages)  # Feedback pages answered with 500 on every request
+        self.interrupt_downloads = interrupt_downloads  # Transfers still to cut off halfway
+        self.rng = random.Random(seed)
+        self.last_modified = formatdate(time.time() - 86400, usegmt=True)
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.stats = {"pages": 0, "downloads": 0, "bytes": 0, "throttled": 0, "errors": 0, "ranges": 0,
+                      "interrupted": 0}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def fault(self):
+        """Decide whether this request gets a 429 or 500 instead of an answer."""
+        with self.lock:
+            self.request_count += 1
+            n = self.request_count
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            over_rate = self.max_rps and self.window_count > self.max_rps
+            roll = self.rng.random()
+
+        if over_rate or (self.burst_every and n % self.burst_every < self.burst_length):
+            self.count("throttled")
+            return 429
+        if roll < self.error_rate:
+            self.count("errors")
+            return 500
+        return None
+
+    def interrupt(self):
+        """Decide whether this transfer is cut off halfway through its body."""
+        with self.lock:
+            if self.interrupt_downloads <= 0:
+                return False
+            self.interrupt_downloads -= 1
+            self.stats["interrupted"] += 1
+            return True
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+
+    def page(self, publication_id, page, size, sort=None):
+        """Build a Spring Data style page of feedbacks."""
+        items = self.feedbacks
+        if sort and sort.startswith("dateFeedback"):
+            items = sorted(items, key=lambda fb: fb.get("dateFeedback", ""), reverse=sort.endswith("DESC"))
+
+        total = len(items)
+        total_pages = max(1, math.ceil(total / size))
+        content = items[page * size:(page + 1) * size]
+        return {
+            "content": content,
+            "pageable": {"pageNumber": page, "pageSize": size, "offset": page * size},
+            "totalElements": total,
+            "totalPages": total_pages,
+            "last": page >= total_pages - 1,
+            "first": page == 0,
+            "number": page,
+            "size": size,
+            "numberOfElements": len(content),
+            "empty": not content,
+        }
+
+    def document(self, document_id):
+        """Return the bytes for a document, or None if it is unknown."""
+        if document_id in self.document_files:
+            return self.document_files[document_id].read_bytes()
+        if document_id not in self.document_sizes:
+            return None
+        size = self.document_sizes[document_id]
+        body = random.Random(document_id).randbytes(max(0, size - 9))
+        return b"%PDF-1.4\n" + body
+
+def make_handler(api):
+    """Create a request handler class bound to a MockECAPI instance."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, content_type, headers=None, interrupt=False):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if interrupt:
+                # Announce the full length, send half, then drop the connection
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            api.delay()
+
+            status = api.fault()
+            if status == 429:
+                self.send_body(429, b'{"error":"Too Many Requests"}', "application/json",
+                               {"Retry-After": str(api.retry_after)})
+                return
+            if status == 500:
+                self.send_body(500, b"<html><body>Internal Server Error</body></html>", "text/html")
+                return
+
+            if url.path.endswith("api/allFeedback"):
+                page = int(query.get("page", ["0"])[0])
+                if page in api.fail_pages:
+                    api.count("errors")
+                    self.send_body(500, b"<html><body>Internal Server Error</body></html>", "text/html")
+                    return
+                size = int(query.get("size", ["10"])[0])
+                sort = query.get("sort", [None])[0]
+                data = api.page(query.get("publicationId", [""])[0], page, size, sort)
+                api.count("pages")
+                self.send_body(200, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json")
+                return
+
+            if "api/download/" in url.path:
+                document_id = url.path.rsplit("/", 1)[1]
+                body = api.document(document_id)
+                if body is None:
+                    self.send_body(404, b"<html><body>Not Found</body></html>", "text/html")
+                    return
+                self.send_document(document_id, body)
+                return
+
+            self.send_body(404, b"<html><body>Not Found</body></html>", "text/html")
+
+        def send_document(self, document_id, body):
+            """Send a document, honouring Range and If-Range like a real file server."""
+            etag = f'"{document_id}-{len(body)}"'
+            headers = {"ETag": etag, "Last-Modified": api.last_modified, "Accept-Ranges": "bytes"}
+            range_header = self.headers.get("Range", "")
+            if_range = self.headers.get("If-Range")
+
+            if range_header.startswith("bytes=") and (not if_range or if_range in (etag, api.last_modified)):
+                first, _, last = range_header[6:].partition("-")
+                start = int(first or 0)
+                end = int(last) if last else len(body) - 1
+                if start >= len(body):
+                    headers["Content-Range"] = f"bytes */{len(body)}"
+                    self.send_body(416, b"", "application/pdf", headers)
+                    return
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+                api.count("ranges")
+                api.count("downloads")
+                api.count("bytes", end + 1 - start)
+                self.send_body(206, body[start:end + 1], "application/pdf", headers, api.interrupt())
+                return
+
+            api.count("downloads")
+            api.count("bytes", len(body))
+            self.send_body(200, body, "application/pdf", headers, api.interrupt())
+
+    return Handler
+
+def make_server(api, host="127.0.0.1", port=DEFAULT_PORT):
+    """Create (but do not start) a threaded HTTP server for `api`. Port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    server.daemon_threads = True
+    return server
+
+def base_url(server):
+    """The BASE_URL the downloader should use to talk to `server`."""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{BASE_PATH}"
+
+def add_fault_arguments(parser):
+    """Command-line options shared with benchmark_download.py."""
+    parser.add_argument("--latency", type=float, default=0, metavar="MS",
+                        help="Fixed latency added to every request (ms)")
+    parser.add_argument("--jitter", type=float, default=0, metavar="MS",
+                        help="Random extra latency up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--burst-every", type=int, default=0, metavar="N",
+                        help="Start a burst of 429 responses every N requests")
+    parser.add_argument("--burst-length", type=int, default=0, metavar="N",
+                        help="Number of consecutive 429 responses per burst")
+    parser.add_argument("--retry-after", type=int, default=1, metavar="SECONDS",
+                        help="Retry-After sent with 429 responses")
+    parser.add_argument("--max-rps", type=float, default=0,
+                        help="Answer 429 when more than this many requests arrive per second")
+    parser.add_argument("--fail-page", type=int, action="append", default=[], metavar="N",
+                        help="Always answer feedback page N with HTTP 500 (repeatable)")
+    parser.add_argument("--interrupt-downloads", type=int, default=0, metavar="N",
+                        help="Cut the first N attachment transfers off halfway through")
+
+def build_api(args):
+    """Create a MockECAPI from parsed command-line options."""
+    if args.seed_json:
+        feedbacks = load_feedbacks(args.seed_json)
+        document_files = load_document_files(Path(args.seed_json).parent)
+    else:
+        feedbacks = generate_feedbacks(args.synthetic, args.attachment_ratio, args.file_size * 1024)
+        document_files = {}
+    return MockECAPI(
+        feedbacks, document_files,
+        latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate,
+        burst_every=args.burst_every, burst_length=args.burst_length,
+        retry_after=args.retry_after, max_rps=args.max_rps, fail_pages=args.fail_page,
+        interrupt_downloads=args.interrupt_downloads,
+    )
+
+def add_data_arguments(parser):
+    """Command-line options choosing the data the mock serves."""
+    parser.add_argument("--seed-json", metavar="FILE",
+                        help="Serve feedbacks from a saved feedbacks_raw.json/.jsonl "
+                             "(attachments from its folder when available)")
+    parser.add_argument("--synthetic", type=int, default=500, metavar="N",
+                        help="Number of synthetic feedbacks when no --seed-json is given (default: 500)")
+    parser.add_argument("--attachment-ratio", type=float, default=0.7,
+                        help="Share of synthetic feedbacks with attachments (default: 0.7)")
+    parser.add_argument("--file-size", type=int, default=DEFAULT_FILE_SIZE // 1024, metavar="KB",
+                        help=f"Median synthetic attachment size in KB (default: {DEFAULT_FILE_SIZE // 1024})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the EC Have Your Say API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_data_arguments(parser)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    api = build_api(args)
+    server = make_server(api, args.host, args.port)
+
+    attachments = sum(len(fb.get("attachments", [])) for fb in api.feedbacks)
+    log("=" * 60)
+    log("MOCK EC HAVE YOUR SAY API")
+    log("=" * 60)
+    log(f"  Feedbacks: {len(api.feedbacks)}, attachments: {attachments}")
+    log(f"  Base URL: {base_url(server)}")
+    log(f"  Latency: {args.latency}ms (+{args.jitter}ms jitter), error rate: {args.error_rate:.1%}")
+    if args.burst_every:
+        log(f"  429 bursts: {args.burst_length} every {args.burst_every} requests")
+    if args.max_rps:
+        log(f"  Server-side rate cap: {args.max_rps} req/s")
+    log("Press Ctrl+C to stop")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log(f"Served: {api.stats}")
+
+if __name__ == "__main__":
+    main()
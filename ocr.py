@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+OCR for scanned, image-only PDFs.
+
+Scanned submissions have no text layer, so the PDF extractors return little
+or nothing for them. extract_texts.py spots them by their text-to-page ratio
+(text_extraction.needs_ocr) and sends them here in a separate, smaller worker
+pool. Each page is rendered with pypdfium2 (or PyMuPDF) and read by the
+Tesseract command-line tool, one page at a time. Nothing here is required:
+without tesseract on the PATH, available() is False and the run only reports
+how many PDFs would have been OCRed.
+
+TESSERACT_LANGUAGES picks the Tesseract language packs (default "eng"; e.g.
+"eng+deu+fra"). More languages make OCR slower.
+"""
+
+import os
+import shutil
+import subprocess
+from io import BytesIO
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+OCR_LANGUAGES = os.environ.get("TESSERACT_LANGUAGES", "eng")
+OCR_DPI = 300  # Render resolution; Tesseract is tuned for roughly 300 dpi
+OCR_PAGE_TIMEOUT = 120  # Seconds per page; the OCR pool still enforces its own per-file limit
+
+_tesseract = None
+_tesseract_version = None
+
+def tesseract():
+    """Path of the tesseract binary, looked up on first use, or None."""
+    global _tesseract
+    if _tesseract is None:
+        _tesseract = shutil.which("tesseract") or ""
+    return _tesseract or None
+
+def tesseract_version():
+    """The installed Tesseract version (part of the OCR cache key), or None.
+
+    Runs `tesseract --version` once; nothing here is probed at import time.
+    """
+    global _tesseract_version
+    if _tesseract_version is None and tesseract():
+        result = subprocess.run([tesseract(), "--version"], capture_output=True, timeout=30)
+        # Older releases print the version to stderr
+        output = (result.stdout or result.stderr).decode(errors='replace').split()
+        _tesseract_version = output[1] if len(output) > 1 else "unknown"
+    return _tesseract_version
+
+def renderer():
+    """Name of the library used to rasterise PDF pages, or None."""
+    if pypdfium2:
+        return "pypdfium2"
+    if pymupdf:
+        return "pymupdf"
+    return None
+
+def available():
+    """True if scanned PDFs can be OCRed here."""
+    return bool(tesseract() and renderer())
+
+def render_pages(filepath, dpi=OCR_DPI):
+    """Yield each page of a PDF as PNG bytes."""
+    if pypdfium2:
+        pdf = pypdfium2.PdfDocument(str(filepath))
+        try:
+            for i in range(len(pdf)):
+                page = pdf[i]
+                image = page.render(scale=dpi / 72, grayscale=True).to_pil()
+                buffer = BytesIO()
+                image.save(buffer, format="PNG")
+                page.close()
+                yield buffer.getvalue()
+        finally:
+            pdf.close()
+    else:
+        with pymupdf.open(str(filepath)) as pdf:
+            for page in pdf:
+                yield page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY).tobytes("png")
+
+def ocr_image(png, languages=OCR_LANGUAGES):
+    """Run Tesseract on one PNG image and return its text."""
+    # One thread per Tesseract process, so the OCR pool size is the real CPU cap
+    env = dict(os.environ, OMP_THREAD_LIMIT="1")
+    result = subprocess.run(
+        [tesseract(), "stdin", "stdout", "-l", languages], input=png,
+        capture_output=True, timeout=OCR_PAGE_TIMEOUT, env=env,
+    )
+    if result.returncode != 0:
+        raise ValueError(f"tesseract failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout.decode('utf-8', errors='replace').strip()
+
+def ocr_pdf(filepath):
+    """OCR every page of a PDF; returns one text per page."""
+    if not available():
+        raise RuntimeError("OCR needs tesseract on the PATH and pypdfium2 or PyMuPDF")
+    return [ocr_image(png) for png in render_pages(filepath)]
@@ -4,7 +4,7 @@ Semantic Analysis Pipeline for Digital Omnibus Consultation Responses
 
 This script:
 1. Extracts text from all PDFs and DOCXs
-2. Combines with feedback_text from CSV (for responses without attachments)
+2. Combines with the full feedback text (for responses without attachments)
 3. Creates embeddings for similarity analysis
 4. Clusters responses to find themes
 5. Calculates alignment with OpenMined's response
@@ -16,8 +16,10 @@ import sys
 import json
 import csv
 import re
+import argparse
+import heapq
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict
 from datetime import datetime
 
 # Check and install required packages
@@ -51,19 +53,40 @@ check_dependencies()
 
 import numpy as np
 import pandas as pd
-import pdfplumber
-from docx import Document
 from sentence_transformers import SentenceTransformer
 from sklearn.cluster import KMeans
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from embedding_store import (
+    EMBEDDING_CACHE_DIR_NAME, EmbeddingStore, cached_model_revision, loaded_model_revision, text_hash,
+)
+from language_id import UNDETERMINED, detect_language, stop_words
+from text_extraction import CACHE_DIR_NAME, extract_with_cache, extractor_for
+from text_normalization import clean_pages, clean_text
+from text_store import TEXTS_JSONL_NAME, TextStore, entry_pages, feedbacks_source, iter_feedbacks
 
 # Configuration
 DATA_DIR = Path("20401_digital_omnibus")
 ATTACHMENTS_DIR = DATA_DIR / "attachments"
 FEEDBACKS_CSV = DATA_DIR / "feedbacks.csv"
-EXTRACTED_TEXTS_FILE = DATA_DIR / "extracted_texts.json"
+EXTRACTED_TEXTS_FILE = DATA_DIR / TEXTS_JSONL_NAME  # extracted_texts.json is read if this is missing
 OUTPUT_DIR = DATA_DIR / "analysis"
+CACHE_DIR = DATA_DIR / CACHE_DIR_NAME  # Shared with extract_texts.py
+EMBEDDING_CACHE_DIR = DATA_DIR / EMBEDDING_CACHE_DIR_NAME  # Vectors keyed by model, revision and text hash
+EMBEDDING_MODEL = 'paraphrase-multilingual-MiniLM-L12-v2'  # Multilingual, since responses come in many languages
+EMBEDDING_MODEL_REVISION = None  # Hub branch, tag or commit to pin; None follows main
+EMBEDDING_DTYPE = 'float32'  # 'float16' halves the store; similarities then differ in the third decimal
+EMBEDDING_MODE = 'truncate'  # 'chunked' embeds whole documents as overlapping token windows
+POOLING_METHODS = ['mean', 'max', 'attention']  # How chunk vectors become a document vector
+CHUNK_OVERLAP = 32  # Tokens shared by consecutive windows
+MAX_CHUNKS_PER_DOC = 64  # Longer documents are sampled evenly, which bounds the encode cost
+CHUNK_BATCH_SIZE = 64
+ATTENTION_TEMPERATURE = 0.1  # Lower values weight the chunks closest to the reference more sharply
+DISAGREEMENT_THRESHOLD = 0.3  # Pairs less similar than this count as disagreements
+MAX_DISAGREEMENTS = 50  # Most different pairs reported
+DISAGREEMENT_BLOCK = 512  # Rows per similarity tile; memory is DISAGREEMENT_BLOCK x n similarities
 OPENMINED_FILE = "27566996_Omnibus Comments (5).pdf"
 
 # Create output directory
@@ -75,18 +98,21 @@ def log(message):
     print(f"[{timestamp}] {message}")
 
 def load_preextracted_texts():
-    """Load texts from pre-extracted JSON file if available."""
-    if EXTRACTED_TEXTS_FILE.exists():
-        log(f"Found pre-extracted texts at {EXTRACTED_TEXTS_FILE}")
+    """Load texts from the pre-extracted text store if available."""
+    try:
+        store = TextStore(DATA_DIR)
+    except FileNotFoundError:
+        store = None
+    
+    if store is not None:
+        log(f"Found pre-extracted texts at {EXTRACTED_TEXTS_FILE if EXTRACTED_TEXTS_FILE.exists() else store.json_path}")
         log("  Loading pre-extracted data (faster)...")
         
-        with open(EXTRACTED_TEXTS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         texts = {}
         metadata = {}
         
-        for item in data:
+        # Streamed record by record rather than parsed as one array
+        for item in store:
             fid = str(item['id'])
             if item['text']:
                 texts[fid] = item['text']
@@ -98,6 +124,7 @@ def load_preextracted_texts():
                     'firstName': item.get('firstName', ''),
                     'surname': item.get('surname', ''),
                     'language': item.get('language', ''),
+                    'detected_language': item.get('detected_language') or detect_language(item['text'])[0],
                     'date': item.get('date', ''),
                     'text_length': item.get('text_length', len(item['text'])),
                     'has_attachment': item.get('has_attachment', False)
@@ -108,55 +135,20 @@ def load_preextracted_texts():
     
     return None, None
 
-def extract_text_from_pdf(filepath):
-    """Extract text from a PDF file."""
-    try:
-        text = ""
-        with pdfplumber.open(filepath) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text.strip()
-    except Exception as e:
-        log(f"  Warning: Could not extract text from {filepath.name}: {e}")
-        return ""
-
-def extract_text_from_docx(filepath):
-    """Extract text from a DOCX file."""
-    try:
-        doc = Document(filepath)
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return text.strip()
-    except Exception as e:
-        log(f"  Warning: Could not extract text from {filepath.name}: {e}")
-        return ""
-
 def extract_text_from_file(filepath):
-    """Extract text from a file based on its extension."""
+    """Extract and clean a file's text, choosing the extractor by content (via the shared extraction cache)."""
     filepath = Path(filepath)
-    ext = filepath.suffix.lower()
-    
-    if ext == '.pdf':
-        return extract_text_from_pdf(filepath)
-    elif ext in ['.docx', '.doc']:
-        return extract_text_from_docx(filepath)
-    else:
-        # Try reading as plain text
-        try:
-            return filepath.read_text(encoding='utf-8', errors='ignore')
-        except:
-            return ""
+    extractor = extractor_for(filepath)
+    text = clean_pages(entry_pages(extract_with_cache(filepath, extractor, CACHE_DIR))) if extractor else ""
+    if not text:
+        log(f"  Warning: Could not extract text from {filepath.name}")
+    return text
 
 def load_feedbacks():
-    """Load feedbacks from CSV."""
-    log("Loading feedbacks from CSV...")
+    """Load feedbacks with their full text (feedbacks_raw.jsonl, else the truncated CSV)."""
+    log(f"Loading feedbacks from {feedbacks_source(DATA_DIR)}...")
     
-    feedbacks = []
-    with open(FEEDBACKS_CSV, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            feedbacks.append(row)
+    feedbacks = list(iter_feedbacks(DATA_DIR))
     
     log(f"  Loaded {len(feedbacks)} feedback entries")
     return feedbacks
@@ -212,9 +204,9 @@ def extract_all_texts(feedbacks, attachment_map):
         if i % 50 == 0:
             log(f"  Processing {i}/{total}...")
         
-        # Start with feedback_text from CSV
+        # Start with the feedback text
         text_parts = []
-        feedback_text = fb.get('feedback_text', '').strip()
+        feedback_text = clean_text(fb.get('feedback_text', ''))
         if feedback_text:
             text_parts.append(feedback_text)
         
@@ -241,6 +233,7 @@ def extract_all_texts(feedbacks, attachment_map):
                 'firstName': fb.get('firstName', ''),
                 'surname': fb.get('surname', ''),
                 'language': fb.get('language', ''),
+                'detected_language': detect_language(combined_text)[0],
                 'date': fb.get('date', ''),
                 'text_length': len(combined_text),
                 'has_attachment': len(attachment_files) > 0
@@ -256,13 +249,107 @@ def extract_all_texts(feedbacks, attachment_map):
     
     return texts, metadata
 
-def create_embeddings(texts, metadata):
-    """Create embeddings for all texts using sentence-transformers."""
-    log("Creating embeddings...")
-    
-    # Use a multilingual model since responses may be in different languages
+def chunk_text(text, tokenizer, window, overlap=CHUNK_OVERLAP, max_chunks=MAX_CHUNKS_PER_DOC):
+    """Split a text into windows of `window` tokens overlapping by `overlap`.
+    
+    Returns (chunk texts, token counts). Chunks are cut at token offsets in
+    the original text, so no text is lost or re-spaced.
+    """
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    offsets = encoding["offset_mapping"]
+    if len(offsets) <= window:
+        return [text], [len(offsets)]
+    step = window - overlap
+    starts = list(range(0, len(offsets) - overlap, step))
+    if len(starts) > max_chunks:
+        starts = [starts[int(i)] for i in np.linspace(0, len(starts) - 1, max_chunks)]
+    chunks, sizes = [], []
+    for start in starts:
+        end = min(start + window, len(offsets))
+        chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
+        sizes.append(end - start)
+    return chunks, sizes
+
+def pool_chunks(vectors, sizes, pooling='mean', reference=None):
+    """Pool one document's chunk vectors into a single vector.
+    
+    'mean' weights chunks by their token count, 'max' takes the element-wise
+    maximum, and 'attention' weights chunks by a softmax of their cosine
+    similarity to `reference` (mean pooling when there is no reference).
+    """
+    if pooling == 'max':
+        return vectors.max(axis=0)
+    weights = np.asarray(sizes, dtype=np.float32)
+    if not weights.sum():
+        weights = np.ones(len(vectors), dtype=np.float32)
+    if pooling == 'attention' and reference is not None:
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference)
+        similarities = vectors @ reference / np.maximum(norms, 1e-12)
+        weights = weights * np.exp((similarities - similarities.max()) / ATTENTION_TEMPERATURE)
+    return weights @ vectors / weights.sum()
+
+def load_embedding_model():
     log("  Loading multilingual model (this may take a minute)...")
-    model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+    return SentenceTransformer(EMBEDDING_MODEL, revision=EMBEDDING_MODEL_REVISION)
+
+def create_chunked_embeddings(texts, pooling='mean', reference_id=None):
+    """Embed whole documents as overlapping token windows pooled into one vector each.
+    
+    Chunk vectors are kept in the embedding store like whole texts, so
+    re-runs (including with another pooling) only encode new chunks. With
+    'attention' pooling, chunks are weighted by their similarity to the
+    mean-pooled vector of `reference_id`.
+    """
+    model = load_embedding_model()
+    revision = cached_model_revision(EMBEDDING_MODEL, EMBEDDING_MODEL_REVISION) or loaded_model_revision(model)
+    store = EmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, revision, EMBEDDING_DTYPE)
+    window = model.max_seq_length - 2  # Room for the [CLS]/[SEP] tokens the model adds
+    
+    ids = list(texts.keys())
+    chunked = {id: chunk_text(texts[id], model.tokenizer, window) for id in ids}
+    chunk_hashes = {id: [text_hash(c) for c in chunks] for id, (chunks, _) in chunked.items()}
+    total = sum(len(h) for h in chunk_hashes.values())
+    
+    # Every new chunk is encoded in one call, longest first so each batch holds similar lengths
+    new = {}
+    for id in ids:
+        for chunk, size, h in zip(*chunked[id], chunk_hashes[id]):
+            if h not in store and h not in new:
+                new[h] = (size, chunk)
+    log(f"  {len(ids)} documents in {total} chunks of up to {window} tokens "
+        f"({total - len(new)} already in {store.dir})")
+    if new:
+        order = sorted(new, key=lambda h: new[h][0], reverse=True)
+        log(f"  Encoding {len(order)} chunks...")
+        encoded = model.encode([new[h][1] for h in order], show_progress_bar=True, batch_size=CHUNK_BATCH_SIZE)
+        store.add(order, encoded)
+    
+    reference = None
+    if pooling == 'attention':
+        if reference_id in chunked:
+            reference = pool_chunks(store.get(chunk_hashes[reference_id]), chunked[reference_id][1])
+        else:
+            log("  ⚠ No reference response for attention pooling; using mean pooling")
+    embeddings = np.stack([
+        pool_chunks(store.get(chunk_hashes[id]), chunked[id][1], pooling, reference) for id in ids
+    ]).astype(np.float32)
+    
+    log(f"  ✓ Created {len(embeddings)} {pooling}-pooled embeddings of dimension {embeddings.shape[1]}")
+    
+    return ids, embeddings, model
+
+def create_embeddings(texts, metadata, mode=EMBEDDING_MODE, pooling='mean', reference_id=None):
+    """Create embeddings for all texts using sentence-transformers.
+    
+    Vectors are kept in the embedding store, so only texts that are new or
+    changed since the last run are encoded, and the model is not even loaded
+    when nothing changed (the returned model is then None). `mode`
+    'chunked' embeds whole documents instead of their first 10,000
+    characters (see create_chunked_embeddings).
+    """
+    log("Creating embeddings...")
+    if mode == 'chunked':
+        return create_chunked_embeddings(texts, pooling, reference_id)
     
     # Prepare texts for embedding
     ids = list(texts.keys())
@@ -271,9 +358,33 @@ def create_embeddings(texts, metadata):
     # Truncate very long texts (model has max token limit)
     max_chars = 10000  # Roughly 2500 tokens
     truncated_texts = [t[:max_chars] if len(t) > max_chars else t for t in text_list]
+    hashes = [text_hash(t) for t in truncated_texts]
+    
+    # The revision comes from the local model files; the model is only loaded when they cannot tell
+    model = None
+    revision = cached_model_revision(EMBEDDING_MODEL, EMBEDDING_MODEL_REVISION)
+    if revision is None:
+        model = load_embedding_model()
+        revision = cached_model_revision(EMBEDDING_MODEL, EMBEDDING_MODEL_REVISION) or loaded_model_revision(model)
+    store = EmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, revision, EMBEDDING_DTYPE)
+    missing = set(store.missing(hashes))
+    log(f"  {len(ids) - sum(h in missing for h in hashes)} of {len(ids)} embeddings found in {store.dir}")
     
-    log(f"  Encoding {len(truncated_texts)} texts...")
-    embeddings = model.encode(truncated_texts, show_progress_bar=True, batch_size=16)
+    if missing:
+        if model is None:
+            model = load_embedding_model()
+        # One text per new hash; same-language texts are encoded together
+        first = {}
+        for i, h in enumerate(hashes):
+            if h in missing:
+                first.setdefault(h, i)
+        order = sorted(first.values(), key=lambda i: metadata.get(ids[i], {}).get('detected_language', ''))
+        log(f"  Encoding {len(order)} texts...")
+        encoded = model.encode([truncated_texts[i] for i in order], show_progress_bar=True, batch_size=16)
+        store.add([hashes[i] for i in order], encoded)
+    
+    store.set_ids(ids, hashes)
+    embeddings = store.get(hashes)
     
     log(f"  ✓ Created {len(embeddings)} embeddings of dimension {embeddings.shape[1]}")
     
@@ -343,6 +454,18 @@ def cluster_responses(ids, embeddings, n_clusters=10):
     
     return dict(clusters), cluster_labels
 
+def dominant_language(member_ids, metadata):
+    """The most common detected language among a cluster's members, ignoring undetermined ones."""
+    languages = Counter(metadata.get(id, {}).get('detected_language', UNDETERMINED) for id in member_ids)
+    languages.pop(UNDETERMINED, None)
+    return languages.most_common(1)[0][0] if languages else UNDETERMINED
+
+def theme_stop_words(language):
+    """Stop words for TF-IDF themes in one language; English when undetermined."""
+    if language in ('en', UNDETERMINED):
+        return sorted(ENGLISH_STOP_WORDS.union(stop_words(['en'])))
+    return stop_words([language])
+
 def extract_cluster_themes(texts, clusters, metadata, n_keywords=10):
     """Extract key themes/keywords for each cluster using TF-IDF."""
     log("Extracting cluster themes...")
@@ -378,8 +501,20 @@ def extract_cluster_themes(texts, clusters, metadata, n_keywords=10):
         all_cluster_texts.append(cluster_text)
     
     if all_cluster_texts:
-        vectorizer = TfidfVectorizer(max_features=1000, stop_words='english', ngram_range=(1, 2))
-        tfidf_matrix = vectorizer.fit_transform(all_cluster_texts)
+        # Each cluster is tokenised with the stop words of its own dominant
+        # language, so "door" or "die" only go where they are function words;
+        # the weighting is still fitted across all clusters
+        analyzers = {}
+        cluster_terms = []
+        for cluster_id, cluster_text in zip(cluster_order, all_cluster_texts):
+            language = dominant_language(clusters[cluster_id], metadata)
+            if language not in analyzers:
+                analyzers[language] = TfidfVectorizer(
+                    stop_words=theme_stop_words(language), ngram_range=(1, 2)
+                ).build_analyzer()
+            cluster_terms.append(analyzers[language](cluster_text))
+        vectorizer = TfidfVectorizer(max_features=1000, analyzer=lambda terms: terms)
+        tfidf_matrix = vectorizer.fit_transform(cluster_terms)
         feature_names = vectorizer.get_feature_names_out()
         
         for i, cluster_id in enumerate(cluster_order):
@@ -393,38 +528,61 @@ def extract_cluster_themes(texts, clusters, metadata, n_keywords=10):
     return cluster_themes
 
 def find_disagreements(texts, metadata, embeddings, ids):
-    """Find pairs of responses that are most different from each other."""
+    """Find pairs of responses that are most different from each other.
+    
+    Similarities are computed in tiles of DISAGREEMENT_BLOCK rows against
+    the rows after them, so the n x n matrix is never held in memory. Each
+    tile contributes only its lowest MAX_DISAGREEMENTS candidates (plus
+    ties) to a bounded heap. Ties are broken by pair order, as a stable
+    sort of all pairs would.
+    """
     log("Analyzing disagreements...")
     
-    # Calculate pairwise similarities
-    similarity_matrix = cosine_similarity(embeddings)
-    
-    # Find most dissimilar pairs
-    disagreements = []
+    # Normalised once; each tile is then a plain dot product (as in cosine_similarity)
+    normalized = normalize(embeddings)
+    orgs = [metadata.get(id, {}).get('organization', 'Unknown') for id in ids]
+    has_org = np.array([bool(org) for org in orgs])  # Only pairs where both have organizations
     n = len(ids)
     
-    for i in range(n):
-        for j in range(i + 1, n):
-            sim = similarity_matrix[i][j]
-            if sim < 0.3:  # Threshold for "disagreement"
-                id1, id2 = ids[i], ids[j]
-                org1 = metadata.get(id1, {}).get('organization', 'Unknown')
-                org2 = metadata.get(id2, {}).get('organization', 'Unknown')
-                
-                if org1 and org2:  # Only include if both have organizations
-                    disagreements.append({
-                        'id1': id1,
-                        'id2': id2,
-                        'org1': org1,
-                        'org2': org2,
-                        'similarity': float(sim)
-                    })
+    found = 0
+    heap = []  # The MAX_DISAGREEMENTS lowest (similarity, i, j) so far, as a max-heap of negated keys
+    for start in range(0, n, DISAGREEMENT_BLOCK):
+        stop = min(start + DISAGREEMENT_BLOCK, n)
+        # Rows start..stop against columns start..n; column c is response start + c
+        tile = normalized[start:stop] @ normalized[start:].T
+        mask = (tile < DISAGREEMENT_THRESHOLD) & has_org[start:stop, None] & has_org[None, start:]
+        mask[:, :stop - start] &= np.triu(np.ones((stop - start, stop - start), dtype=bool), k=1)  # j > i only
+        count = int(np.count_nonzero(mask))
+        if not count:
+            continue
+        found += count
+        
+        values = np.where(mask, tile, np.inf).ravel()
+        cutoff = values[np.argpartition(values, MAX_DISAGREEMENTS - 1)[:MAX_DISAGREEMENTS]].max() \
+            if count > MAX_DISAGREEMENTS else DISAGREEMENT_THRESHOLD
+        if len(heap) == MAX_DISAGREEMENTS:
+            cutoff = min(cutoff, -heap[0][0])
+        # Candidates at or below the cutoff (keeping ties), in pair order
+        rows, cols = np.nonzero(mask & (tile <= cutoff))
+        for row, col in zip(rows, cols):
+            key = (-tile[row, col], -(start + row), -(start + col))
+            if len(heap) < MAX_DISAGREEMENTS:
+                heapq.heappush(heap, key)
+            elif key > heap[0]:
+                heapq.heapreplace(heap, key)
     
-    # Sort by lowest similarity
-    disagreements.sort(key=lambda x: x['similarity'])
+    disagreements = []
+    for sim, i, j in sorted((-sim, -i, -j) for sim, i, j in heap):
+        disagreements.append({
+            'id1': ids[i],
+            'id2': ids[j],
+            'org1': orgs[i],
+            'org2': orgs[j],
+            'similarity': float(sim)
+        })
     
-    log(f"  ✓ Found {len(disagreements)} potential disagreement pairs")
-    return disagreements[:50]  # Top 50 most different
+    log(f"  ✓ Found {found} potential disagreement pairs")
+    return disagreements  # Top MAX_DISAGREEMENTS most different
 
 def analyze_by_stakeholder_type(metadata, similarity_scores):
     """Analyze patterns by stakeholder type."""
@@ -659,8 +817,19 @@ def save_analysis_data(ids, metadata, similarity_scores, cluster_labels, cluster
         json.dump(serializable_stats, f, indent=2, ensure_ascii=False)
     log(f"  ✓ Saved {type_stats_path}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Semantic analysis of consultation responses.")
+    parser.add_argument("--embedding-mode", choices=["truncate", "chunked"], default=EMBEDDING_MODE,
+                        help="truncate: embed the first 10,000 characters; chunked: embed whole documents "
+                             f"as overlapping token windows (default: {EMBEDDING_MODE})")
+    parser.add_argument("--pooling", choices=POOLING_METHODS, default="mean",
+                        help="How chunked mode combines chunk vectors; attention weights chunks by "
+                             "similarity to OpenMined's response (default: mean)")
+    return parser.parse_args()
+
 def main():
     """Main execution function."""
+    args = parse_args()
     print("=" * 70)
     print("DIGITAL OMNIBUS SEMANTIC ANALYSIS PIPELINE")
     print("=" * 70)
@@ -693,12 +862,12 @@ def main():
         log("❌ Not enough texts extracted. Check your data.")
         return
     
-    # Step 4: Create embeddings
-    ids, embeddings, model = create_embeddings(texts, metadata)
-    
-    # Step 5: Find OpenMined's response
+    # Step 4: Find OpenMined's response (the reference for attention pooling)
     openmined_id = find_openmined_response(texts, metadata)
     
+    # Step 5: Create embeddings
+    ids, embeddings, model = create_embeddings(texts, metadata, args.embedding_mode, args.pooling, openmined_id)
+    
     # Step 6: Calculate similarities to OpenMined
     similarity_scores = {}
     if openmined_id:
@@ -0,0 +1,149 @@
+import struct
+import zipfile
+
+import pytest
+
+import document_formats
+
+SECTOR = 512
+END_OF_CHAIN, FAT_SECTOR, FREE_SECTOR, NO_STREAM = 0xFFFFFFFE, 0xFFFFFFFD, 0xFFFFFFFF, 0xFFFFFFFF
+
+
+def compound_file(streams):
+    """A version 3 OLE compound file holding `streams` (name -> bytes, each at least 4 KB)."""
+    names = list(streams)
+    sectors = [b"", b""]  # FAT, directory
+    fat = [FAT_SECTOR, END_OF_CHAIN]
+    starts = {}
+    for name in names:
+        data = streams[name]
+        assert len(data) >= 4096, "small streams would belong in the mini stream"
+        count = -(-len(data) // SECTOR)
+        starts[name] = len(sectors)
+        for i in range(count):
+            sectors.append(data[i * SECTOR:(i + 1) * SECTOR].ljust(SECTOR, b"\0"))
+            fat.append(len(fat) + 1 if i < count - 1 else END_OF_CHAIN)
+    assert len(fat) <= SECTOR // 4
+    sectors[0] = struct.pack(f"<{SECTOR // 4}I", *fat + [FREE_SECTOR] * (SECTOR // 4 - len(fat)))
+
+    def entry(name, entry_type, child=NO_STREAM, right=NO_STREAM, start=END_OF_CHAIN, size=0):
+        encoded = (name + "\0").encode("utf-16-le")
+        return (encoded.ljust(64, b"\0") + struct.pack("<HBB3I", len(encoded), entry_type, 1, NO_STREAM, right, child)
+                + b"\0" * 36 + struct.pack("<IQ", start, size))
+
+    directory = [entry("Root Entry", 5, child=1)]
+    for i, name in enumerate(names, 1):
+        directory.append(entry(name, 2, right=i + 1 if i < len(names) else NO_STREAM,
+                               start=starts[name], size=len(streams[name])))
+    assert len(directory) <= SECTOR // 128
+    sectors[1] = b"".join(directory).ljust(SECTOR, b"\0")
+
+    header = (b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1" + b"\0" * 16
+              + struct.pack("<HHHHH", 0x3E, 3, 0xFFFE, 9, 6) + b"\0" * 6
+              + struct.pack("<IIIIIIII", 0, 1, 1, 0, 4096, END_OF_CHAIN, 0, END_OF_CHAIN) + struct.pack("<I", 0)
+              + struct.pack("<109I", 0, *[FREE_SECTOR] * 108))
+    assert len(header) == SECTOR
+    return header + b"".join(sectors)
+
+
+def word_document(pieces):
+    """A Word 97 .doc whose main text is `pieces`: (text, compressed) pairs stored as a piece table."""
+    word = bytearray(8192)
+    struct.pack_into("<H", word, 0, 0xA5EC)
+    struct.pack_into("<H", word, 0x0A, 0x0200)  # Piece table lives in 1Table
+    cps = [0]
+    fcs = []
+    offset = 0x800
+    for text, compressed in pieces:
+        data = text.encode("cp1252" if compressed else "utf-16-le")
+        word[offset:offset + len(data)] = data
+        fcs.append((offset * 2) | 0x40000000 if compressed else offset)
+        cps.append(cps[-1] + len(text))
+        offset += len(data) + 16
+    struct.pack_into("<I", word, 0x4C, cps[-1])  # ccpText
+
+    plc = struct.pack(f"<{len(cps)}I", *cps) + b"".join(struct.pack("<HIH", 0, fc, 0) for fc in fcs)
+    clx = b"\x01" + struct.pack("<h", 2) + b"\0\0"  # One formatting (Prc) record to skip
+    clx += b"\x02" + struct.pack("<I", len(plc)) + plc
+    struct.pack_into("<II", word, 0x1A2, 0, len(clx))  # fcClx, lcbClx
+    table = clx.ljust(4096, b"\0")
+    return compound_file({"WordDocument": bytes(word), "1Table": table})
+
+
+@pytest.fixture(params=["builtin", "olefile"])
+def ole_reader(request, monkeypatch):
+    if request.param == "olefile":
+        pytest.importorskip("olefile")
+    else:
+        monkeypatch.setattr(document_formats, "olefile", None)
+    monkeypatch.setattr(document_formats, "ANTIWORD", None)  # Only the piece table may answer
+    return request.param
+
+
+def test_doc_text_is_rebuilt_from_the_piece_table(ole_reader, tmp_path):
+    path = tmp_path / "response.doc"
+    path.write_bytes(word_document([
+        ("Caf\xe9 owners\x1e support simplification.\r", True),
+        ("Zwölf Punkte – see \x13 HYPERLINK \"https://example.eu\" \x14our paper\x15.\x0bNext line\r\r\r", False),
+        ("Cell one\x07Cell two\x07\r", True),
+    ]))
+
+    text, backend = document_formats.doc_text(path)
+
+    assert backend == ("olefile" if ole_reader == "olefile" else "builtin-ole")
+    assert text == ("Caf\xe9 owners- support simplification.\n"
+                    "Zwölf Punkte – see our paper.\nNext line\n\n"
+                    "Cell one\tCell two")
+
+
+def test_encrypted_doc_is_refused(ole_reader, tmp_path):
+    document = bytearray(word_document([("Secret\r", True)]))
+    word_start = 3 * SECTOR  # Header, FAT and directory come first
+    struct.pack_into("<H", document, word_start + 0x0A, 0x0300)
+    path = tmp_path / "encrypted.doc"
+    path.write_bytes(bytes(document))
+
+    with pytest.raises(ValueError, match="encrypted"):
+        document_formats.doc_text(path)
+
+
+@pytest.mark.parametrize("rtf, text", [
+    (r"{\rtf1\ansi\ansicpg1252 Caf\'e9 cr\'e8me\par Second paragraph}", "Café crème\nSecond paragraph"),
+    (r"{\rtf1\ansi\ansicpg1250 P\'f8\'edli\'9a \'9elu\'9dou\'e8k\'fd k\'f9\'f2}", "Příliš žluťoučký kůň"),
+    (r"{\rtf1\uc1 Price: \u8364? 10, \u-3913? bullet}", "Price: \u20ac 10, \uf0b7 bullet"),
+    (r"{\rtf1{\fonttbl{\f0 Times New Roman;}}{\colortbl;\red0\green0\blue0;}"
+     r"{\*\generator Writer;}{\info{\title Hidden}}Body text}", "Body text"),
+    (r"{\rtf1 a\tab b\line c \{braces\} \\ back\~space\emdash end}", "a\tb\nc {braces} \\ back space—end"),
+    (r"{\rtf1 {\field{\*\fldinst HYPERLINK x}{\fldrslt the link}} text}", "the link text"),
+])
+def test_rtf_escapes_and_destinations(rtf, text):
+    assert document_formats.rtf_to_text(rtf) == text
+
+
+def test_rtf_file_is_read_as_bytes(tmp_path):
+    path = tmp_path / "letter.rtf"
+    path.write_bytes(b"{\\rtf1\\ansi Stra\\'dfe \xe9t\xe9}")
+    assert document_formats.rtf_text(path) == "Straße été"
+
+
+def test_odt_paragraphs_headings_and_spacing(tmp_path):
+    content = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+        'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">'
+        '<office:body><office:text>'
+        '<text:h text:outline-level="1">Position paper</text:h>'
+        '<text:p>We <text:span>strongly</text:span> support<text:s text:c="3"/>this.</text:p>'
+        '<text:p>Item<text:tab/>one<text:line-break/>continued'
+        '<text:note><text:note-citation>1</text:note-citation>'
+        '<text:note-body><text:p>A footnote.</text:p></text:note-body></text:note></text:p>'
+        '</office:text></office:body></office:document-content>'
+    )
+    path = tmp_path / "response.odt"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/vnd.oasis.opendocument.text")
+        archive.writestr("content.xml", content)
+
+    assert document_formats.odt_text(path) == (
+        "Position paper\nWe strongly support   this.\nItem\tone\ncontinued\nA footnote."
+    )
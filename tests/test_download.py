@@ -0,0 +1,305 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import download_omnibus_final as downloader
+import mock_ec_api
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Start a mock EC API and point the downloader at it, with rate limiting disabled."""
+    servers = []
+
+    def start(feedback_count=5, attachment_ratio=0, document_files=None, **faults):
+        feedbacks = mock_ec_api.generate_feedbacks(feedback_count, attachment_ratio=attachment_ratio, file_size=4096)
+        api = mock_ec_api.MockECAPI(feedbacks, document_files, **faults)
+        server = mock_ec_api.make_server(api, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(downloader, "BASE_URL", mock_ec_api.base_url(server))
+        monkeypatch.setattr(downloader, "rate_limiter", downloader.AdaptiveRateLimiter(0))
+        monkeypatch.setattr(downloader, "_session", None)
+        return api
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def run_download(consultation):
+    """One full, non-incremental downloader run for a consultation; returns its summary."""
+    with ThreadPoolExecutor(max_workers=2) as page_executor, ThreadPoolExecutor(max_workers=2) as download_executor:
+        count, skip_documents = downloader.fetch_consultation(consultation, page_executor)
+        futures = downloader.submit_attachment_downloads(
+            consultation, downloader.iter_feedbacks(consultation), download_executor, skip_documents
+        )
+        stats, file_type_counts = downloader.collect_attachment_downloads(consultation, futures)
+    return downloader.finish_consultation(consultation, count, stats, file_type_counts)
+
+
+def test_retry_after_is_honoured_with_rate_limiting_disabled(mock_api):
+    # The first request gets a 429 with Retry-After: 1
+    api = mock_api(burst_every=1000, burst_length=2, retry_after=1)
+    url = f"{downloader.BASE_URL}{downloader.FEEDBACK_ENDPOINT}"
+
+    started = time.monotonic()
+    response = downloader.api_get(url, params={"publicationId": "20401", "page": 0, "size": 10})
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 200
+    assert api.stats["throttled"] == 1
+    assert elapsed >= 1.0
+
+
+def test_failed_page_leaves_previous_feedbacks_and_manifest_alone(mock_api, monkeypatch, tmp_path):
+    api = mock_api(feedback_count=250)  # Three pages of 100
+    monkeypatch.setattr(downloader, "MAX_RETRIES", 1)
+    monkeypatch.setattr(downloader, "BACKOFF_BASE", 0.01)
+
+    consultation = downloader.Consultation("20401", tmp_path)
+    with ThreadPoolExecutor(max_workers=2) as page_executor:
+        count, _ = downloader.fetch_consultation(consultation, page_executor)
+        consultation.manifest.close()
+        assert count == 250
+        jsonl = (consultation.output_dir / "feedbacks_raw.jsonl").read_bytes()
+
+        api.fail_pages = {1}
+        with pytest.raises(downloader.PageFetchError) as failure:
+            downloader.fetch_consultation(consultation, page_executor)
+        consultation.manifest.close()
+
+    assert failure.value.page == 1
+    assert (consultation.output_dir / "feedbacks_raw.jsonl").read_bytes() == jsonl
+    downloader.open_manifest(consultation)
+    assert len(consultation.manifest.known_feedbacks()) == 250
+    consultation.manifest.close()
+
+
+def test_identical_attachments_share_one_blob(mock_api, tmp_path):
+    api = mock_api(feedback_count=4, attachment_ratio=1)
+    first, second = [att["documentId"] for fb in api.feedbacks[:2] for att in fb["attachments"][:1]]
+    position_paper = tmp_path / "position_paper.pdf"
+    position_paper.write_bytes(b"%PDF-1.4\n" + bytes(range(256)) * 20)
+    api.document_files = {first: position_paper, second: position_paper}
+    attachment_count = sum(len(fb["attachments"]) for fb in api.feedbacks)
+
+    consultation = downloader.Consultation("20401", tmp_path / "out")
+    summary = run_download(consultation)
+    assert summary["downloaded"] == attachment_count
+    assert summary["unique_blobs"] == attachment_count - 1
+
+    # The duplicate content is one blob, hard-linked under both attachment names
+    store = json.loads(consultation.store_manifest_file.read_text(encoding="utf-8"))
+    shared = [entry for entry in store.values() if entry["sha256"] == downloader.hash_file(position_paper)]
+    assert len(shared) == 2
+    blob = downloader.blob_path(consultation, shared[0]["sha256"])
+    assert blob.stat().st_nlink == 3
+    for entry in shared:
+        assert (consultation.attachments_dir / entry["filename"]).samefile(blob)
+
+    # attachment_store.json describes exactly the blobs and links on disk
+    blobs = {path.name for path in consultation.blobs_dir.rglob("*") if path.is_file()}
+    assert blobs == {entry["sha256"] for entry in store.values()}
+    for entry in store.values():
+        blob = downloader.blob_path(consultation, entry["sha256"])
+        assert downloader.hash_file(blob) == entry["sha256"]
+        assert blob.stat().st_size == entry["size"]
+        assert (consultation.attachments_dir / entry["filename"]).samefile(blob)
+
+    # A rerun finds everything through the store and downloads nothing
+    downloads = api.stats["downloads"]
+    rerun = run_download(downloader.Consultation("20401", tmp_path / "out"))
+    assert api.stats["downloads"] == downloads
+    assert (rerun["downloaded"], rerun["exists"]) == (0, attachment_count)
+    assert json.loads(consultation.store_manifest_file.read_text(encoding="utf-8")) == store
+
+
+def fetch_pages(api, consultation, **options):
+    """Fetch a consultation's feedbacks; returns (feedback count, pages requested)."""
+    pages = api.stats["pages"]
+    with ThreadPoolExecutor(max_workers=2) as page_executor:
+        count, _ = downloader.fetch_consultation(consultation, page_executor, **options)
+    consultation.manifest.close()
+    return count, api.stats["pages"] - pages
+
+
+def test_incremental_sync_stops_at_first_all_known_page(mock_api, tmp_path):
+    api = mock_api(feedback_count=280)
+    everything = api.feedbacks
+    api.feedbacks = everything[:250]
+    consultation = downloader.Consultation("20401", tmp_path)
+    assert fetch_pages(api, consultation) == (250, 3)
+
+    # 30 newer submissions: page 0 has them plus 70 known ones, page 1 is all known
+    api.feedbacks = everything
+    assert fetch_pages(api, consultation, incremental=True) == (280, 2)
+    ids = [fb["id"] for fb in downloader.iter_feedbacks(consultation)]
+    assert sorted(ids) == sorted(fb["id"] for fb in everything)
+    assert set(ids[:30]) == {fb["id"] for fb in everything[250:]}
+
+    assert fetch_pages(api, consultation, incremental=True) == (280, 1)
+
+
+def test_since_only_keeps_newer_submissions(mock_api, tmp_path):
+    api = mock_api(feedback_count=250)
+    since = downloader.parse_feedback_date(api.feedbacks[150]["dateFeedback"])
+    consultation = downloader.Consultation("20401", tmp_path)
+
+    # Newest first: page 0 is submissions 249-150, page 1 is all older than --since
+    assert fetch_pages(api, consultation, incremental=True, since=since) == (100, 2)
+    assert {fb["id"] for fb in downloader.iter_feedbacks(consultation)} == {fb["id"] for fb in api.feedbacks[150:]}
+
+
+def test_incremental_sync_pages_to_the_end_and_warns_at_the_cap(mock_api, monkeypatch, capsys, tmp_path):
+    api = mock_api(feedback_count=250)
+    assert fetch_pages(api, downloader.Consultation("20401", tmp_path / "full"), incremental=True) == (250, 3)
+    assert "cap" not in capsys.readouterr().out
+
+    monkeypatch.setattr(downloader, "MAX_PAGES", 2)
+    assert fetch_pages(api, downloader.Consultation("20401", tmp_path / "capped"), incremental=True) == (200, 2)
+    assert "Stopped at the 2-page cap" in capsys.readouterr().out
+
+
+def test_consultations_with_more_than_100_pages_are_fetched_in_full(mock_api, monkeypatch, capsys, tmp_path):
+    api = mock_api(feedback_count=101 * downloader.PAGE_SIZE + 5)
+    consultation = downloader.Consultation("20401", tmp_path / "full")
+    assert fetch_pages(api, consultation) == (len(api.feedbacks), 102)
+    ids = [fb["id"] for fb in downloader.iter_feedbacks(consultation)]
+    assert ids == [fb["id"] for fb in api.feedbacks]
+    assert "skipped" not in capsys.readouterr().out
+
+    # An explicit --max-pages still caps the fetch, but says so
+    monkeypatch.setattr(downloader, "MAX_PAGES", 100)
+    assert fetch_pages(api, downloader.Consultation("20401", tmp_path / "capped")) == (100 * downloader.PAGE_SIZE, 100)
+    assert f"about {downloader.PAGE_SIZE + 5} feedbacks will be skipped" in capsys.readouterr().out
+
+
+def download_attempts(consultation):
+    with sqlite3.connect(str(consultation.manifest_file)) as conn:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute("SELECT * FROM download_attempts ORDER BY id")]
+
+
+def test_every_transfer_attempt_gets_a_manifest_row(mock_api, monkeypatch, tmp_path):
+    api = mock_api(feedback_count=2, attachment_ratio=1, interrupt_downloads=1)
+    monkeypatch.setattr(downloader, "BACKOFF_BASE", 0.01)
+    resumed, *others = [att for fb in api.feedbacks for att in fb["attachments"]]
+    annex = tmp_path / "annex.pdf"
+    annex.write_bytes(b"%PDF-1.4\n" + bytes(range(256)) * 400)
+    api.document_files = {resumed["documentId"]: annex}
+    size = annex.stat().st_size
+    orphan = others[-1]
+    del orphan["documentId"]
+
+    consultation = downloader.Consultation("20401", tmp_path)
+    with ThreadPoolExecutor(max_workers=1) as page_executor:
+        downloader.fetch_consultation(consultation, page_executor)
+    for attachment in [resumed, orphan]:
+        downloader.download_and_record(consultation, attachment, None, 1, 2)
+    consultation.manifest.close()
+
+    rows = download_attempts(consultation)
+    interrupted, downloaded, failed = rows
+    assert interrupted["attachment_id"] == downloaded["attachment_id"] == str(resumed["id"])
+    assert interrupted["status"] == "interrupted"
+    assert interrupted["error"].startswith(downloader.INTERRUPTED)
+    assert 0 < interrupted["bytes"] <= size // 2
+    assert downloaded["status"] == "downloaded"
+    assert interrupted["bytes"] + downloaded["bytes"] == size
+    assert downloaded["sha256"] == downloader.hash_file(annex)
+    assert downloaded["error"] is None
+    assert api.stats["ranges"] == 1
+
+    assert failed["attachment_id"] == str(orphan["id"])
+    assert (failed["status"], failed["error"]) == ("failed", "No documentId")
+
+
+@pytest.fixture
+def annex(mock_api, tmp_path):
+    """A 100 KB attachment on the mock API: (api, download URL, bytes)."""
+    api = mock_api(feedback_count=1, attachment_ratio=1)
+    document_id = api.feedbacks[0]["attachments"][0]["documentId"]
+    path = tmp_path / "annex.pdf"
+    path.write_bytes(b"%PDF-1.4\n" + bytes(range(256)) * 400)
+    api.document_files = {document_id: path}
+    return api, f"{downloader.BASE_URL}{downloader.DOWNLOAD_ENDPOINT}{document_id}", path.read_bytes()
+
+
+def interrupt_download(api, url, filepath, partial_dir):
+    """Leave a partial download (with its validators) behind, as a dropped connection would."""
+    api.interrupt_downloads = 1
+    success, result, written = downloader.download_file(url, filepath, partial_dir)
+    assert not success and result.startswith(downloader.INTERRUPTED)
+    return written
+
+
+def test_fresh_download(annex, tmp_path):
+    api, url, body = annex
+    filepath = tmp_path / "annex_copy.pdf"
+    assert downloader.download_file(url, filepath, tmp_path / "partial") == (True, "pdf", len(body))
+    assert filepath.read_bytes() == body
+    assert list((tmp_path / "partial").iterdir()) == []
+    assert api.stats["ranges"] == 0
+
+
+def test_interrupted_download_resumes_with_range(annex, tmp_path):
+    api, url, body = annex
+    filepath, partial_dir = tmp_path / "annex_copy.pdf", tmp_path / "partial"
+    kept = interrupt_download(api, url, filepath, partial_dir)
+    assert 0 < kept < len(body)
+
+    assert downloader.download_file(url, filepath, partial_dir) == (True, "pdf", len(body) - kept)
+    assert filepath.read_bytes() == body
+    assert api.stats["ranges"] == 1
+
+
+def test_stale_partial_is_replaced_by_the_whole_file(annex, tmp_path):
+    api, url, body = annex
+    filepath, partial_dir = tmp_path / "annex_copy.pdf", tmp_path / "partial"
+    interrupt_download(api, url, filepath, partial_dir)
+    _, meta_path = downloader.partial_paths(filepath, partial_dir)
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta_path.write_text(json.dumps(dict(meta, etag='"an-older-version"')), encoding="utf-8")
+
+    # If-Range no longer matches, so the server answers 200 with the full body
+    assert downloader.download_file(url, filepath, partial_dir) == (True, "pdf", len(body))
+    assert filepath.read_bytes() == body
+    assert api.stats["ranges"] == 0
+
+
+def test_complete_partial_is_accepted_on_416(annex, tmp_path):
+    api, url, body = annex
+    filepath, partial_dir = tmp_path / "annex_copy.pdf", tmp_path / "partial"
+    interrupt_download(api, url, filepath, partial_dir)
+    partial, _ = downloader.partial_paths(filepath, partial_dir)
+    partial.write_bytes(body)  # The connection dropped after the last byte arrived
+    downloads = api.stats["downloads"]
+
+    assert downloader.download_file(url, filepath, partial_dir) == (True, "pdf", 0)
+    assert filepath.read_bytes() == body
+    assert api.stats["downloads"] == downloads
+
+
+def test_errors_that_are_not_stream_errors_fail_once(annex, monkeypatch, tmp_path):
+    api, url, body = annex
+
+    def broken_detect_file_type(*args, **kwargs):
+        raise ValueError("sniffer bug")
+
+    monkeypatch.setattr(downloader, "detect_file_type", broken_detect_file_type)
+    consultation = downloader.Consultation("20401", tmp_path / "out")
+    with ThreadPoolExecutor(max_workers=1) as page_executor:
+        downloader.fetch_consultation(consultation, page_executor)
+    attachment = api.feedbacks[0]["attachments"][0]
+    status, _, reason = downloader.download_and_record(consultation, attachment, None, 1, 1)
+    consultation.manifest.close()
+
+    assert (status, reason) == ("failed", "ValueError: sniffer bug")
+    assert api.stats["downloads"] == 1
+    assert [row["status"] for row in download_attempts(consultation)] == ["failed"]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, cached_model_revision, text_hash
+
+MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+MAIN_COMMIT = "a" * 40
+PINNED_COMMIT = "b" * 40
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch, tmp_path):
+    """Keep the real Hugging Face and sentence-transformers caches out of the tests."""
+    for name in ("HF_HOME", "HF_HUB_CACHE", "HUGGINGFACE_HUB_CACHE", "SENTENCE_TRANSFORMERS_HOME"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "home" / ".cache"))
+
+
+def make_hub_snapshot(hub, refs):
+    refs_dir = hub / f"models--sentence-transformers--{MODEL}" / "refs"
+    refs_dir.mkdir(parents=True)
+    for name, commit in refs.items():
+        (refs_dir / name).write_text(commit)
+
+
+def make_local_model(path, config):
+    path.mkdir(parents=True)
+    (path / "config.json").write_text(config)
+    (path / "model.safetensors").write_bytes(b"\0" * (2 * 1024 * 1024))
+    return path
+
+
+def test_revision_follows_hub_refs_under_custom_hf_home(monkeypatch, tmp_path):
+    monkeypatch.setenv("HF_HOME", str(tmp_path / "hf"))
+    make_hub_snapshot(tmp_path / "hf" / "hub", {"main": MAIN_COMMIT, "v2": PINNED_COMMIT})
+
+    assert cached_model_revision(MODEL) == MAIN_COMMIT
+    assert cached_model_revision(MODEL, "v2") == PINNED_COMMIT
+    assert cached_model_revision(MODEL, "c" * 40) == "c" * 40
+    assert cached_model_revision(MODEL, "missing-branch") is None
+    assert cached_model_revision("other/model") is None
+
+
+def test_local_models_get_distinct_fingerprints(tmp_path):
+    first = make_local_model(tmp_path / "first", '{"hidden_size": 384}')
+    second = make_local_model(tmp_path / "second", '{"hidden_size": 768}')
+
+    revision = cached_model_revision(str(first))
+    assert revision.startswith("local-")
+    assert revision == cached_model_revision(str(first))
+    assert revision != cached_model_revision(str(second))
+
+    (first / "model.safetensors").write_bytes(b"\1" * (3 * 1024 * 1024))
+    assert cached_model_revision(str(first)) != revision
+
+
+def test_store_reuses_vectors_only_for_the_same_revision(tmp_path):
+    hashes = [text_hash(f"response {i}") for i in range(4)]
+    vectors = np.arange(16, dtype=np.float32).reshape(4, 4)
+    EmbeddingStore(tmp_path, MODEL, MAIN_COMMIT).add(hashes, vectors)
+
+    reopened = EmbeddingStore(tmp_path, MODEL, MAIN_COMMIT)
+    assert reopened.missing(hashes) == []
+    assert np.array_equal(reopened.get(hashes), vectors)
+    assert EmbeddingStore(tmp_path, MODEL, PINNED_COMMIT).missing(hashes) == hashes
+    with pytest.raises(ValueError):
+        EmbeddingStore(tmp_path, MODEL, None)
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import zipfile
+
+import pytest
+
+import file_types
+from file_types import DOC, DOCX, HTML, ODS, ODT, PDF, PPT, PPTX, RTF, TEXT, XLS, XLSX, XML
+
+CONTENT_TYPES = '<?xml version="1.0"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>'
+
+
+def ooxml(parts, padding=0):
+    """An OOXML-style ZIP: [Content_Types].xml first (optionally padded past the sniffed header), then `parts`."""
+    def write(path):
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(zipfile.ZipInfo("[Content_Types].xml"), CONTENT_TYPES + " " * padding)
+            for part in parts:
+                archive.writestr(part, "<xml/>", zipfile.ZIP_DEFLATED)
+    return write
+
+
+def opendocument(mimetype):
+    def write(path):
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(zipfile.ZipInfo("mimetype"), mimetype)  # Stored, first, as ODF requires
+            archive.writestr("content.xml", "<office:document-content/>", zipfile.ZIP_DEFLATED)
+    return write
+
+
+def ole(*streams):
+    """Enough of an OLE compound file for sniffing: the magic and the directory entry names."""
+    directory = b"".join((name + "\0").encode("utf-16-le").ljust(128, b"\0") for name in ("Root Entry",) + streams)
+    return file_types.OLE_MAGIC + b"\0" * (1536 - 8) + directory
+
+
+def html_error_page():
+    return (b"\xef\xbb\xbf\r\n<!DOCTYPE html>\n<html><head><title>503 Service Unavailable</title></head>"
+            b"<body>The server is temporarily unable to service your request.</body></html>\n")
+
+
+CASES = [
+    # (file name, content, expected type)
+    ("response.docx", ooxml(["word/document.xml"]), DOCX),
+    ("response.doc", ooxml(["word/document.xml"]), DOCX),  # A DOCX saved with the old extension
+    ("figures.xlsx", ooxml(["xl/workbook.xml"]), XLSX),
+    ("slides.pdf", ooxml(["ppt/presentation.xml"]), PPTX),
+    ("upload.bin", ooxml(["word/document.xml"], padding=2 * file_types.HEADER_SIZE), DOCX),  # Parts past the header
+    ("response.docx", opendocument("application/vnd.oasis.opendocument.text"), ODT),
+    ("budget.xlsx", opendocument("application/vnd.oasis.opendocument.spreadsheet"), ODS),
+    ("response.docx", ole("WordDocument", "1Table"), DOC),  # An old .doc renamed .docx
+    ("response.doc", ole("Workbook"), XLS),
+    ("slides.doc", ole("PowerPoint Document"), PPT),
+    ("budget.xls", ole(), XLS),  # No known stream: the extension breaks the tie
+    ("upload.bin", ole(), DOC),
+    ("letter.doc", b"{\\rtf1\\ansi\\deff0 {\\fonttbl{\\f0 Arial;}} Dear Commission,\\par}", RTF),
+    ("annex.pdf", html_error_page(), HTML),  # An error page saved under the expected name
+    ("annex.pdf", b"<?xml version=\"1.0\"?><feed><entry/></feed>", XML),
+    ("report.docx", b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n1 0 obj\n<<>>\nendobj\n", PDF),
+    ("position.pdf", "Wir begrüßen den Vorschlag der Kommission.\n".encode("utf-8"), TEXT),
+    ("notes.doc", "Réponse à la consultation\r\n".encode("latin-1") * 40, TEXT),
+    ("cut.txt", b"a" * (file_types.HEADER_SIZE - 1) + "é".encode("utf-8"), TEXT),  # Character split by the header
+    ("image.pdf", b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + bytes(range(256)), None),
+]
+
+
+def write_case(directory, name, content):
+    path = directory / name
+    if callable(content):
+        content(path)
+    else:
+        path.write_bytes(content)
+    return path
+
+
+@pytest.mark.parametrize("name, content, expected", CASES)
+def test_sniff_file_classifies_by_content(tmp_path, name, content, expected):
+    path = write_case(tmp_path, name, content)
+
+    file_type, header = file_types.sniff_file(path)
+
+    assert file_type == expected
+    assert header == path.read_bytes()[:file_types.HEADER_SIZE]
+
+
+@pytest.mark.parametrize("name, content, expected", CASES)
+def test_hash_and_sniff_agrees_with_a_separate_hash(tmp_path, name, content, expected):
+    path = write_case(tmp_path, name, content)
+
+    sha256, file_type = file_types.hash_and_sniff(path)
+
+    assert sha256 == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert file_type == expected
+
+
+def test_hash_covers_bytes_beyond_the_header(tmp_path):
+    body = os.urandom(3 * 1024 * 1024)
+    path = tmp_path / "large.pdf"
+    path.write_bytes(b"%PDF-1.4\n" + body)
+
+    assert file_types.hash_and_sniff(path) == (hashlib.sha256(b"%PDF-1.4\n" + body).hexdigest(), PDF)
@@ -0,0 +1,166 @@
+import re
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")  # semantic_analysis installs missing packages on import
+
+import semantic_analysis
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+def test_cluster_themes_use_each_clusters_own_stop_words():
+    texts = {
+        "en1": "The front door and the die cutting machine: men want the door fixed.",
+        "en2": "A die maker and a door supplier say the men need die casting rules.",
+        "nl1": "De regels worden door de Commissie vereenvoudigd voor de bedrijven.",
+        "nl2": "Door de nieuwe regels worden de kosten voor bedrijven lager.",
+        "de1": "Die Regeln für die Unternehmen werden durch die Kommission vereinfacht.",
+        "de2": "Die Kosten für die Unternehmen sinken durch die neuen Regeln.",
+    }
+    metadata = {id: {"detected_language": id[:2]} for id in texts}
+    clusters = {0: ["en1", "en2"], 1: ["nl1", "nl2"], 2: ["de1", "de2"]}
+
+    themes = semantic_analysis.extract_cluster_themes(texts, clusters, metadata, n_keywords=50)
+
+    english = set(themes[0]["keywords"])
+    assert {"door", "die", "men"} <= english
+    assert "the" not in english
+    assert "door" not in themes[1]["keywords"]
+    assert "die" not in themes[2]["keywords"]
+    assert "regels" in themes[1]["keywords"] and "regeln" in themes[2]["keywords"]
+
+
+def test_dominant_language_ignores_undetermined_members():
+    metadata = {"a": {"detected_language": "und"}, "b": {"detected_language": "fr"}, "c": {}}
+    assert semantic_analysis.dominant_language(["a", "b", "c"], metadata) == "fr"
+    assert semantic_analysis.dominant_language(["a", "c"], metadata) == "und"
+
+
+def brute_force_disagreements(metadata, embeddings, ids):
+    """Every pair scored from the full similarity matrix, stably sorted: the pre-tiling implementation."""
+    similarity = cosine_similarity(embeddings)
+    pairs = []
+    for i in range(len(ids)):
+        for j in range(i + 1, len(ids)):
+            org1 = metadata.get(ids[i], {}).get("organization", "Unknown")
+            org2 = metadata.get(ids[j], {}).get("organization", "Unknown")
+            if similarity[i][j] < semantic_analysis.DISAGREEMENT_THRESHOLD and org1 and org2:
+                pairs.append({"id1": ids[i], "id2": ids[j], "org1": org1, "org2": org2,
+                              "similarity": float(similarity[i][j])})
+    pairs.sort(key=lambda pair: pair["similarity"])
+    return pairs[:semantic_analysis.MAX_DISAGREEMENTS]
+
+
+def disagreement_inputs(embeddings, seed):
+    rng = np.random.default_rng(seed)
+    ids = [f"fb{i}" for i in range(len(embeddings))]
+    metadata = {id: {"organization": "" if rng.random() < 0.15 else f"Org {i}"} for i, id in enumerate(ids)}
+    del metadata[ids[-1]]  # Missing metadata counts as "Unknown", which is kept
+    return metadata, ids
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("block, limit", [(7, 25), (64, 10), (512, 50), (13, 10_000)])
+def test_blocked_search_matches_brute_force(monkeypatch, seed, block, limit):
+    monkeypatch.setattr(semantic_analysis, "DISAGREEMENT_BLOCK", block)
+    monkeypatch.setattr(semantic_analysis, "MAX_DISAGREEMENTS", limit)
+    embeddings = np.random.default_rng(seed).normal(size=(150, 8))
+    metadata, ids = disagreement_inputs(embeddings, seed)
+
+    found = semantic_analysis.find_disagreements({}, metadata, embeddings, ids)
+    expected = brute_force_disagreements(metadata, embeddings, ids)
+
+    assert [(d["id1"], d["id2"], d["org1"], d["org2"]) for d in found] == \
+        [(d["id1"], d["id2"], d["org1"], d["org2"]) for d in expected]
+    assert [d["similarity"] for d in found] == pytest.approx([d["similarity"] for d in expected])
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("block", [1, 5, 32])
+def test_duplicate_vectors_and_ties_keep_pair_order(monkeypatch, seed, block):
+    monkeypatch.setattr(semantic_analysis, "DISAGREEMENT_BLOCK", block)
+    monkeypatch.setattr(semantic_analysis, "MAX_DISAGREEMENTS", 40)
+    # Unit vectors of +-0.25 entries: every similarity is an exact multiple of 1/16, so ties are exact.
+    # Drawing 80 rows from 6 distinct vectors gives many duplicates and many tied pairs at the cutoff.
+    rng = np.random.default_rng(seed)
+    distinct = rng.choice([-0.25, 0.25], size=(6, 16))
+    embeddings = distinct[rng.integers(0, len(distinct), size=80)]
+    metadata, ids = disagreement_inputs(embeddings, seed)
+
+    found = semantic_analysis.find_disagreements({}, metadata, embeddings, ids)
+
+    assert found == brute_force_disagreements(metadata, embeddings, ids)
+
+
+def word_tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False):
+    """A tokenizer with one token per whitespace-separated word, returning offsets like a fast HF tokenizer."""
+    return {"offset_mapping": [match.span() for match in re.finditer(r"\S+", text)]}
+
+
+def numbered_words(count, separator=" "):
+    return separator.join(f"w{i}" for i in range(count))
+
+
+@pytest.mark.parametrize("text, window, chunks, sizes", [
+    ("", 4, [""], [0]),
+    (numbered_words(3), 4, [numbered_words(3)], [3]),
+    (numbered_words(4), 4, [numbered_words(4)], [4]),
+    (numbered_words(10), 4, ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"], [4, 4, 4]),
+    (numbered_words(11), 4, ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9", "w9 w10"], [4, 4, 4, 2]),
+    ("  lead\n\nw1  w2\tw3 w4 w5  ", 4, ["lead\n\nw1  w2\tw3", "w3 w4 w5"], [4, 3]),
+])
+def test_chunk_boundaries(text, window, chunks, sizes):
+    assert semantic_analysis.chunk_text(text, word_tokenizer, window, overlap=1) == (chunks, sizes)
+
+
+@pytest.mark.parametrize("count, window, overlap", [(50, 8, 3), (51, 8, 0), (37, 5, 4), (100, 16, 15)])
+def test_chunks_overlap_and_cover_every_token(count, window, overlap):
+    chunks, sizes = semantic_analysis.chunk_text(numbered_words(count), word_tokenizer, window, overlap, max_chunks=1000)
+
+    tokens = [chunk.split() for chunk in chunks]
+    assert [len(t) for t in tokens] == sizes
+    assert all(size <= window for size in sizes)
+    assert tokens[0][0] == "w0" and tokens[-1][-1] == f"w{count - 1}"
+    for previous, current in zip(tokens, tokens[1:]):
+        assert previous[-overlap:] == current[:overlap] if overlap else previous[-1] != current[0]
+        assert int(current[0][1:]) == int(previous[0][1:]) + window - overlap
+    assert len(tokens) == 1 + -(-(count - window) // (window - overlap))  # No window lies wholly inside the last
+
+
+def test_long_documents_are_sampled_evenly():
+    chunks, sizes = semantic_analysis.chunk_text(numbered_words(100), word_tokenizer, 4, overlap=0, max_chunks=5)
+
+    assert [chunk.split()[0] for chunk in chunks] == ["w0", "w24", "w48", "w72", "w96"]
+    assert sizes == [4] * 5
+
+
+def test_mean_pooling_weights_chunks_by_token_count():
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], dtype=np.float32)
+
+    assert semantic_analysis.pool_chunks(vectors, [2, 1, 1]) == pytest.approx([0.75, 0.5])
+    assert semantic_analysis.pool_chunks(vectors, [0, 0, 0]) == pytest.approx([2 / 3, 2 / 3])
+    assert semantic_analysis.pool_chunks(vectors[:1], [7]) == pytest.approx([1.0, 0.0])
+
+
+def test_max_pooling_is_elementwise():
+    vectors = np.array([[1.0, -2.0, 0.5], [-1.0, 3.0, 0.25]], dtype=np.float32)
+
+    assert semantic_analysis.pool_chunks(vectors, [1, 100], 'max') == pytest.approx([1.0, 3.0, 0.5])
+
+
+def test_attention_pooling_weights_chunks_by_similarity_to_the_reference():
+    vectors = np.array([[2.0, 0.0], [0.0, 1.0], [1.0, 1.0]], dtype=np.float32)
+    sizes = [1, 2, 1]
+    reference = np.array([3.0, 0.0], dtype=np.float32)
+
+    similarities = np.array([1.0, 0.0, 1 / np.sqrt(2)])
+    weights = np.array(sizes) * np.exp(similarities / semantic_analysis.ATTENTION_TEMPERATURE)
+    expected = weights @ vectors / weights.sum()
+
+    pooled = semantic_analysis.pool_chunks(vectors, sizes, 'attention', reference)
+    assert pooled == pytest.approx(expected, rel=1e-5)
+    assert pooled[0] > semantic_analysis.pool_chunks(vectors, sizes)[0]  # Pulled towards the reference
+    assert semantic_analysis.pool_chunks(vectors, sizes, 'attention', reference * 10) == pytest.approx(pooled)
+    assert semantic_analysis.pool_chunks(vectors, sizes, 'attention') == \
+        pytest.approx(semantic_analysis.pool_chunks(vectors, sizes))
@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import ocr
+import text_extraction
+
+
+def make_pdf(path, lines):
+    """Write a one-page PDF with `lines` of Helvetica text, one per line."""
+    escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+    content = "BT /F1 12 Tf 72 720 Td 14 TL " + " ".join(f"({line}) '" for line in escaped) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def hyphenated_pdf(tmp_path):
+    return make_pdf(tmp_path / "hyphenated.pdf", [
+        "The response discusses pseudo-",
+        "nymisation and data protection safe-",
+        "guards in some detail.",
+    ])
+
+
+def test_backends_agree_on_hyphenated_line_breaks(hyphenated_pdf):
+    expected = "The response discusses pseudo-\nnymisation and data protection safe-\nguards in some detail."
+    for name, (function, _) in text_extraction.PDF_BACKENDS.items():
+        pages = function(hyphenated_pdf)
+        assert pages == [expected], name
+        assert "\ufffe" not in pages[0], name
+
+
+def exit_with_code(filepath):
+    os._exit(3)
+
+
+def kill_with_signal(filepath):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.mark.parametrize("extractor, detail", [
+    (exit_with_code, "worker exited with code 3"),
+    (kill_with_signal, "worker killed by signal SIGKILL"),
+])
+def test_supervisor_reports_how_a_worker_crashed(monkeypatch, tmp_path, extractor, detail):
+    monkeypatch.setitem(text_extraction.EXTRACTORS, "crashing", (extractor, "test"))
+    supervisor = text_extraction.ExtractionSupervisor(workers=1, timeout=30, max_memory_mb=0)
+    supervisor.context = multiprocessing.get_context("fork")  # Workers must see the patched EXTRACTORS
+    filepath = tmp_path / "input.bin"
+    filepath.write_bytes(b"data")
+
+    results = list(supervisor.run([("job", filepath, "crashing", "0" * 64)]))
+
+    assert results == [("job", None, ("crash", detail))]
+
+
+def test_tesseract_is_not_run_at_import(tmp_path):
+    marker = tmp_path / "tesseract-was-run"
+    fake = tmp_path / "tesseract"
+    fake.write_text(f"#!/bin/sh\ntouch {marker}\necho 'tesseract 5.3.0'\n")
+    fake.chmod(0o755)
+    env = dict(os.environ, PATH=f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    repo = Path(__file__).resolve().parent.parent
+
+    subprocess.run([sys.executable, "-c", "import text_extraction"], cwd=repo, env=env, check=True)
+    assert not marker.exists()
+
+    probe = "import text_extraction; assert text_extraction.ocr_available(); print(text_extraction.EXTRACTORS['ocr'][1])"
+    version = subprocess.run([sys.executable, "-c", probe], cwd=repo, env=env, check=True,
+                             capture_output=True, text=True).stdout
+    assert marker.exists()
+    assert "tesseract-5.3.0" in version
+
+
+@pytest.mark.parametrize("text, pages, scanned", [
+    ("", 3, True),
+    ("x" * 250, 3, True),  # Page numbers and a stamp or two: under 100 characters a page
+    ("x" * 350, 3, False),
+    ("word " * 20, None, True),  # Spaces do not count; no page offsets means one page
+    ("x" * 150, None, False),
+])
+def test_needs_ocr_routes_by_text_per_page(text, pages, scanned):
+    entry = {"text": text, "page_offsets": list(range(pages)) if pages else None}
+    assert text_extraction.needs_ocr(entry) is scanned
+
+
+def test_ocr_results_are_cached_by_content_hash(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_ocr_pdf(filepath):
+        calls.append(filepath)
+        return ["Scanned page one", "Scanned page two"]
+
+    monkeypatch.setattr(text_extraction, "EXTRACTORS", dict(text_extraction.EXTRACTORS))
+    monkeypatch.setattr(ocr, "available", lambda: True)
+    monkeypatch.setattr(ocr, "tesseract_version", lambda: "5.3.0")
+    monkeypatch.setattr(ocr, "ocr_pdf", fake_ocr_pdf)
+    scan = make_pdf(tmp_path / "scan.pdf", [])
+    copy = tmp_path / "same_scan_other_name.pdf"
+    copy.write_bytes(scan.read_bytes())
+    cache_dir = tmp_path / "cache"
+
+    first = text_extraction.extract_with_cache(scan, "ocr", cache_dir)
+    second = text_extraction.extract_with_cache(copy, "ocr", cache_dir)
+
+    assert len(calls) == 1
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["text"] == "Scanned page one\nScanned page two"
+    sha256 = text_extraction.hash_file(scan)
+    assert second["sha256"] == sha256
+    cached = list(cache_dir.rglob("*.json"))
+    assert [path.name.split(".")[0] for path in cached] == [sha256]
+    assert "tesseract-5.3.0" in cached[0].name
@@ -0,0 +1,27 @@
+from text_normalization import clean_pages, clean_text, dehyphenate
+
+
+def test_dehyphenate_joins_pdfium_hyphen_marker():
+    assert dehyphenate("pseudo\ufffenymisation and safe\ufffe\nguards") == "pseudonymisation and safeguards"
+    assert dehyphenate("Member\ufffeStates") == "Member-\nStates"
+
+
+def test_dehyphenate_joins_plain_hyphen_breaks():
+    assert clean_text("data protec-\ntion, Member-\nStates") == "data protection, Member-\nStates"
+
+
+def test_short_pages_keep_repeated_lines():
+    pages = ["Question 1\nYes\nQuestion 2\nNo"] * 4
+    assert clean_pages(pages) == "\n".join(pages)
+
+
+def test_running_headers_and_page_numbers_are_removed():
+    topics = ["consent", "cookies", "breach reporting", "legitimate interest"]
+    pages = [
+        "ACME Position Paper\n" + "\n".join(f"On {topic}, point {word}." for word in "abcdef") + f"\nPage {n} of 4"
+        for n, topic in enumerate(topics, 1)
+    ]
+    cleaned = clean_pages(pages)
+    assert "ACME Position Paper" not in cleaned
+    assert "Page 2 of 4" not in cleaned
+    assert all(f"On {topic}, point f." in cleaned for topic in topics)
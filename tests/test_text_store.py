@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+import text_store
+from text_store import TextStore, TextStoreWriter, export_json
+
+RECORDS = [
+    {"id": 101, "organization": "Verbraucherzentrale", "text": "Wir begrüßen \"den\" Vorschlag.\nZweite Zeile",
+     "attachments": [{"file": "a.pdf", "pages": 3, "tables": []}], "meta": {}, "detected_language": "de"},
+    {"id": "102", "organization": "", "text": "", "attachments": [], "score": 0.5, "flags": [True, None],
+     "detected_language": ""},
+    {"id": 103, "organization": "ÚOHS – Praha", "text": "Tab\tand emoji \U0001f600 and \\ backslash",
+     "nested": {"list": [[1, 2], {"k": "v"}], "empty": []}, "detected_language": "cs"},
+]
+
+
+def write_store(data_dir, records):
+    writer = TextStoreWriter(data_dir)
+    for record in records:
+        writer.write(record)
+    writer.close()
+
+
+@pytest.mark.parametrize("records", [RECORDS, RECORDS[:1], []])
+def test_export_json_matches_json_dump(tmp_path, records):
+    write_store(tmp_path, records)
+
+    path = export_json(tmp_path)
+
+    assert path.read_text(encoding="utf-8") == json.dumps(records, indent=2, ensure_ascii=False)
+    assert json.loads(path.read_text(encoding="utf-8")) == records
+
+
+def test_index_is_rebuilt_when_the_jsonl_changes(tmp_path):
+    write_store(tmp_path, RECORDS)
+    store = TextStore(tmp_path)
+    assert store.ids() == ["101", "103"]
+
+    # Lengthen the first record in place, shifting every later offset, and append a new one
+    jsonl_path = tmp_path / text_store.TEXTS_JSONL_NAME
+    lines = jsonl_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    lines[0] = json.dumps(dict(RECORDS[0], text="A much longer replacement text"), ensure_ascii=False) + "\n"
+    lines.append(json.dumps({"id": 104, "text": "Late addition", "detected_language": "en"}) + "\n")
+    jsonl_path.write_text("".join(lines), encoding="utf-8")
+
+    store = TextStore(tmp_path)
+
+    assert len(store) == 4
+    assert store.get(101)["text"] == "A much longer replacement text"
+    assert store.get(103) == RECORDS[2]
+    assert store.get("104")["text"] == "Late addition"
+    assert store.language(104) == "en"
+    index = json.loads((tmp_path / text_store.TEXTS_INDEX_NAME).read_text(encoding="utf-8"))
+    assert index["size"] == jsonl_path.stat().st_size
+    assert [entry[0] for entry in index["entries"]] == ["101", "102", "103", "104"]
+
+
+def test_same_size_edit_is_caught_by_mtime(tmp_path):
+    write_store(tmp_path, RECORDS[:1])
+    TextStore(tmp_path)
+    jsonl_path = tmp_path / text_store.TEXTS_JSONL_NAME
+    original = jsonl_path.read_bytes()
+    stat = jsonl_path.stat()
+
+    jsonl_path.write_bytes(original.replace(b'"id": 101', b'"id": 909'))
+    os.utime(jsonl_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    store = TextStore(tmp_path)
+    assert 909 in store and 101 not in store
+
+
+def test_current_index_is_not_rebuilt(tmp_path, monkeypatch):
+    write_store(tmp_path, RECORDS)
+    monkeypatch.setattr(text_store, "build_index", lambda *args: pytest.fail("index rebuilt"))
+
+    assert TextStore(tmp_path).get(102) == RECORDS[1]
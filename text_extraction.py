@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Shared attachment text extraction with an on-disk cache.
+
+Extractors return one text per page (DOCX extraction also returns the cells
+of each page's tables). PDFs go through a registry of backends:
+the fastest installed one (pypdfium2, PyMuPDF, then pdfminer's low-level API)
+runs first, and pdfplumber's slower layout-aware extraction is only used when
+the fast path yields empty or garbled text. Legacy Word .doc, RTF and ODT
+files are handled by document_formats.py. Scanned PDFs whose text layer is
+empty or nearly so (needs_ocr) can be run through the "ocr" extractor
+(ocr.py), which is only registered when Tesseract is installed. Results are
+cached under
+extraction_cache/<sha[:2]>/ keyed by the file's SHA-256 plus the extractor's
+name and version, together with the page offsets into the joined text. Re-runs
+of extract_texts.py or helpers/fix_and_extract.py therefore only parse
+attachments that are new, changed, or were last parsed by another extractor
+version.
+
+ExtractionSupervisor runs extractions in worker processes that are killed
+when a file exceeds its wall-clock or memory budget. Such files are recorded
+in a quarantine list so one bad upload cannot stall or crash a whole run.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import time
+import unicodedata
+from datetime import datetime
+from functools import partial
+from io import StringIO
+from multiprocessing.connection import wait
+from pathlib import Path
+
+import docx
+import pdfplumber
+from docx import Document
+
+import document_formats
+import file_types
+import ocr
+from text_normalization import PDFIUM_HYPHEN_BREAK
+
+# Optional fast PDF backends; any that are missing are simply not registered
+try:
+    import pypdfium2
+    import pypdfium2.version
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+try:
+    import pdfminer
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+except ImportError:
+    pdfminer = None
+
+try:
+    import resource  # Unix only; without it the memory limit is enforced by polling alone
+except ImportError:
+    resource = None
+
+CACHE_DIR_NAME = "extraction_cache"
+EXTRACTOR_REVISION = "2"  # Bump when an extractor's output changes for the same library version
+QUARANTINE_FILE_NAME = "extraction_quarantine.json"
+EXTRACTION_TIMEOUT = 120  # Seconds one file may take before its worker is killed
+MAX_EXTRACTION_MEMORY_MB = 2048  # Resident memory one worker may use
+WATCHDOG_INTERVAL = 0.2  # Seconds between deadline/RSS checks
+REAP_TIMEOUT = 1  # Seconds to wait for a dead worker's exit status
+
+GARBLED_THRESHOLD = 0.05  # Share of unreadable characters above which fast-path text is rejected
+MIN_LETTER_SHARE = 0.3  # Below this share of letters the text is treated as garbled too
+OCR_MIN_CHARS_PER_PAGE = 100  # PDFs with fewer non-space characters per page are treated as scans
+
+def pdfplumber_pages(filepath):
+    """pdfplumber's layout-aware extraction: accurate but slow."""
+    with pdfplumber.open(filepath) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+def pdfium_pages(filepath):
+    """pypdfium2 (PDFium, the Chrome PDF engine) text extraction.
+
+    PDFium replaces a hyphen at the end of a line (and the line break) with
+    U+FFFE; both are put back so the text matches the other backends.
+    """
+    pdf = pypdfium2.PdfDocument(str(filepath))
+    try:
+        pages = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            text = textpage.get_text_range().replace("\r\n", "\n").replace("\r", "\n")
+            pages.append(PDFIUM_HYPHEN_BREAK.sub("-\n", text).strip())
+            textpage.close()
+            page.close()
+        return pages
+    finally:
+        pdf.close()
+
+def pymupdf_pages(filepath):
+    """PyMuPDF (MuPDF) text extraction."""
+    with pymupdf.open(filepath) as pdf:
+        return [page.get_text().strip() for page in pdf]
+
+def pdfminer_pages(filepath):
+    """pdfminer's low-level page interpreter, without pdfplumber's per-character objects."""
+    manager = PDFResourceManager(caching=True)
+    pages = []
+    with open(filepath, 'rb') as f:
+        for page in PDFPage.get_pages(f):
+            output = StringIO()
+            device = TextConverter(manager, output, laparams=LAParams())
+            PDFPageInterpreter(manager, device).process_page(page)
+            device.close()
+            pages.append(output.getvalue().replace("\x0c", "").strip())
+    return pages
+
+# PDF backend name -> (function, version), registered only when the library is installed
+PDF_BACKENDS = {}
+
+def register_pdf_backend(name, function, version):
+    """Make a PDF backend available to extract_pdf_pages() and the benchmark."""
+    PDF_BACKENDS[name] = (function, f"{name}-{version}")
+
+if pypdfium2:
+    register_pdf_backend("pypdfium2", pdfium_pages, pypdfium2.version.PYPDFIUM_INFO)
+if pymupdf:
+    register_pdf_backend("pymupdf", pymupdf_pages, getattr(pymupdf, "VersionBind", "unknown"))
+if pdfminer:
+    register_pdf_backend("pdfminer", pdfminer_pages, pdfminer.__version__)
+register_pdf_backend("pdfplumber", pdfplumber_pages, pdfplumber.__version__)
+
+FAST_PDF_BACKENDS = ["pypdfium2", "pymupdf", "pdfminer"]  # Preference order for the fast path
+FALLBACK_PDF_BACKEND = "pdfplumber"
+
+def fast_pdf_backend():
+    """The preferred installed fast backend, or None if only pdfplumber is available."""
+    return next((name for name in FAST_PDF_BACKENDS if name in PDF_BACKENDS), None)
+
+def looks_garbled(pages):
+    """True if extracted text is empty or mostly unreadable (missing font maps, CID codes)."""
+    text = "".join(pages)
+    chars = "".join(text.split())
+    if not chars:
+        return True
+    unreadable = sum(1 for c in chars if c == "\ufffd" or unicodedata.category(c) in ("Co", "Cc", "Cn"))
+    unreadable += 5 * text.count("(cid:")
+    letters = sum(1 for c in chars if c.isalpha())
+    return unreadable / len(chars) > GARBLED_THRESHOLD or letters / len(chars) < MIN_LETTER_SHARE
+
+def extract_pdf_with(backend, filepath):
+    """Extract a PDF with one named backend; returns (pages, backend)."""
+    try:
+        return PDF_BACKENDS[backend][0](filepath), backend
+    except MemoryError:
+        raise
+    except Exception:
+        return [], backend
+
+def extract_pdf_pages(filepath):
+    """Extract a PDF with the fast backend, falling back to pdfplumber on empty or garbled text."""
+    fast = fast_pdf_backend()
+    if fast:
+        pages, backend = extract_pdf_with(fast, filepath)
+        if not looks_garbled(pages):
+            return pages, backend
+    fallback_pages, backend = extract_pdf_with(FALLBACK_PDF_BACKEND, filepath)
+    if fast and looks_garbled(fallback_pages) and "".join(pages).strip():
+        return pages, fast  # pdfplumber did no better; keep what the fast path found
+    return fallback_pages, backend
+
+def extract_docx_pages(filepath):
+    """Extract text from a DOCX; Word documents have no fixed pages, so this is one page.
+
+    Table cells are returned separately as the third item (per page: tables of rows of cells).
+    """
+    try:
+        doc = Document(filepath)
+        tables = [[[cell.text.strip() for cell in row.cells] for row in table.rows] for table in doc.tables]
+        return ["\n".join([p.text for p in doc.paragraphs]).strip()], "python-docx", [tables]
+    except MemoryError:
+        raise
+    except Exception:
+        return [], "python-docx"
+
+def extract_doc_pages(filepath):
+    """Extract text from a Word 97-2003 .doc (one page, like DOCX)."""
+    try:
+        text, backend = document_formats.doc_text(filepath)
+        return [text], backend
+    except MemoryError:
+        raise
+    except Exception:
+        return [], "doc"
+
+def extract_rtf_pages(filepath):
+    """Extract text from an RTF document (one page)."""
+    try:
+        return [document_formats.rtf_text(filepath)], "rtf"
+    except MemoryError:
+        raise
+    except Exception:
+        return [], "rtf"
+
+def extract_odt_pages(filepath):
+    """Extract text from an OpenDocument text file (one page)."""
+    try:
+        return [document_formats.odt_text(filepath)], "odt"
+    except MemoryError:
+        raise
+    except Exception:
+        return [], "odt"
+
+def extract_ocr_pages(filepath):
+    """OCR a scanned PDF page by page with Tesseract."""
+    try:
+        return ocr.ocr_pdf(filepath), "tesseract"
+    except MemoryError:
+        raise
+    except Exception:
+        return [], "tesseract"
+
+def extract_plain_pages(filepath):
+    """Read any other file as text."""
+    try:
+        return [Path(filepath).read_text(errors='ignore')], "plaintext"
+    except Exception:
+        return [], "plaintext"
+
+# Extractor name -> (function, version); the version is part of the cache key.
+# "pdf" is the fast-path-with-fallback chain, "pdf:<backend>" forces one backend.
+PDF_CHAIN = [name for name in (fast_pdf_backend(), FALLBACK_PDF_BACKEND) if name]
+EXTRACTORS = {
+    "pdf": (extract_pdf_pages, EXTRACTOR_REVISION + "+" + "+".join(PDF_BACKENDS[name][1] for name in PDF_CHAIN)),
+    "python-docx": (extract_docx_pages, f"{EXTRACTOR_REVISION}+tables+{getattr(docx, '__version__', 'unknown')}"),
+    "doc": (extract_doc_pages, "+".join(filter(None, [
+        EXTRACTOR_REVISION,
+        f"olefile-{document_formats.olefile.__version__}" if document_formats.olefile else "builtin-ole",
+        "antiword" if document_formats.ANTIWORD else None,
+    ]))),
+    "rtf": (extract_rtf_pages, EXTRACTOR_REVISION),
+    "odt": (extract_odt_pages, EXTRACTOR_REVISION),
+    "plaintext": (extract_plain_pages, EXTRACTOR_REVISION),
+}
+for _name, (_function, _version) in PDF_BACKENDS.items():
+    EXTRACTORS[f"pdf:{_name}"] = (partial(extract_pdf_with, _name), f"{EXTRACTOR_REVISION}+{_version}")
+
+def ocr_available():
+    """True if scanned PDFs can be OCRed here; registers the "ocr" extractor the first time.
+
+    Its version comes from running Tesseract, so this waits until a scan
+    needs OCR instead of running whenever the module is imported.
+    """
+    if "ocr" not in EXTRACTORS and ocr.available():
+        # Language packs and resolution change the output, so they are part of the version
+        EXTRACTORS["ocr"] = (extract_ocr_pages, f"{EXTRACTOR_REVISION}+tesseract-{ocr.tesseract_version()}"
+                                                f"+{ocr.OCR_LANGUAGES}+{ocr.OCR_DPI}dpi+{ocr.renderer()}")
+    return "ocr" in EXTRACTORS
+
+def extractor_spec(extractor):
+    """(function, version) of an extractor, setting up OCR on first use."""
+    if extractor == "ocr":
+        ocr_available()
+    return EXTRACTORS[extractor]
+
+# Sniffed file type (see file_types.py) -> extractor name. Types without an
+# entry (spreadsheets, presentations, unrecognised binaries) are not extracted.
+TYPE_EXTRACTORS = {
+    file_types.PDF: "pdf",
+    file_types.DOCX: "python-docx",
+    file_types.DOC: "doc",
+    file_types.RTF: "rtf",
+    file_types.ODT: "odt",
+    file_types.TEXT: "plaintext",
+    file_types.HTML: "plaintext",
+    file_types.XML: "plaintext",
+}
+
+def extractor_for(filepath, pdf_extractor="pdf", file_type=None):
+    """Choose an extractor from the file's content, sniffing it unless `file_type` is given.
+
+    `pdf_extractor` may force one PDF backend. Returns None for types with no extractor.
+    """
+    if file_type is None:
+        file_type, _ = file_types.sniff_file(filepath)
+    extractor = TYPE_EXTRACTORS.get(file_type)
+    return pdf_extractor if extractor == "pdf" else extractor
+
+def needs_ocr(entry):
+    """True if a PDF's extracted text is too thin for its page count to be anything but a scan."""
+    pages = max(1, len(entry.get("page_offsets") or []))
+    chars = len("".join(entry["text"].split()))
+    return chars / pages < OCR_MIN_CHARS_PER_PAGE
+
+def join_pages(pages):
+    """Join page texts the way the original extractors did; return (text, page_offsets).
+
+    Non-empty pages are separated by a newline and the result is stripped.
+    page_offsets[i] is where page i starts in the text (empty pages share the
+    offset of the next page).
+    """
+    text = ""
+    offsets = []
+    for page in pages:
+        offsets.append(len(text))
+        if page:
+            text += page + "\n"
+    lead = len(text) - len(text.lstrip())
+    text = text.strip()
+    return text, [min(max(0, offset - lead), len(text)) for offset in offsets]
+
+def hash_file(filepath):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_entry(sha256, extractor, pages, backend=None, page_tables=None):
+    """The cache entry for one extraction; "page_tables" is only present when a page has tables."""
+    text, offsets = join_pages(pages)
+    entry = {
+        "sha256": sha256,
+        "extractor": extractor,
+        "version": extractor_spec(extractor)[1],
+        "backend": backend or extractor,
+        "text": text,
+        "page_offsets": offsets,
+        "extracted_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    if page_tables and any(page_tables):
+        entry["page_tables"] = page_tables
+    return entry
+
+class ExtractionCache:
+    """Extraction results on disk, one JSON file per (content hash, extractor, version)."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def path(self, sha256, extractor):
+        version = extractor_spec(extractor)[1]
+        return self.cache_dir / sha256[:2] / f"{sha256}.{extractor.replace(':', '_')}-{version}.json"
+
+    def get(self, sha256, extractor):
+        """Return the cached entry, or None if this content was never extracted this way."""
+        path = self.path(sha256, extractor)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, sha256, extractor, pages, backend=None, page_tables=None):
+        """Store the pages extracted from a file and return the entry."""
+        entry = build_entry(sha256, extractor, pages, backend, page_tables)
+        path = self.path(sha256, extractor)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a per-process name and moved into place, so pool workers never clash
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return entry
+
+def extract_with_cache(filepath, extractor, cache_dir=None, sha256=None):
+    """Extract a file with `extractor`, going through the cache when `cache_dir` is set.
+
+    A module-level function so it can run in a process pool. Returns the
+    cache entry (text, page_offsets, ...) plus "cached": True/False.
+    """
+    function = extractor_spec(extractor)[0]
+    if cache_dir is None:
+        entry = build_entry(sha256, extractor, *function(filepath))
+        entry["cached"] = False
+        return entry
+
+    cache = ExtractionCache(cache_dir)
+    sha256 = sha256 or hash_file(filepath)
+    entry = cache.get(sha256, extractor)
+    if entry is not None:
+        entry["cached"] = True
+        return entry
+    entry = cache.put(sha256, extractor, *function(filepath))
+    entry["cached"] = False
+    return entry
+
+def load_quarantine(path):
+    """Load the quarantine list: content hash -> why extraction was abandoned."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_quarantine(path, quarantine):
+    """Write the quarantine list atomically."""
+    path = Path(path)
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(quarantine, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def process_rss(pid):
+    """Resident memory of a process in bytes, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def process_data_size():
+    """This process's data segment size in bytes (VmData), or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmData:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def supervised_worker(conn, memory_limit):
+    """Worker loop: extract files sent over `conn` until told to stop."""
+    baseline = process_data_size()
+    if memory_limit and resource and baseline is not None:
+        # Hard backstop under the parent's RSS polling: allocations past the limit fail at once
+        limit = baseline + memory_limit
+        try:
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+        except (ValueError, OSError):
+            pass
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        job_id, filepath, extractor, cache_dir, sha256 = job
+        try:
+            conn.send((job_id, extract_with_cache(filepath, extractor, cache_dir, sha256), None))
+        except MemoryError:
+            conn.send((job_id, None, ("memory", "allocation failed inside the extractor")))
+        except Exception as e:
+            conn.send((job_id, None, ("error", f"{type(e).__name__}: {e}")))
+
+class ExtractionSupervisor:
+    """Process pool that kills workers exceeding a per-file time or memory budget.
+    
+    Each worker handles one file at a time. The parent watches every busy
+    worker's elapsed time and resident memory; an offender is killed and
+    replaced, and its file is reported as failed with the reason, while the
+    other workers carry on. A timeout or memory limit of 0 disables that check.
+    """
+
+    def __init__(self, workers, timeout=EXTRACTION_TIMEOUT, max_memory_mb=MAX_EXTRACTION_MEMORY_MB, cache_dir=None):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit = max_memory_mb * 1024 * 1024 if max_memory_mb else 0
+        self.cache_dir = cache_dir
+        self.context = multiprocessing.get_context()
+
+    def spawn(self):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=supervised_worker, args=(child_conn, self.memory_limit), daemon=True)
+        process.start()
+        child_conn.close()
+        return {"process": process, "conn": parent_conn, "job": None, "started": 0.0}
+
+    def exit_status(self, worker):
+        """How a crashed worker ended, read after reaping it (exitcode is None until then)."""
+        process = worker["process"]
+        process.join(timeout=REAP_TIMEOUT)
+        code = process.exitcode
+        if code is None:
+            return "worker closed its pipe but did not exit"
+        if code < 0:
+            try:
+                return f"worker killed by signal {signal.Signals(-code).name}"
+            except ValueError:
+                return f"worker killed by signal {-code}"
+        return f"worker exited with code {code}"
+
+    def retire(self, worker):
+        worker["process"].kill()
+        worker["process"].join()
+        worker["conn"].close()
+
+    def run(self, jobs):
+        """Extract `jobs` ((job_id, filepath, extractor, sha256) tuples).
+        
+        Yields (job_id, entry, failure) as files finish, where failure is
+        None or a (reason, detail) tuple with reason "timeout", "memory",
+        "crash" or "error".
+        """
+        pending = list(reversed(list(jobs)))
+        pool = [self.spawn() for _ in range(min(self.workers, len(pending)))]
+        try:
+            while pending or any(w["job"] for w in pool):
+                for worker in pool:
+                    if worker["job"] is None and pending:
+                        job_id, filepath, extractor, sha256 = pending.pop()
+                        worker["conn"].send((job_id, str(filepath), extractor, self.cache_dir, sha256))
+                        worker["job"] = job_id
+                        worker["started"] = time.monotonic()
+                
+                busy = [w for w in pool if w["job"] is not None]
+                ready = wait([w["conn"] for w in busy], timeout=WATCHDOG_INTERVAL)
+                
+                for i, worker in enumerate(pool):
+                    if worker["job"] is None:
+                        continue
+                    failure = None
+                    if worker["conn"] in ready:
+                        try:
+                            job_id, entry, failure = worker["conn"].recv()
+                            worker["job"] = None
+                            if failure and failure[0] == "memory":
+                                # The worker's heap may be in a bad state; start afresh
+                                self.retire(worker)
+                                pool[i] = self.spawn()
+                            yield job_id, entry, failure
+                            continue
+                        except (EOFError, OSError):
+                            failure = ("crash", self.exit_status(worker))
+                    else:
+                        elapsed = time.monotonic() - worker["started"]
+                        rss = process_rss(worker["process"].pid) if self.memory_limit else None
+                        if self.timeout and elapsed > self.timeout:
+                            failure = ("timeout", f"still running after {elapsed:.1f}s")
+                        elif rss and rss > self.memory_limit:
+                            failure = ("memory", f"resident memory reached {rss / 1024 / 1024:.0f} MB")
+                        elif not worker["process"].is_alive():
+                            failure = ("crash", self.exit_status(worker))
+                    if failure:
+                        job_id = worker["job"]
+                        self.retire(worker)
+                        pool[i] = self.spawn()
+                        yield job_id, None, failure
+        finally:
+            for worker in pool:
+                try:
+                    worker["conn"].send(None)
+                except OSError:
+                    pass
+                worker["process"].join(timeout=1)
+                if worker["process"].is_alive():
+                    worker["process"].kill()
+                worker["conn"].close()
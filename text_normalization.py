@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Normalisation and boilerplate stripping for extracted text.
+
+PDF text carries running headers and footers, page numbers, words hyphenated
+across line breaks and letterhead lines that many organisations' documents
+share. Left in, they use up the analysis scripts' character budgets and give
+TF-IDF noise to match on. The cleaning here is deliberately conservative:
+
+- Only lines at the top or bottom of a page (EDGE_LINES each) are candidates
+  for removal, and only on pages with more than 2 x EDGE_LINES lines; on
+  shorter pages every line would be an "edge" line. A candidate is dropped when, with digits ignored, it repeats
+  on at least REPEAT_PAGE_SHARE of a document's pages (running headers,
+  footers, "Page 3 of 12"). It is also dropped when it sits at a page edge in
+  at least BOILERPLATE_MIN_DOCS documents (shared letterhead and disclaimers),
+  or when it is only a page number.
+- Words hyphenated across a line break are joined when the next line starts
+  in lower case (including PDFium's U+FFFE line-break hyphen marker), and
+  soft hyphens are removed.
+- Runs of spaces are collapsed, line ends stripped and blank lines limited
+  to one.
+
+extract_texts.py stores both the raw and the cleaned text.
+"""
+
+import re
+from collections import Counter
+
+EDGE_LINES = 3  # Lines at the top and at the bottom of each page considered for removal
+REPEAT_PAGE_SHARE = 0.5  # Share of a document's pages a line must repeat on to be a header/footer
+MIN_REPEAT_PAGES = 3  # ...and never fewer pages than this
+BOILERPLATE_MIN_DOCS = 5  # Documents an edge line must appear in to be shared boilerplate
+MAX_BOILERPLATE_LINE = 150  # Longer lines are content, however often they repeat
+
+PAGE_NUMBER = re.compile(
+    r'^(?:-\s*)?(?:(?:page|seite|pagina|página|strona|sivu|sida|side|str\.?|p\.?)\s*)?'
+    r'\d{1,4}(?:\s*(?:/|of|von|de|di|sur|z|av|af)\s*\d{1,4})?(?:\s*-)?$',
+    re.IGNORECASE,
+)
+HYPHEN_BREAK = re.compile(r'(\w)[-\u2010]\n[ \t]*(\w)')
+PDFIUM_HYPHEN_BREAK = re.compile('\ufffe\n?')  # PDFium's marker for a hyphen at a line break
+DIGITS = re.compile(r'\d+')
+SPACES = re.compile(r'[ \t\u00a0\u2000-\u200b\u202f\u3000]+')
+
+def line_key(line):
+    """Compare lines ignoring case, spacing and numbers (so "Page 3" matches "Page 4")."""
+    return DIGITS.sub('#', SPACES.sub(' ', line).strip().lower())
+
+def edge_lines(page):
+    """The non-empty lines at the top and bottom of a page, as (index, line) pairs.
+
+    Pages with no more than 2 x EDGE_LINES lines have no edge lines: all of
+    their lines are content.
+    """
+    lines = [(i, line) for i, line in enumerate(page.split('\n')) if line.strip()]
+    if len(lines) <= 2 * EDGE_LINES:
+        return []
+    return lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+
+def edge_keys(pages):
+    """Keys of the short edge lines of each page of one document."""
+    return [
+        {line_key(line) for _, line in edge_lines(page) if len(line.strip()) <= MAX_BOILERPLATE_LINE}
+        for page in pages
+    ]
+
+def repeated_edge_keys(page_keys):
+    """Edge-line keys that recur on enough of one document's pages to be headers or footers."""
+    if len(page_keys) < MIN_REPEAT_PAGES:
+        return set()
+    counts = Counter(key for keys in page_keys for key in keys)
+    threshold = max(MIN_REPEAT_PAGES, REPEAT_PAGE_SHARE * len(page_keys))
+    return {key for key, count in counts.items() if count >= threshold}
+
+def shared_boilerplate(documents):
+    """Edge-line keys found in at least BOILERPLATE_MIN_DOCS documents.
+
+    `documents` is an iterable of page lists, one per distinct document.
+    """
+    counts = Counter()
+    for pages in documents:
+        counts.update(set().union(*edge_keys(pages)) if pages else set())
+    return {key for key, count in counts.items() if count >= BOILERPLATE_MIN_DOCS}
+
+def dehyphenate(text):
+    """Join words split across line breaks when the continuation is lower case."""
+    text = text.replace('\u00ad', '')  # Soft hyphens
+    text = PDFIUM_HYPHEN_BREAK.sub('-\n', text)
+    return HYPHEN_BREAK.sub(lambda m: m.group(1) + m.group(2) if m.group(2).islower() else m.group(0), text)
+
+def normalize_whitespace(text):
+    """Collapse runs of spaces, strip line ends and keep at most one blank line in a row."""
+    lines = [SPACES.sub(' ', line).strip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+def clean_pages(pages, boilerplate=frozenset()):
+    """Clean one document's pages; returns the cleaned text.
+
+    `boilerplate` holds keys from shared_boilerplate() to strip as well as
+    the document's own repeated headers and footers.
+    """
+    page_keys = edge_keys(pages)
+    strip = repeated_edge_keys(page_keys) | set(boilerplate)
+    cleaned = []
+    for page in pages:
+        lines = page.split('\n')
+        for i, line in edge_lines(page):
+            key = line_key(line)
+            if key in strip or PAGE_NUMBER.match(line.strip()):
+                lines[i] = ''
+        cleaned.append('\n'.join(lines))
+    return normalize_whitespace(dehyphenate('\n'.join(cleaned)))
+
+def clean_text(text):
+    """Clean free text that has no pages (feedback bodies): hyphenation and whitespace only."""
+    return normalize_whitespace(dehyphenate(text))
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Extracted texts as JSONL with a sidecar offset index.
+
+extract_texts.py writes one record per line to extracted_texts.jsonl and an
+index (extracted_texts.idx.json) with each record's feedback ID, byte offset,
+byte length and text length. Consumers can then stream the records, or seek
+straight to one feedback ID, without loading the whole corpus. The old
+extracted_texts.json array is still written as a compatibility export, and is
+read as a fallback when no JSONL exists yet.
+
+Page-level records (one row per attachment page, plus one for the feedback
+text) go to a columnar file next to it: extracted_pages.parquet when pyarrow
+is installed, otherwise extracted_pages.json.gz holding one list per column.
+Each row carries the feedback ID, file, page number, the page's character
+offsets into the record's raw_text (the uncleaned combined text), the page
+text and its hash, its detected language, and any table cells the extractor
+found.
+
+iter_feedbacks() streams the extraction inputs: full feedback bodies from the
+downloader's feedbacks_raw.jsonl, rather than feedbacks.csv, whose
+feedback_text column is cut at 1000 characters.
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from language_id import detect_language
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+TEXTS_JSONL_NAME = "extracted_texts.jsonl"
+TEXTS_INDEX_NAME = "extracted_texts.idx.json"
+TEXTS_JSON_NAME = "extracted_texts.json"  # Compatibility export
+FEEDBACKS_JSONL_NAME = "feedbacks_raw.jsonl"
+FEEDBACKS_JSON_NAME = "feedbacks_raw.json"  # Older downloader runs
+FEEDBACKS_CSV_NAME = "feedbacks.csv"  # Lossy: feedback_text is truncated
+INDEX_VERSION = 2
+
+PAGES_PARQUET_NAME = "extracted_pages.parquet"
+PAGES_JSON_NAME = "extracted_pages.json.gz"  # Columnar fallback without pyarrow
+PAGES_VERSION = 1
+PAGE_COLUMNS = ["feedback_id", "file", "file_type", "sha256", "page", "char_start", "char_end",
+                "text", "text_hash", "language", "language_confidence", "tables"]
+
+def feedbacks_source(data_dir):
+    """The file iter_feedbacks() will read: the raw JSONL, the raw JSON, else the CSV; None if none exist."""
+    for name in (FEEDBACKS_JSONL_NAME, FEEDBACKS_JSON_NAME, FEEDBACKS_CSV_NAME):
+        path = Path(data_dir) / name
+        if path.exists():
+            return path
+    return None
+
+def feedback_fields(fb):
+    """A raw API feedback as the fields extraction uses (feedbacks.csv names, full text)."""
+    return {
+        "id": str(fb.get("id", "")),
+        "organization": fb.get("organization") or "",
+        "country": fb.get("country") or "",
+        "userType": fb.get("userType") or "",
+        "firstName": fb.get("firstName") or "",
+        "surname": fb.get("surname") or "",
+        "language": fb.get("language") or "",
+        "date": fb.get("dateFeedback") or "",
+        "feedback_text": fb.get("feedback") or "",
+    }
+
+def iter_feedbacks(data_dir):
+    """Stream feedbacks in download order, one dict per feedback (see feedback_fields)."""
+    path = feedbacks_source(data_dir)
+    if path is None:
+        raise FileNotFoundError(f"No {FEEDBACKS_JSONL_NAME} or {FEEDBACKS_CSV_NAME} in {data_dir}")
+    if path.name == FEEDBACKS_JSONL_NAME:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield feedback_fields(json.loads(line))
+    elif path.name == FEEDBACKS_JSON_NAME:
+        with open(path, 'r', encoding='utf-8') as f:
+            for fb in json.load(f):
+                yield feedback_fields(fb)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield dict(row, id=str(row.get("id", "")))
+
+class TextStoreWriter:
+    """Append extracted-text records to a JSONL file while building its index.
+
+    Records go to a .partial file that close() moves into place together with
+    the index, so readers never see a half-written store.
+    """
+
+    def __init__(self, data_dir):
+        self.jsonl_path = Path(data_dir) / TEXTS_JSONL_NAME
+        self.index_path = Path(data_dir) / TEXTS_INDEX_NAME
+        self.partial_path = self.jsonl_path.with_name(self.jsonl_path.name + ".partial")
+        self.file = open(self.partial_path, 'wb')
+        self.entries = []
+
+    def write(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self.entries.append(index_entry(record, self.file.tell(), len(line)))
+        self.file.write(line)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.partial_path, self.jsonl_path)
+        write_index(self.jsonl_path, self.index_path, self.entries)
+
+def index_entry(record, offset, length):
+    return [str(record["id"]), offset, length, len(record.get("text", "")), record.get("detected_language", "")]
+
+def write_index(jsonl_path, index_path, entries):
+    """Write the offset index, stamped with the JSONL's size and mtime to detect staleness."""
+    stat = os.stat(jsonl_path)
+    index = {
+        "version": INDEX_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "entries": entries,  # [feedback_id, offset, length, text_length, language] in file order
+    }
+    temp_path = Path(index_path).with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, index_path)
+
+def build_index(jsonl_path, index_path):
+    """Scan a JSONL file once to (re)build its index; returns the entries."""
+    entries = []
+    with open(jsonl_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                entries.append(index_entry(json.loads(line), offset, len(line)))
+            offset += len(line)
+    write_index(jsonl_path, index_path, entries)
+    return entries
+
+class TextStore:
+    """Read-only access to extracted texts: streaming, by ID, or filtered by text length.
+
+    Only the index is loaded up front; record bodies are read on demand.
+    Falls back to loading extracted_texts.json when there is no JSONL.
+    """
+
+    def __init__(self, data_dir):
+        data_dir = Path(data_dir)
+        self.jsonl_path = data_dir / TEXTS_JSONL_NAME
+        self.index_path = data_dir / TEXTS_INDEX_NAME
+        self.json_path = data_dir / TEXTS_JSON_NAME
+        self.legacy = None
+
+        if self.jsonl_path.exists():
+            self.entries = self.load_index()
+        elif self.json_path.exists():
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                self.legacy = {str(item["id"]): item for item in json.load(f)}
+            self.entries = [index_entry(item, None, None) for item in self.legacy.values()]
+        else:
+            raise FileNotFoundError(f"No {TEXTS_JSONL_NAME} or {TEXTS_JSON_NAME} in {data_dir}")
+        self.by_id = {entry[0]: entry for entry in self.entries}
+
+    def load_index(self):
+        """Load the index, rebuilding it if missing or out of date."""
+        stat = os.stat(self.jsonl_path)
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if (index.get("version") == INDEX_VERSION and index.get("size") == stat.st_size
+                    and index.get("mtime_ns") == stat.st_mtime_ns):
+                return index["entries"]
+        return build_index(self.jsonl_path, self.index_path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, fid):
+        return str(fid) in self.by_id
+
+    def ids(self, min_text_length=0, language=None):
+        """Feedback IDs in file order, optionally only those with more text than `min_text_length`
+        and in a detected `language` (a code or a collection of codes)."""
+        languages = {language} if isinstance(language, str) else language
+        return [
+            entry[0] for entry in self.entries
+            if entry[3] > min_text_length and (languages is None or entry[4] in languages)
+        ]
+
+    def language(self, fid):
+        """The detected language of a record ("" if extraction predates language detection)."""
+        return self.by_id[str(fid)][4]
+
+    def text_length(self, fid):
+        return self.by_id[str(fid)][3]
+
+    def get(self, fid, default=None):
+        """Read one record by feedback ID with a single seek."""
+        entry = self.by_id.get(str(fid))
+        if entry is None:
+            return default
+        if self.legacy is not None:
+            return self.legacy[entry[0]]
+        with open(self.jsonl_path, 'rb') as f:
+            f.seek(entry[1])
+            return json.loads(f.read(entry[2]))
+
+    def __iter__(self):
+        """Stream every record in file order."""
+        if self.legacy is not None:
+            yield from self.legacy.values()
+            return
+        with open(self.jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def export_json(data_dir):
+    """Write extracted_texts.json from the JSONL, streamed, in the format json.dump(indent=2) gives."""
+    data_dir = Path(data_dir)
+    store = TextStore(data_dir)
+    path = data_dir / TEXTS_JSON_NAME
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for i, record in enumerate(store):
+            body = json.dumps(record, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            f.write(("," if i else "") + "\n  " + body)
+        f.write("\n]" if len(store) else "]")
+    os.replace(temp_path, path)
+    return path
+
+def entry_pages(entry):
+    """Split an extraction cache entry's text back into its pages using page_offsets."""
+    text = entry["text"]
+    offsets = entry.get("page_offsets") or [0]
+    return [
+        text[start:offsets[i + 1] if i + 1 < len(offsets) else len(text)].rstrip("\n")
+        for i, start in enumerate(offsets)
+    ]
+
+class PageStoreWriter:
+    """Collect page-level records column by column and write them in one go."""
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self.columns = {name: [] for name in PAGE_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["page"])
+
+    def add_page(self, feedback_id, file, file_type, sha256, page, char_start, text, tables=None):
+        """Append one page; `char_start` is its offset into the record's raw_text."""
+        language, confidence = detect_language(text)
+        for name, value in (
+            ("feedback_id", str(feedback_id)), ("file", file), ("file_type", file_type or ""),
+            ("sha256", sha256 or ""), ("page", page), ("char_start", char_start),
+            ("char_end", char_start + len(text)), ("text", text),
+            ("text_hash", hashlib.sha1(text.encode("utf-8")).hexdigest()),
+            ("language", language), ("language_confidence", confidence),
+            ("tables", json.dumps(tables, ensure_ascii=False) if tables else ""),
+        ):
+            self.columns[name].append(value)
+
+    def add_entry(self, feedback_id, file, file_type, entry, char_start):
+        """Append every page of an extraction cache entry whose text starts at `char_start`."""
+        offsets = entry.get("page_offsets") or [0]
+        tables = entry.get("page_tables") or []
+        for i, (start, page_text) in enumerate(zip(offsets, entry_pages(entry))):
+            page_tables = tables[i] if i < len(tables) else None
+            if page_text or page_tables:
+                self.add_page(feedback_id, file, file_type, entry.get("sha256"), i + 1,
+                              char_start + start, page_text, page_tables)
+
+    def close(self):
+        """Write the columns (parquet if possible) and remove the store in the other format."""
+        if pyarrow:
+            path, stale = self.data_dir / PAGES_PARQUET_NAME, self.data_dir / PAGES_JSON_NAME
+            temp_path = path.with_name(path.name + ".tmp")
+            pyarrow.parquet.write_table(pyarrow.table(self.columns), temp_path, compression="zstd")
+        else:
+            path, stale = self.data_dir / PAGES_JSON_NAME, self.data_dir / PAGES_PARQUET_NAME
+            temp_path = path.with_name(path.name + ".tmp")
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump({"version": PAGES_VERSION, "columns": self.columns}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        if stale.exists():
+            stale.unlink()
+        return path
+
+def load_pages(data_dir, columns=None):
+    """Load page records as a dict of column lists; `columns` limits which are read.
+
+    Table cells come back as JSON strings ("" when a page has none).
+    """
+    data_dir = Path(data_dir)
+    columns = columns or PAGE_COLUMNS
+    if (data_dir / PAGES_PARQUET_NAME).exists():
+        if not pyarrow:
+            raise ImportError(f"pyarrow is needed to read {PAGES_PARQUET_NAME}")
+        table = pyarrow.parquet.read_table(data_dir / PAGES_PARQUET_NAME, columns=columns)
+        return table.to_pydict()
+    with gzip.open(data_dir / PAGES_JSON_NAME, 'rt', encoding='utf-8') as f:
+        stored = json.load(f)["columns"]
+    return {name: stored[name] for name in columns}